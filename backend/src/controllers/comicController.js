@@ -295,7 +295,7 @@ exports.generateAudio = async (req, res) => {
  */
 exports.detectBubblesMultiple = async (req, res) => {
   try {
-    const { cropData } = req.body; // Nhận dữ liệu crop từ frontend
+    const { cropData, engine } = req.body; // Nhận dữ liệu crop từ frontend (engine: 'yolo' | 'classical', tùy chọn)
 
     if (!cropData || !Array.isArray(cropData)) {
       return res.status(400).json({ error: 'Thiếu dữ liệu cropData' });
@@ -318,7 +318,7 @@ exports.detectBubblesMultiple = async (req, res) => {
     let stdout = '';
     let stderr = '';
 
-    py.stdin.write(JSON.stringify({ filesData }));
+    py.stdin.write(JSON.stringify({ engine, filesData }));
     py.stdin.end();
 
     py.stdout.on('data', (data) => stdout += data.toString());
@@ -419,34 +419,37 @@ class TextDetectionController {
             
             console.log(`[TextDetectionController] Batch text detection for ${imageUrls.length} images`);
             
-            const results = [];
-            
-            for (const imageUrl of imageUrls) {
+            const results = new Array(imageUrls.length);
+            const downloaded = [];
+
+            for (const [index, imageUrl] of imageUrls.entries()) {
                 try {
                     const imagePath = await this.downloadImageFromUrl(imageUrl);
-                    const result = await textDetectionService.detectTextInComic(imagePath);
-                    
-                    // Cleanup downloaded file
-                    try {
-                        fs.unlinkSync(imagePath);
-                    } catch (cleanupError) {
-                        console.warn(`[TextDetectionController] Failed to cleanup downloaded file: ${cleanupError.message}`);
-                    }
-                    
-                    results.push({
-                        imageUrl,
-                        ...result
-                    });
-                    
+                    downloaded.push({ index, imageUrl, imagePath });
                 } catch (error) {
-                    results.push({
+                    results[index] = {
                         imageUrl,
                         success: false,
                         error: error.message,
                         data: null
-                    });
+                    };
                 }
             }
+
+            // Một process Python cho cả batch, OCR được gom theo batch bên trong
+            const batchResults = await textDetectionService.batchDetectText(downloaded.map(d => d.imagePath));
+
+            downloaded.forEach(({ index, imageUrl, imagePath }, i) => {
+                const { imagePath: _ignored, ...result } = batchResults[i] || { success: false, error: 'Thiếu kết quả', data: null };
+                results[index] = { imageUrl, ...result };
+
+                // Cleanup downloaded file
+                try {
+                    fs.unlinkSync(imagePath);
+                } catch (cleanupError) {
+                    console.warn(`[TextDetectionController] Failed to cleanup downloaded file: ${cleanupError.message}`);
+                }
+            });
             
             res.json({
                 success: true,
@@ -0,0 +1,200 @@
+"""
+Benchmark các chế độ inpaint của panel_inpainter.py trên một bộ ảnh local:
+  - full        : LaMa trên cả panel (cách cũ, làm mốc)
+  - roi         : chỉ các crop quanh mask (inpaint_regions.py)
+  - full@N/roi@N: như trên nhưng LaMa chạy ở cạnh dài tối đa N (maxWorkingSize), fill được ghép trong mask đã feather
+  - auto        : roi + fillMode "auto" (vùng trên nền phẳng tô cổ điển bằng classical_fill.py, còn lại qua LaMa)
+
+Mask bong bóng lấy từ YOLO nếu có model finetune (get_bubble_mask_yolo), không thì từ engine classical
+(bubble_classical.py). In ra thời gian, % thời gian tiết kiệm so với full, PSNR ngoài mask so với ảnh gốc
+(phải tuyệt đối bằng nhau) và PSNR trong mask so với output của full (độ lệch của phần fill so với mốc).
+
+`--chapter N`: thay vào đó đo throughput cho một chapter N panel (panel cắt từ các ảnh bằng panel_detector,
+lặp lại cho đủ N): vòng lặp từng panel / từng crop qua SimpleLama (cách cũ) so với batch LaMa
+(lama_inpaint_batch) với các batch size của `--batch-sizes`, và batch LaMa với fillMode "auto".
+
+`--incremental`: đo cache theo vùng (region_cache.py): chạy lần đầu (cache trống), chạy lại y hệt, rồi thêm một
+bong bóng (mask = mọi bong bóng) so với chạy lại không cache và với chi phí inpaint riêng bong bóng đó.
+
+Usage:
+    python bench_inpaint.py [ảnh ...] [--max-sizes 512 768] [--repeat 1]
+    python bench_inpaint.py [ảnh ...] --chapter 30 [--batch-sizes 1 4 8]
+    python bench_inpaint.py [ảnh ...] --incremental
+    LAMA_MODEL=/path/big-lama.pt python bench_inpaint.py pages/*.jpg
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import cv2
+import numpy as np
+
+import panel_inpainter as inpainter
+from classical_fill import METHODS
+from disk_cache import DiskCache
+from inpaint_regions import inpaint_regions, inpaint_many_regions
+from mask_compose import compose_mask
+from panel_detector import detect_panels
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def psnr(a, b):
+    if a.size == 0:
+        return None
+    mse = np.mean((a.astype(np.float64) - b.astype(np.float64)) ** 2)
+    return float('inf') if mse == 0 else 10 * np.log10(255 ** 2 / mse)
+
+
+def build_mask(image, seg_model):
+    return inpainter.get_bubble_mask_yolo(image, seg_model)
+
+
+def chapter_panels(paths, count):
+    panels = []
+    for path in paths:
+        image = cv2.imread(path)
+        if image is None:
+            continue
+        boxes = detect_panels(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)) or [(0, 0, image.shape[1], image.shape[0])]
+        panels += [image[y:y + h, x:x + w] for x, y, w, h in boxes]
+    return [panels[i % len(panels)] for i in range(count)] if panels else []
+
+
+def bench_chapter(args, lama, seg_model):
+    panels = chapter_panels(args.images, args.chapter)
+    if not panels:
+        print("Không có panel nào")
+        return 1
+    jobs = [{"image": panel, "mask": build_mask(panel, seg_model), "mode": 'roi', "fillMode": 'lama'} for panel in panels]
+    print(f"Chapter {len(jobs)} panel, tổng {sum(p.shape[0] * p.shape[1] for p in panels) / 1e6:.1f} MP")
+
+    start = time.perf_counter()
+    reference = [inpaint_regions(job["image"], job["mask"], lambda img, mask: inpainter.lama_inpaint(lama, img, mask),
+                                 fill_mode='lama')
+                 for job in jobs]
+    loop_seconds = time.perf_counter() - start
+    regions = sum(stats["regions"] for _, stats in reference)
+    print(f"  loop       {loop_seconds:8.2f} s  {len(jobs) / loop_seconds:6.2f} panel/s  ({regions} crop)")
+
+    for batch_size in args.batch_sizes:
+        start = time.perf_counter()
+        outputs = inpaint_many_regions(jobs, lambda pairs: inpainter.lama_inpaint_batch(lama, pairs, batch_size))
+        seconds = time.perf_counter() - start
+        diff = max(int(np.abs(a.astype(np.int16) - b.astype(np.int16)).max()) for (a, _), (b, _) in zip(outputs, reference))
+        print(f"  batch {batch_size:<4} {seconds:8.2f} s  {len(jobs) / seconds:6.2f} panel/s  "
+              f"x{loop_seconds / seconds:4.2f}  lệch tối đa so với loop: {diff}")
+
+    batch_size = args.batch_sizes[0]
+    start = time.perf_counter()
+    outputs = inpaint_many_regions([dict(job, fillMode='auto') for job in jobs],
+                                   lambda pairs: inpainter.lama_inpaint_batch(lama, pairs, batch_size))
+    seconds = time.perf_counter() - start
+    methods = {m: sum(stats["methods"][m] for _, stats in outputs) for m in METHODS}
+    regions = sum(stats["regions"] for _, stats in outputs)
+    print(f"  auto {batch_size:<5} {seconds:8.2f} s  {len(jobs) / seconds:6.2f} panel/s  "
+          f"x{loop_seconds / seconds:4.2f}  ({regions} crop LaMa, {methods})")
+    return 0
+
+
+def bench_incremental(args, lama, seg_model):
+    inpaint_fn = lambda img, mask: inpainter.lama_inpaint(lama, img, mask)
+    for path in args.images:
+        image = cv2.imread(path)
+        if image is None:
+            print(f"Bỏ qua {path}: không đọc được ảnh")
+            continue
+        instances = inpainter.bubble_instances_yolo(image, seg_model)
+        if len(instances) < 2:
+            print(f"Bỏ qua {path}: cần ít nhất 2 bong bóng")
+            continue
+        before = compose_mask(image.shape, instances[:-1])
+        after = compose_mask(image.shape, instances)
+        print(f"\n{os.path.basename(path)} {image.shape[1]}x{image.shape[0]}, {len(instances)} bong bóng")
+        with tempfile.TemporaryDirectory() as directory:
+            cache = DiskCache(directory, version='bench')
+            runs = [("lần đầu (cache trống)", before, cache), ("chạy lại y hệt", before, cache),
+                    ("thêm 1 bong bóng", after, cache), ("thêm 1 bong bóng, không cache", after, None),
+                    ("chỉ bong bóng mới", compose_mask(image.shape, instances[-1:]), None)]
+            outputs = []
+            for name, mask, run_cache in runs:
+                start = time.perf_counter()
+                result, stats = inpaint_regions(image, mask, inpaint_fn, fill_mode='lama', cache=run_cache)
+                seconds = time.perf_counter() - start
+                outputs.append(result)
+                inside = mask > 0
+                print(f"  {name:<32} {seconds * 1000:8.0f} ms  crop {stats['regions']:>2}  "
+                      f"cache {stats.get('regionCache')}  ngoài mask: "
+                      f"{'exact' if np.array_equal(result[~inside], image[~inside]) else 'SAI LỆCH'}")
+            same = np.array_equal(outputs[0], outputs[1])
+            print(f"  chạy lại y hệt trùng kết quả lần đầu: {same}, PSNR thêm bong bóng (cache vs không cache) "
+                  f"trong mask: {psnr(outputs[2][after > 0], outputs[3][after > 0]):.2f} dB")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('images', nargs='*', default=[os.path.join(CURRENT_DIR, 'test.jpg')])
+    parser.add_argument('--max-sizes', type=int, nargs='+', default=[512, 768])
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--chapter', type=int, default=0)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--incremental', action='store_true')
+    args = parser.parse_args()
+
+    lama = inpainter.load_lama()
+    seg_model = inpainter.load_segmentation()
+    if args.chapter:
+        return bench_chapter(args, lama, seg_model)
+    if args.incremental:
+        return bench_incremental(args, lama, seg_model)
+    inpaint_fn = lambda img, mask: inpainter.lama_inpaint(lama, img, mask)
+
+    modes = [('full', 'full', 0, 'lama'), ('roi', 'roi', 0, 'lama')]
+    for size in args.max_sizes:
+        modes += [(f'full@{size}', 'full', size, 'lama'), (f'roi@{size}', 'roi', size, 'lama')]
+    modes.append(('auto', 'roi', 0, 'auto'))
+    totals = {name: 0.0 for name, _, _, _ in modes}
+
+    for path in args.images:
+        image = cv2.imread(path)
+        if image is None:
+            print(f"Bỏ qua {path}: không đọc được ảnh")
+            continue
+        mask = build_mask(image, seg_model)
+        inside = mask > 0
+        print(f"\n{os.path.basename(path)} {image.shape[1]}x{image.shape[0]}, mask {inside.mean():.1%}")
+        reference = None
+        for name, mode, size, fill_mode in modes:
+            elapsed = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                result, stats = inpaint_regions(image, mask, inpaint_fn, mode=mode, max_working_size=size,
+                                                fill_mode=fill_mode)
+                elapsed.append(time.perf_counter() - start)
+            seconds = min(elapsed)
+            totals[name] += seconds
+            if reference is None:
+                reference = result
+            outside_exact = np.array_equal(result[~inside], image[~inside])
+            inside_psnr = psnr(result[inside], reference[inside])
+            print(f"  {name:<10} {seconds * 1000:8.0f} ms  regions {stats['regions']:>2} "
+                  f"(downscaled {stats['downscaledRegions']})  pixels {stats['inpaintPixels'] / stats['imagePixels']:6.1%}  "
+                  f"ngoài mask: {'exact' if outside_exact else 'SAI LỆCH'}  "
+                  f"PSNR trong mask vs full: {inside_psnr if inside_psnr is None else round(inside_psnr, 2)} dB"
+                  + (f"  {stats['methods']}" if 'methods' in stats else ''))
+            if not outside_exact:
+                return 1
+
+    base = totals['full']
+    print("\nTổng:")
+    for name, _, _, _ in modes:
+        saved = (1 - totals[name] / base) if base > 0 else 0.0
+        print(f"  {name:<10} {totals[name]:8.2f} s  tiết kiệm {saved:6.1%}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
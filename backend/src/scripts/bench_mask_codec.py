@@ -0,0 +1,113 @@
+"""
+So sánh format truyền mask / polygon hiện tại với format gọn của mask_codec.py:
+  - textBlocks vertices [{"x", "y"}, ...]   vs  chuỗi polygon delta
+  - bubble points [[x, y], ...] (convex hull) vs  chuỗi polygon delta
+  - mask bong bóng PNG base64 (maskBase64)  vs  RLE COCO nén (maskRle)
+
+Dữ liệu giả lập: panel webtoon có vài bong bóng hình elip. In ra kích thước JSON và thời gian
+encode / decode, đồng thời kiểm tra round-trip chính xác.
+
+Usage:
+    python bench_mask_codec.py [--panels 200] [--width 690] [--height 1500] [--seed 0]
+"""
+import sys
+import json
+import time
+import base64
+import argparse
+
+import cv2
+import numpy as np
+
+from mask_codec import encode_polygons, decode_polygons, encode_rle, decode_rle
+
+
+def make_panels(count, width, height, rng):
+    panels = []
+    for _ in range(count):
+        masks, hulls, vertices = [], [], []
+        for _ in range(int(rng.integers(1, 5))):
+            mask = np.zeros((height, width), dtype=np.uint8)
+            center = (int(rng.integers(80, width - 80)), int(rng.integers(80, height - 80)))
+            axes = (int(rng.integers(40, 160)), int(rng.integers(30, 110)))
+            cv2.ellipse(mask, center, axes, float(rng.integers(0, 180)), 0, 360, 1, -1)
+            masks.append(mask)
+            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            hulls.append(cv2.convexHull(contours[0]).reshape(-1, 2))
+            x, y = int(rng.integers(0, width - 200)), int(rng.integers(0, height - 60))
+            bw, bh = int(rng.integers(40, 200)), int(rng.integers(15, 60))
+            vertices.append([{"x": x, "y": y}, {"x": x + bw, "y": y}, {"x": x + bw, "y": y + bh}, {"x": x, "y": y + bh}])
+        panels.append({"masks": masks, "hulls": hulls, "vertices": vertices})
+    return panels
+
+
+def timed(fn, items):
+    start = time.perf_counter()
+    out = [fn(item) for item in items]
+    return out, (time.perf_counter() - start) * 1000
+
+
+def timed_once(fn, *args):
+    start = time.perf_counter()
+    out = fn(*args)
+    return out, (time.perf_counter() - start) * 1000
+
+
+def png_base64(mask):
+    _, buffer = cv2.imencode('.png', mask * 255)
+    return base64.b64encode(buffer).decode('ascii')
+
+
+def png_decode(text):
+    return (cv2.imdecode(np.frombuffer(base64.b64decode(text), np.uint8), cv2.IMREAD_GRAYSCALE) > 127).astype(np.uint8)
+
+
+def report(name, old_payload, new_payload, old_ms, new_ms, old_decode_ms, new_decode_ms):
+    old_size = len(json.dumps(old_payload, separators=(',', ':')))
+    new_size = len(json.dumps(new_payload, separators=(',', ':')))
+    print(f"{name:<10} size {old_size:>10} -> {new_size:>10} bytes ({new_size / max(old_size, 1):6.1%})   "
+          f"encode {old_ms:8.1f} -> {new_ms:8.1f} ms   decode {old_decode_ms:8.1f} -> {new_decode_ms:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--panels', type=int, default=200)
+    parser.add_argument('--width', type=int, default=690)
+    parser.add_argument('--height', type=int, default=1500)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    panels = make_panels(args.panels, args.width, args.height, np.random.default_rng(args.seed))
+    vertices = [v for p in panels for v in p["vertices"]]
+    hulls = [h for p in panels for h in p["hulls"]]
+    masks = [m for p in panels for m in p["masks"]]
+    print(f"{args.panels} panel {args.width}x{args.height}: {len(vertices)} textBlocks, {len(hulls)} bubbles")
+
+    # textBlocks / bubble polygons: thời gian tính cả json.dumps / json.loads ở cả hai phía
+    old_json, old_ms = timed_once(json.dumps, vertices)
+    decoded, old_dec = timed_once(json.loads, old_json)
+    new_json, new_ms = timed_once(lambda: json.dumps(encode_polygons(
+        [[[v['x'], v['y']] for v in block] for block in vertices])))
+    decoded, new_dec = timed_once(lambda: [[{"x": x, "y": y} for x, y in p.tolist()]
+                                           for p in decode_polygons(json.loads(new_json))])
+    assert decoded == vertices, "vertices round-trip lỗi"
+    report('vertices', json.loads(old_json), json.loads(new_json), old_ms, new_ms, old_dec, new_dec)
+
+    old_json, old_ms = timed_once(lambda: json.dumps([h.tolist() for h in hulls]))
+    _, old_dec = timed_once(lambda: [np.asarray(p) for p in json.loads(old_json)])
+    new_json, new_ms = timed_once(lambda: json.dumps(encode_polygons(hulls)))
+    decoded, new_dec = timed_once(lambda: decode_polygons(json.loads(new_json)))
+    assert all(np.array_equal(a, b) for a, b in zip(decoded, hulls)), "polygon round-trip lỗi"
+    report('points', json.loads(old_json), json.loads(new_json), old_ms, new_ms, old_dec, new_dec)
+
+    # masks
+    old, old_ms = timed(png_base64, masks)
+    _, old_dec = timed(png_decode, old)
+    new, new_ms = timed(encode_rle, masks)
+    decoded, new_dec = timed(decode_rle, new)
+    assert all(np.array_equal(a, b) for a, b in zip(decoded, masks)), "RLE round-trip lỗi"
+    report('masks', old, new, old_ms, new_ms, old_dec, new_dec)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
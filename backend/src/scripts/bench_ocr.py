@@ -0,0 +1,101 @@
+"""
+So sánh độ trễ OCR mỗi trang: cách cũ (file tạm + spawn process mỗi lần gọi)
+với OCR bridge sống lâu (ocr_client.py).
+
+Usage:
+    python bench_ocr.py --stub [--pages 20] [--startup-ms 300] [--latency-ms 150]
+    python bench_ocr.py --credentials ../../truyenff-xxx.json --image test.jpg
+
+--stub dùng ocr_stub_server.py cho cả hai phía (không cần mạng / credentials),
+--startup-ms mô phỏng chi phí Node startup + tạo client Vision.
+"""
+import sys
+import os
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+from ocr_client import VisionBridgeClient
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def legacy_call(image_bytes, cmd_prefix, credentials_path):
+    """Tái hiện call_vision_api cũ: ghi file tạm rồi chạy một process cho mỗi ảnh."""
+    with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as temp_file:
+        temp_file.write(image_bytes)
+        temp_file_path = temp_file.name
+    try:
+        result = subprocess.run(cmd_prefix + [temp_file_path, credentials_path], capture_output=True,
+                                text=True, timeout=60, cwd=CURRENT_DIR, encoding='utf-8', errors='replace')
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr)
+        return json.loads(result.stdout)
+    finally:
+        os.unlink(temp_file_path)
+
+
+def summarize(samples_ms):
+    ordered = sorted(samples_ms)
+    return {
+        "meanMs": round(statistics.mean(ordered), 2),
+        "p50Ms": round(ordered[len(ordered) // 2], 2),
+        "p95Ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+    }
+
+
+def timed(fn, pages):
+    samples = []
+    for _ in range(pages):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark OCR: spawn mỗi trang vs bridge sống lâu")
+    parser.add_argument('--image', default=os.path.join(CURRENT_DIR, 'test.jpg'))
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--credentials', default='stub-credentials.json')
+    parser.add_argument('--stub', action='store_true', help="Dùng ocr_stub_server.py thay cho Vision API")
+    parser.add_argument('--startup-ms', type=float, default=300)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    args = parser.parse_args()
+
+    with open(args.image, 'rb') as f:
+        image_bytes = f.read()
+
+    if args.stub:
+        stub = [sys.executable, os.path.join(CURRENT_DIR, 'ocr_stub_server.py'),
+                '--startup-ms', str(args.startup_ms), '--latency-ms', str(args.latency_ms)]
+        legacy_cmd = stub + ['--once']
+        bridge_cmd = stub + [args.credentials]
+    else:
+        legacy_cmd = ['node', os.path.join(CURRENT_DIR, 'vision_text_detector.js')]
+        bridge_cmd = None
+
+    legacy = timed(lambda: legacy_call(image_bytes, legacy_cmd, args.credentials), args.pages)
+
+    client = VisionBridgeClient(args.credentials, command=bridge_cmd)
+    t0 = time.perf_counter()
+    client.start()
+    bridge_startup_ms = (time.perf_counter() - t0) * 1000
+    bridge = timed(lambda: client.annotate(image_bytes), args.pages)
+    client.close()
+
+    report = {
+        "pages": args.pages,
+        "imageBytes": len(image_bytes),
+        "legacySpawnPerPage": summarize(legacy),
+        "persistentBridge": {**summarize(bridge), "startupMs": round(bridge_startup_ms, 2)},
+        "speedup": round(statistics.mean(legacy) / max(statistics.mean(bridge), 1e-6), 1),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
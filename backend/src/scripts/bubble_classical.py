@@ -0,0 +1,140 @@
+"""
+Engine detect bong bóng thoại cổ điển (chỉ OpenCV + NumPy, chạy trên CPU, không cần ultralytics / model).
+
+Bong bóng thoại thường là vùng sáng gần như kín, có viền tối, hình elip / chữ nhật bo góc, bên trong có chữ:
+  1. Ảnh xám được thu nhỏ về cạnh dài WORK_SIZE, lấy vùng sáng (>= BRIGHT_THRESHOLD)
+  2. Lấp lỗ: vùng tối nhỏ không nối với mép ảnh (chữ bên trong bong bóng) được gộp vào vùng sáng bao quanh
+  3. connectedComponentsWithStats trên vùng sáng đã lấp lỗ, tính đặc trưng cho MỌI component cùng lúc
+     bằng np.bincount trên ảnh label (không lặp Python theo component):
+       - ellipse : diện tích / diện tích elip dựng từ moment bậc 2 (elip đặc = 1, hình rách nát << 1)
+       - border  : độ chênh sáng giữa phần trong và vành ngoài BORDER_WIDTH px (viền bong bóng)
+       - ink     : tỷ lệ chữ (lỗ đã lấp) trong component
+  4. Giữ component có điểm >= SCORE_THRESHOLD, bỏ vùng nền chạm nhiều mép panel hoặc quá lớn / quá nhỏ
+
+Output là (classes, masks) giống segmentation_from_result (class 1 = bong bóng, mask ở độ phân giải làm việc)
+để bubble_detector dựng polygon bằng đúng code của engine YOLO.
+"""
+from typing import Tuple
+
+import cv2
+import numpy as np
+
+BUBBLE_CLASS = 1
+# Cạnh dài của ảnh làm việc (giống imgsz của YOLO)
+WORK_SIZE = 640
+BRIGHT_THRESHOLD = 200
+BORDER_WIDTH = 3
+# Giới hạn diện tích component so với panel
+MIN_AREA_RATIO = 0.002
+MAX_AREA_RATIO = 0.5
+MIN_SIDE_PX = 12
+# Lỗ (vùng tối bị bao kín) lớn hơn tỷ lệ này của ảnh không phải chữ, không lấp
+MAX_HOLE_RATIO = 0.02
+# Component cách mép panel không quá tỷ lệ này được coi là chạm mép (crop panel thường dính viền khung)
+EDGE_MARGIN_RATIO = 0.01
+# Chuẩn hóa đặc trưng về [0, 1]
+FLAT_STD = 20.0
+BORDER_CONTRAST = 80.0
+MIN_INK_RATIO = 0.08
+# Trọng số và ngưỡng điểm
+WEIGHTS = {"ellipse": 0.3, "flat": 0.2, "border": 0.2, "ink": 0.3}
+SCORE_THRESHOLD = 0.8
+EDGE_PENALTY = 0.15
+
+
+def working_images(image_bgr: np.ndarray, work_size: int = WORK_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+    """-> (ảnh xám, ảnh "độ trắng" = min(B, G, R)) đã thu nhỏ về cạnh dài work_size"""
+    h, w = image_bgr.shape[:2]
+    scale = min(1.0, work_size / max(h, w))
+    if scale < 1.0:
+        image_bgr = cv2.resize(image_bgr, (max(1, int(round(w * scale))), max(1, int(round(h * scale)))),
+                               interpolation=cv2.INTER_AREA)
+    if image_bgr.ndim == 2:
+        return image_bgr, image_bgr
+    return cv2.cvtColor(image_bgr, cv2.COLOR_BGR2GRAY), image_bgr.min(axis=2)
+
+
+def fill_holes(bright: np.ndarray) -> np.ndarray:
+    """
+    Gộp các vùng tối nhỏ không chạm mép ảnh (chữ) vào vùng sáng bao quanh. Vùng tối lớn (cả một panel
+    nằm giữa lề trắng của trang) được giữ nguyên
+    """
+    count, dark_labels, stats, _ = cv2.connectedComponentsWithStats((bright == 0).astype(np.uint8), connectivity=4)
+    if count <= 1:
+        return bright
+    edge = np.concatenate((dark_labels[0], dark_labels[-1], dark_labels[:, 0], dark_labels[:, -1]))
+    keep_dark = stats[:, cv2.CC_STAT_AREA] > MAX_HOLE_RATIO * bright.size
+    keep_dark[edge] = True
+    keep_dark[0] = True  # label 0 = vùng sáng
+    return (bright | ~keep_dark[dark_labels]).astype(np.uint8)
+
+
+def score_components(gray: np.ndarray, bright: np.ndarray, filled: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """-> (ảnh label, điểm của từng label; label 0 (nền) và component bị loại có điểm 0)"""
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(filled, connectivity=4)
+    h, w = gray.shape
+    flat = labels.ravel()
+    area = stats[:, cv2.CC_STAT_AREA].astype(np.float64)
+    safe = np.maximum(area, 1)
+
+    # Moment bậc 2 của từng component -> elip tương đương (4 * pi * sqrt(det cov) với elip đặc)
+    ys, xs = np.indices((h, w), dtype=np.float64)
+    sx = np.bincount(flat, xs.ravel(), count)
+    sy = np.bincount(flat, ys.ravel(), count)
+    sxx = np.bincount(flat, (xs * xs).ravel(), count)
+    syy = np.bincount(flat, (ys * ys).ravel(), count)
+    sxy = np.bincount(flat, (xs * ys).ravel(), count)
+    cxx = sxx / safe - (sx / safe) ** 2 + 1 / 12
+    cyy = syy / safe - (sy / safe) ** 2 + 1 / 12
+    cxy = sxy / safe - (sx / safe) * (sy / safe)
+    ellipse_area = 4 * np.pi * np.sqrt(np.maximum(cxx * cyy - cxy ** 2, 1e-6))
+    ellipse = np.clip(1 - np.abs(1 - area / ellipse_area), 0, 1)
+
+    # Nền bên trong (pixel sáng): sáng đều, ít texture
+    bright_flat = bright.ravel().astype(np.float64)
+    g = gray.ravel().astype(np.float64)
+    paper_area = np.maximum(np.bincount(flat, bright_flat, count), 1)
+    paper_mean = np.bincount(flat, g * bright_flat, count) / paper_area
+    paper_std = np.sqrt(np.maximum(np.bincount(flat, g * g * bright_flat, count) / paper_area - paper_mean ** 2, 0))
+    flatness = np.clip(1 - paper_std / FLAT_STD, 0, 1)
+
+    # Vành ngoài: dilate ảnh label (label lớn thắng ở chỗ chồng lấn), chỉ lấy pixel nền
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * BORDER_WIDTH + 1, 2 * BORDER_WIDTH + 1))
+    ring_labels = cv2.dilate(labels.astype(np.float32), kernel).astype(np.int64)
+    ring = (labels == 0) & (ring_labels > 0)
+    ring_count = np.bincount(ring_labels[ring], minlength=count)
+    ring_sum = np.bincount(ring_labels[ring], gray[ring].astype(np.float64), count)
+    ring_mean = np.where(ring_count > 0, ring_sum / np.maximum(ring_count, 1), paper_mean)
+    border = np.clip((paper_mean - ring_mean) / BORDER_CONTRAST, 0, 1)
+
+    # Tỷ lệ chữ = phần đã lấp lỗ (tối) trong component; bong bóng thoại hầu như luôn có chữ
+    ink_ratio = np.bincount(flat, 1 - bright_flat, count) / safe
+    ink = np.clip(ink_ratio / MIN_INK_RATIO, 0, 1)
+
+    score = (WEIGHTS["ellipse"] * ellipse + WEIGHTS["flat"] * flatness
+             + WEIGHTS["border"] * border + WEIGHTS["ink"] * ink)
+
+    # Lọc cứng: kích thước, vùng nền chạm mép
+    left, top = stats[:, cv2.CC_STAT_LEFT], stats[:, cv2.CC_STAT_TOP]
+    right, bottom = left + stats[:, cv2.CC_STAT_WIDTH], top + stats[:, cv2.CC_STAT_HEIGHT]
+    mx, my = max(1, int(EDGE_MARGIN_RATIO * w)), max(1, int(EDGE_MARGIN_RATIO * h))
+    edges = (left <= mx).astype(int) + (top <= my) + (right >= w - mx) + (bottom >= h - my)
+    score = score - EDGE_PENALTY * (edges == 1)
+    valid = ((area >= MIN_AREA_RATIO * h * w) & (area <= MAX_AREA_RATIO * h * w) & (edges <= 1)
+             & (stats[:, cv2.CC_STAT_WIDTH] >= MIN_SIDE_PX) & (stats[:, cv2.CC_STAT_HEIGHT] >= MIN_SIDE_PX))
+    score = np.where(valid, score, 0.0)
+    score[0] = 0.0
+    return labels, score
+
+
+def classical_segmentation(image_bgr: np.ndarray, work_size: int = WORK_SIZE,
+                           score_threshold: float = SCORE_THRESHOLD) -> Tuple[np.ndarray, np.ndarray]:
+    """Panel BGR -> (classes (N,), masks nhị phân uint8 (N, mh, mw) ở độ phân giải làm việc)"""
+    gray, white = working_images(image_bgr, work_size)
+    bright = (white >= BRIGHT_THRESHOLD).astype(np.uint8)
+    labels, score = score_components(gray, bright, fill_holes(bright))
+    keep = np.flatnonzero(score >= score_threshold)
+    if len(keep) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros((0,) + gray.shape, dtype=np.uint8)
+    masks = (labels[None] == keep[:, None, None]).astype(np.uint8)
+    return np.full(len(keep), BUBBLE_CLASS, dtype=np.int64), masks
@@ -4,19 +4,67 @@ import cv2
 import numpy as np
 import base64
 import os
+import time
+
+from stream_io import iter_request, make_writer, request_is_empty
+from mask_codec import encode_polygons, encode_rle
+from seg_cache import (SEG_PREDICT_ARGS, MASK_THRESHOLD, get_seg_cache, seg_cache_key, load_segmentation,
+                       segmentation_from_result, encode_segmentation)
+from bubble_classical import classical_segmentation
 
 try:
     from ultralytics import YOLO
+    from ultralytics.data.augment import LetterBox
+    from ultralytics.models.yolo.segment import SegmentationPredictor
+    ULTRALYTICS_AVAILABLE = True
 except ImportError:
-    print(json.dumps({"error": "Thiếu thư viện ultralytics"})); sys.exit(1)
+    ULTRALYTICS_AVAILABLE = False
 
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
-MODEL_PATH = os.path.join(CURRENT_DIR, 'models', 'finetune_detect.pt')
+MODEL_PATH = os.environ.get('BUBBLE_MODEL_PATH') or os.path.join(CURRENT_DIR, 'models', 'finetune_detect.pt')
+# Engine: "yolo" (model finetune), "classical" (bubble_classical.py, chỉ cần OpenCV),
+# "auto" = yolo nếu có ultralytics và file model, ngược lại classical
+DEFAULT_ENGINE = os.environ.get('BUBBLE_ENGINE', 'auto')
+ENGINES = ('auto', 'yolo', 'classical')
+# Dùng chung với panel_inpainter để kết quả segmentation được cache và dùng lại giữa hai bước
+PREDICT_ARGS = SEG_PREDICT_ARGS
+IMG_SIZE = 640
+BATCH_SIZE = int(os.environ.get('BUBBLE_BATCH_SIZE', '8'))
+# Số panel đã decode tối đa giữ trong bộ nhớ trước khi segment (theo bội số batch size)
+WINDOW_BATCHES = int(os.environ.get('BUBBLE_WINDOW_BATCHES', '4'))
+# Sai số approxPolyDP (px trên panel), 0 = chỉ lấy convex hull
+POLYGON_TOLERANCE = float(os.environ.get('BUBBLE_POLYGON_TOLERANCE', '0'))
+
+if ULTRALYTICS_AVAILABLE:
+    class PanelBatchPredictor(SegmentationPredictor):
+        """
+        Khi các ảnh trong batch khác kích thước, ultralytics letterbox tất cả về hình vuông imgsz,
+        output sẽ lệch so với predict từng ảnh. Ở đây mỗi panel được letterbox như khi predict đơn lẻ
+        (auto=True, pad tới bội số stride); batch chỉ chứa các panel cùng kích thước sau letterbox.
+        """
+        def pre_transform(self, im):
+            letterbox = LetterBox(self.imgsz, auto=True, stride=self.model.stride)
+            return [letterbox(image=x) for x in im]
+
+def resolve_engine(name=None):
+    """Chọn engine thực tế. Không còn âm thầm dùng yolov8n-seg.pt (model COCO, không có class bong bóng)"""
+    name = (name or DEFAULT_ENGINE).lower()
+    if name not in ENGINES:
+        raise ValueError(f"Engine không hợp lệ: {name} (chọn một trong {', '.join(ENGINES)})")
+    if name == 'auto':
+        if ULTRALYTICS_AVAILABLE and os.path.exists(MODEL_PATH):
+            return 'yolo'
+        reason = "Thiếu thư viện ultralytics" if not ULTRALYTICS_AVAILABLE else f"Không tìm thấy {MODEL_PATH}"
+        sys.stderr.write(f"[PY][WARNING] {reason}. Dùng engine classical...\n")
+        return 'classical'
+    return name
 
 def load_model():
-    if os.path.exists(MODEL_PATH):
-        return YOLO(MODEL_PATH)
-    return YOLO("yolov8n-seg.pt")
+    if not ULTRALYTICS_AVAILABLE:
+        raise RuntimeError("Thiếu thư viện ultralytics (dùng --engine classical để chạy không cần model)")
+    if not os.path.exists(MODEL_PATH):
+        raise FileNotFoundError(f"Không tìm thấy model {MODEL_PATH} (đặt BUBBLE_MODEL_PATH hoặc dùng --engine classical)")
+    return YOLO(MODEL_PATH)
 
 def base64_to_image(b64_string):
     try:
@@ -25,79 +73,224 @@ def base64_to_image(b64_string):
         return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
     except: return None
 
-def detect_bubbles_in_panel(image_bgr, model):
-    h, w = image_bgr.shape[:2]
-    # Logic giống hệt inpainter để đảm bảo tính nhất quán
-    results = model.predict(image_bgr, conf=0.2, iou=0.4, retina_masks=True, verbose=False)
-    
+def mask_to_base64(binary_mask):
+    _, buffer = cv2.imencode('.png', binary_mask)
+    return base64.b64encode(buffer).decode('utf-8')
+
+def bubbles_from_masks(classes, masks, w, h, tolerance=POLYGON_TOLERANCE, with_mask=False, compact=False):
+    """
+    Lấy polygon bong bóng từ mask nhị phân ở độ phân giải của model (đã bỏ viền letterbox)
+    rồi scale về tọa độ panel. Chỉ khi `with_mask` mới resize mask lên kích thước panel
+    (maskBase64, PNG 0/255). `compact`: "polygon" (delta) thay cho "points", "maskRle" (RLE COCO)
+    thay cho maskBase64 - xem mask_codec.py.
+    """
     bubbles = []
-    if results[0].masks is not None:
-        classes = results[0].boxes.cls.cpu().numpy()
-        masks = results[0].masks.data.cpu().numpy()
-        for i, m in enumerate(masks):
-            cls_id = int(classes[i])
-            if cls_id != 1: 
-                continue
+    if len(masks) == 0:
+        return bubbles
+    mask_h, mask_w = masks.shape[1:]
+    scale = np.array([w / mask_w, h / mask_h])
+    limit = np.array([w - 1, h - 1])
+    for i, m in enumerate(masks):
+        cls_id = int(classes[i])
+        if cls_id != 1: 
+            continue
+        
+        binary_mask = m * 255
+        mask_field = None
+        if with_mask:
+            full_mask = (cv2.resize(m.astype(np.float32), (w, h)) > MASK_THRESHOLD).astype(np.uint8)
+            mask_field = ("maskRle", encode_rle(full_mask)) if compact else ("maskBase64", mask_to_base64(full_mask * 255))
+        
+        # Lấy contour để vẽ viền (giống logic hiển thị)
+        contours, _ = cv2.findContours(binary_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        for cnt in contours:
+            # Convex Hull để mô phỏng logic inpaint
+            hull = cv2.convexHull(cnt).reshape(-1, 2)
             
-            m_resized = cv2.resize(m, (w, h))
-            binary_mask = (m_resized > 0.5).astype(np.uint8) * 255
+            # Tọa độ tâm pixel của mask -> tọa độ panel
+            points = np.clip(np.round((hull + 0.5) * scale - 0.5), 0, limit).astype(np.int32)
+            if tolerance > 0 and len(points) > 3:
+                points = cv2.approxPolyDP(points.reshape(-1, 1, 2), tolerance, True).reshape(-1, 2)
+            
+            bubble = {"id": i + 1, "points": points}
+            if mask_field is not None:
+                bubble[mask_field[0]] = mask_field[1]
+            bubbles.append(bubble)
+
+    if compact:
+        for bubble, polygon in zip(bubbles, encode_polygons([b.pop("points") for b in bubbles])):
+            bubble["polygon"] = polygon
+    else:
+        for bubble in bubbles:
+            bubble["points"] = bubble["points"].tolist()
             
-            # Lấy contour để vẽ viền (giống logic hiển thị)
-            contours, _ = cv2.findContours(binary_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-            for cnt in contours:
-                # Convex Hull để mô phỏng logic inpaint
-                hull = cv2.convexHull(cnt)
-                
-                # Phóng to nhẹ hull để mô phỏng dilation (visualize)
-                # Lưu ý: Đây chỉ là visualize, tọa độ trả về để frontend vẽ
-                points = hull.reshape(-1, 2).tolist()
-                
-                bubbles.append({
-                    "id": i + 1,
-                    "points": points
-                })
-                
     return bubbles
 
+def letterbox_shape(h, w, stride, imgsz=IMG_SIZE):
+    """Kích thước tensor đầu vào mà LetterBox(auto=True) tạo ra cho ảnh h x w"""
+    r = min(imgsz / h, imgsz / w)
+    new_w, new_h = int(round(w * r)), int(round(h * r))
+    return new_h + (imgsz - new_h) % stride, new_w + (imgsz - new_w) % stride
+
+def detect_bubbles_batched(images, model, batch_size=BATCH_SIZE, tolerance=POLYGON_TOLERANCE, with_mask=False,
+                           compact=False):
+    """
+    Segment nhiều panel: panel đã có trong cache segmentation được lấy ra luôn, phần còn lại
+    gom theo kích thước sau letterbox (bucket), mỗi bucket chạy model.predict theo batch `batch_size`.
+    Trả về (list bubbles theo thứ tự đầu vào, stats).
+    """
+    cache = get_seg_cache(model)
+    stride = int(max(model.model.stride))
+    results = [None] * len(images)
+    keys = [seg_cache_key(img) for img in images]
+    buckets = {}
+    cache_hits = 0
+    for idx, img in enumerate(images):
+        h, w = img.shape[:2]
+        cached = load_segmentation(cache, keys[idx])
+        if cached is not None:
+            results[idx] = bubbles_from_masks(cached[0], cached[1], w, h, tolerance, with_mask, compact)
+            cache_hits += 1
+            continue
+        buckets.setdefault(letterbox_shape(h, w, stride), []).append(idx)
+
+    batches = 0
+    start = time.time()
+    for indices in buckets.values():
+        for offset in range(0, len(indices), batch_size):
+            chunk = indices[offset:offset + batch_size]
+            predictions = model.predict([images[i] for i in chunk], predictor=PanelBatchPredictor, **PREDICT_ARGS)
+            for i, prediction in zip(chunk, predictions):
+                h, w = images[i].shape[:2]
+                classes, masks = segmentation_from_result(prediction, h, w)
+                cache.set(keys[i], encode_segmentation(classes, masks))
+                results[i] = bubbles_from_masks(classes, masks, w, h, tolerance, with_mask, compact)
+            batches += 1
+    elapsed = time.time() - start
+
+    inferred = len(images) - cache_hits
+    stats = {
+        "panels": len(images),
+        "cacheHits": cache_hits,
+        "buckets": len(buckets),
+        "batches": batches,
+        "batchSize": batch_size,
+        "inferenceMs": int(elapsed * 1000),
+        "panelsPerSecond": round(inferred / elapsed, 2) if inferred and elapsed > 0 else None
+    }
+    return results, stats
+
+def detect_bubbles_classical(images, tolerance=POLYGON_TOLERANCE, with_mask=False, compact=False):
+    """Engine classical: cùng output với detect_bubbles_batched, không dùng model / cache segmentation"""
+    results = []
+    start = time.time()
+    for img in images:
+        h, w = img.shape[:2]
+        classes, masks = classical_segmentation(img)
+        results.append(bubbles_from_masks(classes, masks, w, h, tolerance, with_mask, compact))
+    elapsed = time.time() - start
+    stats = {
+        "panels": len(images),
+        "cacheHits": 0,
+        "buckets": 0,
+        "batches": 0,
+        "inferenceMs": int(elapsed * 1000),
+        "panelsPerSecond": round(len(images) / elapsed, 2) if images and elapsed > 0 else None
+    }
+    return results, stats
+
+def merge_stats(total, stats):
+    for key in ("panels", "cacheHits", "buckets", "batches", "inferenceMs"):
+        total[key] = total.get(key, 0) + stats.get(key, 0)
+    return total
+
 def main():
     sys.stdout.reconfigure(encoding='utf-8')
-    model = load_model()
+    if request_is_empty():
+        return
+    ndjson = '--ndjson' in sys.argv
+    cli_engine = sys.argv[sys.argv.index('--engine') + 1] if '--engine' in sys.argv[:-1] else None
+    # Engine / model được chọn khi segment lần đầu (option "engine" có thể nằm trong request)
+    state = {"engine": None, "model": None}
+    options = {}
+    writer = make_writer(ndjson)
+    # Hàng đợi theo đúng thứ tự input: ('start', i, None) / ('panel', i, result) / ('end', i, meta)
+    pending, images, slots = [], [], []
+    totals = {}
+    file_meta = {}
+
+    def flush():
+        batch_size = int(options.get('batchSize') or BATCH_SIZE)
+        if images:
+            tolerance = float(options.get('polygonTolerance', POLYGON_TOLERANCE))
+            with_mask = bool(options.get('returnMasks'))
+            compact = options.get('encoding') == 'compact'
+            if state["engine"] is None:
+                state["engine"] = resolve_engine(options.get('engine') or cli_engine)
+                totals["engine"] = state["engine"]
+                if state["engine"] == 'yolo':
+                    state["model"] = load_model()
+            if state["engine"] == 'classical':
+                bubbles_list, stats = detect_bubbles_classical(images, tolerance, with_mask, compact)
+            else:
+                bubbles_list, stats = detect_bubbles_batched(images, state["model"], batch_size, tolerance,
+                                                             with_mask, compact)
+            for slot, bubbles in zip(slots, bubbles_list):
+                slot["bubbles"] = bubbles
+            merge_stats(totals, stats)
+            totals["batchSize"] = batch_size
+        for kind, file_index, payload in pending:
+            if kind == 'start':
+                writer.start_file(file_index)
+            elif kind == 'panel':
+                writer.write_panel(file_index, payload)
+            else:
+                writer.end_file(file_index, payload)
+        pending.clear()
+        images.clear()
+        slots.clear()
     
     try:
-        input_stream = sys.stdin.read()
-        if not input_stream: return
-        request_data = json.loads(input_stream)
-        
-        output_results = []
-        
-        for file_info in request_data.get('filesData', []):
-            processed_panels = []
-            for panel in file_info.get('panels', []):
-                sys.stderr.write(f"[PY] Detect Bubble: {file_info.get('fileName')} - P{panel.get('panelId')}\n")
+        # 1. Decode panel theo luồng, segment theo cửa sổ nhiều batch rồi ghi kết quả ngay
+        for event, file_index, payload in iter_request(options, ndjson):
+            if event == 'file_start':
+                file_meta = payload
+                pending.append(('start', file_index, None))
+            elif event == 'file_end':
+                pending.append(('end', file_index, payload))
+            else:
+                panel = payload
+                sys.stderr.write(f"[PY] Detect Bubble: {file_meta.get('fileName')} - P{panel.get('panelId')}\n")
                 
                 img = base64_to_image(panel.get('croppedImageBase64'))
                 if img is None:
-                    processed_panels.append({"panelId": panel.get('panelId'), "error": "Bad Base64"})
+                    pending.append(('panel', file_index, {"panelId": panel.get('panelId'), "error": "Bad Base64"}))
                     continue
 
-                bubbles = detect_bubbles_in_panel(img, model)
-                
-                processed_panels.append({
+                result = {
                     "panelId": panel.get('panelId'),
-                    "bubbles": bubbles,
+                    "bubbles": [],
                     "width": img.shape[1],
                     "height": img.shape[0]
-                })
-            
-            output_results.append({
-                "fileName": file_info.get('fileName'),
-                "panels": processed_panels
-            })
+                }
+                pending.append(('panel', file_index, result))
+                images.append(img)
+                slots.append(result)
+
+                if len(images) >= int(options.get('batchSize') or BATCH_SIZE) * WINDOW_BATCHES:
+                    flush()
+        flush()
 
-        print(json.dumps({"data": output_results}, ensure_ascii=False))
+        # 2. Thống kê toàn request
+        if totals.get("inferenceMs"):
+            totals["panelsPerSecond"] = round((totals["panels"] - totals["cacheHits"]) * 1000 / totals["inferenceMs"], 2)
+        totals.setdefault("panels", 0)
+        sys.stderr.write(f"[PY] Bubble stats: {json.dumps(totals)}\n")
+        writer.close(stats=totals)
 
     except Exception as e:
-        print(json.dumps({"error": str(e)}))
+        sys.stderr.write(f"[PY][ERROR] {str(e)}\n")
+        writer.close(error=str(e))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,108 @@
+"""
+Inpaint cổ điển cho vùng mask nằm trên nền phẳng (panel_inpainter.py, fillMode "auto").
+
+Phần lớn bong bóng thoại nằm trên nền trắng hoặc một màu, LaMa là thừa. Mỗi vùng liên thông của mask được
+phân loại theo vành BORDER_RING px ngay ngoài vùng (tính cho mọi vùng cùng lúc bằng np.bincount trên ảnh label):
+  - solid   : độ lệch chuẩn màu của vành <= SOLID_STD           -> tô màu trung bình của vành
+  - gradient: sai số fit mặt phẳng màu a*x + b*y + c <= GRADIENT_STD -> tô theo mặt phẳng đó
+  - telea   : nền gần phẳng (sai số <= TELEA_STD) và vùng mảnh (bán kính trong <= TELEA_MAX_RADIUS)
+              -> cv2.inpaint (Telea)
+  - lama    : còn lại (nền có texture) -> để LaMa xử lý
+"""
+import os
+from typing import Any, Dict, List, Tuple
+
+import cv2
+import numpy as np
+
+BORDER_RING = 5
+MIN_RING_PIXELS = 20
+SOLID_STD = float(os.environ.get('INPAINT_SOLID_STD', '3'))
+GRADIENT_STD = float(os.environ.get('INPAINT_GRADIENT_STD', '3'))
+TELEA_STD = float(os.environ.get('INPAINT_TELEA_STD', '10'))
+TELEA_MAX_RADIUS = 12
+TELEA_RADIUS = 5
+METHODS = ('solid', 'gradient', 'telea', 'lama')
+
+
+def classify_regions(image: np.ndarray, mask: np.ndarray) -> Dict[str, Any]:
+    """
+    -> {"labels": ảnh label, "count": số label (tính cả nền 0), "codes": chỉ số METHODS theo label (nền = -1),
+        "mean": màu trung bình vành (L, 3), "plane": hệ số mặt phẳng (L, 3, 3), "stats": stats của connectedComponents}
+    """
+    count, labels, stats, _ = cv2.connectedComponentsWithStats((mask > 0).astype(np.uint8), connectivity=8)
+    h, w = mask.shape[:2]
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * BORDER_RING + 1, 2 * BORDER_RING + 1))
+    ring_labels = cv2.dilate(labels.astype(np.float32), kernel).astype(np.int64)
+    ring = (labels == 0) & (ring_labels > 0)
+    owner = ring_labels[ring]
+    ys, xs = np.nonzero(ring)
+    colors = image[ring].astype(np.float64)
+    channels = colors.shape[1] if colors.ndim == 2 else 1
+    colors = colors.reshape(len(owner), channels)
+
+    n = np.bincount(owner, minlength=count).astype(np.float64)
+    safe = np.maximum(n, 1)
+    total = np.stack([np.bincount(owner, colors[:, c], count) for c in range(channels)], axis=1)
+    total_sq = np.stack([np.bincount(owner, colors[:, c] ** 2, count) for c in range(channels)], axis=1)
+    mean = total / safe[:, None]
+    std = np.sqrt(np.maximum(total_sq / safe[:, None] - mean ** 2, 0)).max(axis=1)
+
+    # Fit mặt phẳng màu theo từng label: giải hệ chuẩn 3x3 cho mọi label một lượt (tọa độ chia 1000 cho ổn định)
+    xn, yn = xs / 1000.0, ys / 1000.0
+    sx, sy = np.bincount(owner, xn, count), np.bincount(owner, yn, count)
+    sxx, syy, sxy = np.bincount(owner, xn * xn, count), np.bincount(owner, yn * yn, count), np.bincount(owner, xn * yn, count)
+    normal = np.stack([np.stack([sxx, sxy, sx], -1), np.stack([sxy, syy, sy], -1), np.stack([sx, sy, n], -1)], axis=1)
+    normal += np.eye(3) * 1e-9
+    rhs = np.stack([np.stack([np.bincount(owner, xn * colors[:, c], count),
+                              np.bincount(owner, yn * colors[:, c], count), total[:, c]], -1)
+                    for c in range(channels)], axis=-1)                       # (L, 3, C)
+    plane = np.linalg.solve(normal, rhs)                                       # (L, 3, C)
+    residual = np.maximum(total_sq - np.einsum('lkc,lkc->lc', plane, rhs), 0)
+    residual_std = np.sqrt(residual / safe[:, None]).max(axis=1)
+
+    # Bán kính trong lớn nhất của từng vùng
+    inside = labels > 0
+    distance = cv2.distanceTransform(inside.astype(np.uint8), cv2.DIST_L2, 3)
+    radius = np.zeros(count)
+    np.maximum.at(radius, labels[inside], distance[inside])
+
+    # Chỉ số trong METHODS theo label (int để tra theo pixel nhanh hơn mảng object)
+    codes = np.full(count, METHODS.index('lama'), dtype=np.int8)
+    enough = n >= MIN_RING_PIXELS
+    codes[enough & (residual_std <= TELEA_STD) & (radius <= TELEA_MAX_RADIUS)] = METHODS.index('telea')
+    codes[enough & (residual_std <= GRADIENT_STD)] = METHODS.index('gradient')
+    codes[enough & (std <= SOLID_STD)] = METHODS.index('solid')
+    codes[0] = -1
+    return {"labels": labels, "count": count, "codes": codes, "mean": mean, "plane": plane, "stats": stats}
+
+
+def classical_prefill(image: np.ndarray, mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray, List[Dict[str, Any]]]:
+    """
+    Tô các vùng nền phẳng. Trả về (ảnh đã tô, mask còn lại cho LaMa, [{"box": [x, y, w, h], "method"}] theo vùng)
+    """
+    info = classify_regions(image, mask)
+    labels, codes = info["labels"], info["codes"]
+    result = image.copy()
+    pixel_code = codes[labels]
+
+    solid = pixel_code == METHODS.index('solid')
+    if solid.any():
+        result[solid] = np.clip(np.round(info["mean"][labels[solid]]), 0, 255).astype(image.dtype).reshape(result[solid].shape)
+
+    gradient = pixel_code == METHODS.index('gradient')
+    if gradient.any():
+        ys, xs = np.nonzero(gradient)
+        coords = np.stack([xs / 1000.0, ys / 1000.0, np.ones(len(xs))], axis=1)
+        values = np.einsum('nk,nkc->nc', coords, info["plane"][labels[gradient]])
+        result[gradient] = np.clip(np.round(values), 0, 255).astype(image.dtype).reshape(result[gradient].shape)
+
+    telea = pixel_code == METHODS.index('telea')
+    if telea.any():
+        filled = cv2.inpaint(image, telea.astype(np.uint8) * 255, TELEA_RADIUS, cv2.INPAINT_TELEA)
+        result[telea] = filled[telea]
+
+    remaining = np.where(pixel_code == METHODS.index('lama'), mask, 0).astype(mask.dtype)
+    stats = info["stats"]
+    fills = [{"box": [int(v) for v in stats[i, :4]], "method": METHODS[codes[i]]} for i in range(1, info["count"])]
+    return result, remaining, fills
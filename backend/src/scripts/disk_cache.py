@@ -0,0 +1,151 @@
+"""
+Cache trên đĩa dùng chung cho các script Python (một file JSON cho mỗi key).
+
+- Key nên là hash nội dung (sha256 của ảnh...) để đổi dữ liệu khác là tự động miss.
+- `version` được trộn vào key: đổi engine / model là cache cũ tự vô hiệu.
+- TTL tính theo thời điểm ghi; entry quá hạn bị xóa khi đọc.
+- Khi tổng dung lượng vượt `max_bytes`, xóa các entry ít được dùng nhất (mtime được
+  cập nhật mỗi lần hit) cho tới khi còn ~90% giới hạn.
+- Tổng dung lượng được cộng dồn trong process sau mỗi lần ghi; chỉ quét cả thư mục (os.walk) khi tổng
+  vượt `max_bytes`, hoặc sau EVICT_EVERY_WRITES lần ghi / EVICT_INTERVAL_SECONDS giây (đồng bộ lại với
+  các process khác cùng ghi vào thư mục).
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import tempfile
+from typing import Any, Optional
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_ROOT = os.environ.get('TRUYENFF_CACHE_DIR', os.path.join(CURRENT_DIR, 'cache'))
+EVICT_EVERY_WRITES = 500
+EVICT_INTERVAL_SECONDS = 600
+
+
+def hash_bytes(*parts) -> str:
+    """sha256 của nhiều phần (bytes / str / numpy array)"""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        elif hasattr(part, 'tobytes') and not isinstance(part, (bytes, bytearray, memoryview)):
+            # numpy array: trộn thêm shape/dtype để ảnh khác kích thước không trùng hash
+            digest.update(f"{part.shape}|{part.dtype}".encode('ascii'))
+            part = part.tobytes()
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class DiskCache:
+    def __init__(self, directory: str, version: str = '', ttl_seconds: float = 7 * 24 * 3600,
+                 max_bytes: int = 500 * 1024 * 1024, enabled: bool = True):
+        self.directory = directory
+        self.version = version
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        # Tổng dung lượng ước tính (None: chưa quét lần nào)
+        self._total_bytes: Optional[int] = None
+        self._writes_since_scan = 0
+        self._last_scan = 0.0
+        if enabled:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        full_key = hash_bytes(self.version, key)
+        return os.path.join(self.directory, full_key[:2], full_key + '.json')
+
+    def get(self, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError, OSError):
+            return None
+
+        if self.ttl_seconds and time.time() - entry.get('createdAt', 0) > self.ttl_seconds:
+            self._remove(path)
+            return None
+
+        try:
+            os.utime(path, None)  # đánh dấu vừa dùng (LRU)
+        except OSError:
+            pass
+        return entry.get('value')
+
+    def set(self, key: str, value: Any):
+        if not self.enabled:
+            return
+        path = self._path(key)
+        tmp_path = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                old_size = os.path.getsize(path)
+            except OSError:
+                old_size = 0
+            # Ghi file tạm rồi rename để process khác không đọc phải file dở dang
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({"createdAt": time.time(), "version": self.version, "value": value}, f, ensure_ascii=False)
+            new_size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+            tmp_path = None
+        except (OSError, TypeError, ValueError) as e:
+            print(f"[PY][WARNING] Không ghi được cache {path}: {e}", file=sys.stderr)
+            return
+        finally:
+            if tmp_path is not None:
+                self._remove(tmp_path)
+
+        self._writes_since_scan += 1
+        if self._total_bytes is not None:
+            self._total_bytes += new_size - old_size
+        if self._scan_due():
+            self.evict()
+
+    def _scan_due(self) -> bool:
+        if not self.max_bytes:
+            return False
+        if self._total_bytes is None or self._total_bytes > self.max_bytes:
+            return True
+        return (self._writes_since_scan >= EVICT_EVERY_WRITES
+                or time.time() - self._last_scan >= EVICT_INTERVAL_SECONDS)
+
+    def evict(self):
+        """Quét thư mục: tính lại tổng dung lượng, xóa entry cũ nhất khi vượt max_bytes"""
+        self._writes_since_scan = 0
+        self._last_scan = time.time()
+        if not self.max_bytes:
+            return
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        if total > self.max_bytes:
+            target = self.max_bytes * 0.9
+            for _, size, path in sorted(entries):
+                if total <= target:
+                    break
+                self._remove(path)
+                total -= size
+        self._total_bytes = total
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
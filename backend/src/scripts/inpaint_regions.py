@@ -0,0 +1,263 @@
+"""
+Inpaint theo vùng (ROI) cho panel_inpainter.py.
+
+LaMa chạy trên cả panel tốn thời gian theo số pixel của panel, kể cả khi mask chỉ là hai bong bóng nhỏ.
+Ở đây mask được chia thành các vùng liên thông, mỗi vùng lấy bbox + viền ngữ cảnh (`padding`), các bbox
+chồng lên nhau nhiều (vùng gần nhau) được gộp lại. Mỗi crop được inpaint riêng rồi dán lại vào panel, chỉ
+thay các pixel thuộc mask: thời gian inpaint tỷ lệ với diện tích vùng cần xóa thay vì cả panel.
+
+Nếu tổng diện tích các crop đã gần bằng cả panel thì inpaint một lần trên cả panel như trước.
+
+Đa độ phân giải (`max_working_size` > 0): crop (hoặc cả panel) có cạnh dài hơn max_working_size được thu nhỏ
+trước khi inpaint, phần fill được phóng lại kích thước gốc và chỉ ghép vào trong mask với alpha giảm dần
+về 0 ở mép mask (feather `feather` px). Pixel ngoài mask luôn giữ nguyên giá trị gốc.
+
+`fill_mode="auto"`: trước khi chia crop, vùng mask nằm trên nền phẳng được tô bằng phương pháp cổ điển
+(classical_fill.py), chỉ vùng nền có texture mới đưa vào LaMa. `fill_mode="lama"`: mọi vùng qua LaMa.
+
+`cache` (DiskCache của region_cache.py): vùng LaMa đã inpaint ở lần chạy trước trên cùng panel được dán lại
+từ cache, chỉ vùng mới / đổi mask mới được inpaint.
+"""
+import os
+import time
+from typing import Callable, Dict, List, Tuple, Any
+
+import cv2
+import numpy as np
+
+from classical_fill import METHODS, classical_prefill
+from region_cache import panel_digest, region_key, encode_region, decode_region
+
+Box = Tuple[int, int, int, int]  # (x0, y0, x1, y1), x1 / y1 không tính
+Region = Tuple[Box, List[int]]   # (crop, label các vùng liên thông thuộc crop)
+
+# Viền ngữ cảnh tối thiểu quanh mỗi vùng (px) và theo tỷ lệ kích thước vùng
+ROI_PADDING = int(os.environ.get('INPAINT_ROI_PADDING', '64'))
+ROI_CONTEXT_RATIO = 0.25
+# Tổng diện tích crop >= tỷ lệ này của panel thì inpaint cả panel
+FULL_FRAME_RATIO = 0.6
+# Cạnh dài tối đa đưa vào LaMa (0 = không giới hạn) và độ rộng feather khi ghép fill đã phóng to
+MAX_WORKING_SIZE = int(os.environ.get('INPAINT_MAX_WORKING_SIZE', '0'))
+FEATHER_PX = int(os.environ.get('INPAINT_FEATHER_PX', '8'))
+FILL_MODE = os.environ.get('INPAINT_FILL_MODE', 'auto')
+
+
+def _area(box: Box) -> int:
+    return (box[2] - box[0]) * (box[3] - box[1])
+
+
+def _union(a: Box, b: Box) -> Box:
+    return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+
+
+def _overlaps(a: Box, b: Box) -> bool:
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def merge_boxes(regions: List[Region]) -> List[Region]:
+    """
+    Gộp hai crop chồng nhau khi crop gộp không lớn hơn tổng hai crop (vùng gần nhau dùng chung ngữ cảnh).
+    Crop chồng nhau nhưng ở xa (gộp lại tốn thêm nhiều pixel) được giữ riêng.
+    """
+    regions = list(regions)
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(regions)):
+            for j in range(i + 1, len(regions)):
+                (a, members_a), (b, members_b) = regions[i], regions[j]
+                union = _union(a, b)
+                if _overlaps(a, b) and _area(union) <= _area(a) + _area(b):
+                    regions[i] = (union, members_a + members_b)
+                    regions.pop(j)
+                    merged = True
+                    break
+            if merged:
+                break
+    return regions
+
+
+def mask_regions(mask: np.ndarray, padding: int = ROI_PADDING) -> Tuple[np.ndarray, List[Region]]:
+    """
+    Mask (H, W) -> (ảnh label các vùng liên thông, [(crop, [label, ...]), ...]): mỗi vùng thuộc đúng một crop,
+    crop = bbox của các vùng + viền ngữ cảnh
+    """
+    h, w = mask.shape[:2]
+    count, labels, stats, _ = cv2.connectedComponentsWithStats((mask > 0).astype(np.uint8), connectivity=8)
+    if count <= 1:
+        return labels, []
+    stats = stats[1:]
+    x0, y0 = stats[:, cv2.CC_STAT_LEFT], stats[:, cv2.CC_STAT_TOP]
+    bw, bh = stats[:, cv2.CC_STAT_WIDTH], stats[:, cv2.CC_STAT_HEIGHT]
+    pad = np.maximum(padding, (ROI_CONTEXT_RATIO * np.maximum(bw, bh)).astype(int))
+    boxes = np.stack([np.maximum(x0 - pad, 0), np.maximum(y0 - pad, 0),
+                      np.minimum(x0 + bw + pad, w), np.minimum(y0 + bh + pad, h)], axis=1)
+    return labels, merge_boxes([(tuple(int(v) for v in box), [label + 1]) for label, box in enumerate(boxes)])
+
+
+def feather_alpha(mask: np.ndarray, feather: int = FEATHER_PX) -> np.ndarray:
+    """Alpha float32 (H, W): 0 ngoài mask, tăng dần từ mép vào trong, = 1 khi cách mép >= feather px"""
+    inside = (mask > 0).astype(np.uint8)
+    if feather <= 0:
+        return inside.astype(np.float32)
+    distance = cv2.distanceTransform(inside, cv2.DIST_L2, 3)
+    return np.clip(distance / feather, 0, 1)
+
+
+def downscale_for_inpaint(image: np.ndarray, mask: np.ndarray,
+                          max_working_size: int) -> Tuple[np.ndarray, np.ndarray, bool]:
+    """-> (ảnh, mask đưa vào LaMa, có thu nhỏ không): thu nhỏ nếu cạnh dài > max_working_size (> 0)"""
+    h, w = image.shape[:2]
+    scale = max_working_size / max(h, w) if max_working_size > 0 else 1.0
+    if scale >= 1.0:
+        return image, mask, False
+    size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+    small = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    # Pixel nhỏ nào chứa một phần mask đều được inpaint (mask không bị co lại khi thu nhỏ)
+    small_mask = ((cv2.resize((mask > 0).astype(np.float32), size, interpolation=cv2.INTER_AREA) > 0) * 255).astype(np.uint8)
+    return small, small_mask, True
+
+
+def blend_upscaled_fill(image: np.ndarray, mask: np.ndarray, fill_small: np.ndarray,
+                        feather: int = FEATHER_PX) -> np.ndarray:
+    """Phóng fill về kích thước ảnh, ghép trong mask đã feather; ngoài mask giữ nguyên ảnh gốc"""
+    h, w = image.shape[:2]
+    fill = cv2.resize(fill_small, (w, h), interpolation=cv2.INTER_CUBIC)
+    alpha = feather_alpha(mask, feather)[..., None]
+    blended = image.astype(np.float32) * (1 - alpha) + fill.astype(np.float32) * alpha
+    return np.clip(np.round(blended), 0, 255).astype(np.uint8)
+
+
+def apply_cached_regions(image: np.ndarray, mask: np.ndarray, digest: str,
+                         cache) -> Tuple[np.ndarray, np.ndarray, int, List[Tuple[str, Box, np.ndarray]]]:
+    """
+    Dán các vùng liên thông của mask có trong cache. Trả về (ảnh, mask còn lại, số vùng hit,
+    [(key, bbox, mask vùng trong bbox)] của các vùng miss để lưu sau khi inpaint)
+    """
+    count, labels, stats, _ = cv2.connectedComponentsWithStats((mask > 0).astype(np.uint8), connectivity=8)
+    if count <= 1:
+        return image, mask, 0, []
+    image, mask = image.copy(), mask.copy()
+    hits, misses = 0, []
+    for label in range(1, count):
+        x, y, bw, bh = (int(v) for v in stats[label, :4])
+        region = labels[y:y + bh, x:x + bw] == label
+        key = region_key(digest, x, y, region)
+        pixels = decode_region(cache.get(key))
+        if pixels is None or pixels.shape[:2] != region.shape:
+            misses.append((key, (x, y, x + bw, y + bh), region))
+            continue
+        image[y:y + bh, x:x + bw][region] = pixels[region]
+        mask[y:y + bh, x:x + bw][region] = 0
+        hits += 1
+    return image, mask, hits, misses
+
+
+def plan_crops(image: np.ndarray, mask: np.ndarray, padding: int = ROI_PADDING, mode: str = 'roi',
+               max_working_size: int = MAX_WORKING_SIZE, fill_mode: str = FILL_MODE, cache=None) -> Dict[str, Any]:
+    """
+    Chia việc inpaint một ảnh thành các crop. `plan["inputs"]`: [(ảnh, mask)] cần đưa vào LaMa,
+    theo thứ tự của `plan["regions"]`; `plan["image"]` / `plan["mask"]`: ảnh đã tô cổ điển / dán từ cache
+    và mask còn lại.
+    """
+    h, w = image.shape[:2]
+    digest = panel_digest(image) if cache is not None else None
+    classical_fills, classical_ms = None, 0
+    if fill_mode == 'auto':
+        start = time.time()
+        image, mask, classical_fills = classical_prefill(image, mask)
+        classical_ms = int((time.time() - start) * 1000)
+    cache_hits, cache_misses = 0, []
+    if cache is not None:
+        image, mask, cache_hits, cache_misses = apply_cached_regions(image, mask, digest, cache)
+    has_mask = bool(np.any(mask))
+    labels, regions = mask_regions(mask, padding) if mode != 'full' else (None, [])
+    crop_pixels = sum(_area(box) for box, _ in regions)
+    full_frame = has_mask and (mode == 'full' or crop_pixels >= FULL_FRAME_RATIO * h * w)
+    if full_frame:
+        regions, crop_pixels = [((0, 0, w, h), None)], h * w
+    inputs, scaled = [], []
+    for (x0, y0, x1, y1), _ in regions:
+        crop, crop_mask, was_scaled = downscale_for_inpaint(image[y0:y1, x0:x1], mask[y0:y1, x0:x1], max_working_size)
+        inputs.append((crop, crop_mask))
+        scaled.append(was_scaled)
+    return {"image": image, "mask": mask, "labels": labels, "regions": regions, "inputs": inputs, "scaled": scaled,
+            "fullFrame": full_frame, "cropPixels": crop_pixels,
+            "classicalFills": classical_fills, "classicalMs": classical_ms,
+            "cache": cache, "cacheHits": cache_hits, "cacheMisses": cache_misses}
+
+
+def apply_crops(plan: Dict[str, Any], fills: List[np.ndarray],
+                feather: int = FEATHER_PX) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """
+    Dán kết quả LaMa của từng crop vào ảnh. Crop có thể chứa một phần vùng của crop khác: phần đó vẫn được che
+    trong mask (không lộ chữ làm ngữ cảnh) nhưng chỉ pixel của các vùng thuộc crop mới được dán lại.
+    """
+    image, mask = plan["image"], plan["mask"]
+    h, w = image.shape[:2]
+    result = image.copy()
+    for ((x0, y0, x1, y1), members), fill, scaled in zip(plan["regions"], fills, plan["scaled"]):
+        crop, crop_mask = image[y0:y1, x0:x1], mask[y0:y1, x0:x1]
+        if scaled:
+            fill = blend_upscaled_fill(crop, crop_mask, fill, feather)
+        own = crop_mask > 0 if members is None else np.isin(plan["labels"][y0:y1, x0:x1], members)
+        result[y0:y1, x0:x1][own] = fill[own]
+    stats = {
+        "mode": "full" if plan["fullFrame"] else "roi",
+        "regions": len(plan["regions"]),
+        "downscaledRegions": int(sum(plan["scaled"])),
+        "inpaintPixels": int(plan["cropPixels"]),
+        "imagePixels": int(h * w)
+    }
+    if plan["classicalFills"] is not None:
+        # Method đã chọn cho từng vùng liên thông của mask
+        stats["fills"] = plan["classicalFills"]
+        stats["methods"] = {m: sum(f["method"] == m for f in plan["classicalFills"]) for m in METHODS}
+        stats["classicalMs"] = plan["classicalMs"]
+    if plan["cache"] is not None:
+        for key, (x0, y0, x1, y1), region in plan["cacheMisses"]:
+            plan["cache"].set(key, encode_region(result[y0:y1, x0:x1], region))
+        stats["regionCache"] = {"hits": plan["cacheHits"], "misses": len(plan["cacheMisses"])}
+    return result, stats
+
+
+def inpaint_many_regions(items: List[Dict[str, Any]],
+                         inpaint_many: Callable[[List[Tuple[np.ndarray, np.ndarray]]], List[np.ndarray]],
+                         feather: int = FEATHER_PX) -> List[Tuple[np.ndarray, Dict[str, Any]]]:
+    """
+    Inpaint nhiều ảnh một lượt: crop của mọi ảnh được gửi chung cho `inpaint_many([(ảnh, mask), ...]) -> [ảnh]`
+    (để batch). `items`: [{"image", "mask", "padding"?, "mode"?, "maxWorkingSize"?, "fillMode"?, "regionCache"?}]. Trả về [(ảnh, stats)].
+    `inpaintMs` của từng ảnh là phần thời gian chung chia theo số pixel đưa vào LaMa.
+    """
+    plans = [plan_crops(item["image"], item["mask"], item.get("padding", ROI_PADDING), item.get("mode", 'roi'),
+                        item.get("maxWorkingSize", MAX_WORKING_SIZE), item.get("fillMode", FILL_MODE),
+                        item.get("regionCache"))
+             for item in items]
+    inputs = [pair for plan in plans for pair in plan["inputs"]]
+    start = time.time()
+    fills = inpaint_many(inputs) if inputs else []
+    elapsed_ms = (time.time() - start) * 1000
+    total_pixels = sum(crop.shape[0] * crop.shape[1] for crop, _ in inputs) or 1
+
+    outputs, offset = [], 0
+    for item, plan in zip(items, plans):
+        count = len(plan["inputs"])
+        result, stats = apply_crops(plan, fills[offset:offset + count], feather)
+        pixels = sum(crop.shape[0] * crop.shape[1] for crop, _ in plan["inputs"])
+        stats["inpaintMs"] = int(elapsed_ms * pixels / total_pixels)
+        outputs.append((result, stats))
+        offset += count
+    return outputs
+
+
+def inpaint_regions(image: np.ndarray, mask: np.ndarray, inpaint_fn: Callable[[np.ndarray, np.ndarray], np.ndarray],
+                    padding: int = ROI_PADDING, mode: str = 'roi', max_working_size: int = MAX_WORKING_SIZE,
+                    feather: int = FEATHER_PX, fill_mode: str = FILL_MODE,
+                    cache=None) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """
+    Inpaint một ảnh, từng crop bằng `inpaint_fn(image_crop, mask_crop) -> image_crop`.
+    `mode="full"`: một crop là cả ảnh. `max_working_size`: xem downscale_for_inpaint. Trả về (ảnh kết quả, stats).
+    """
+    item = {"image": image, "mask": mask, "padding": padding, "mode": mode, "maxWorkingSize": max_working_size,
+            "fillMode": fill_mode, "regionCache": cache}
+    return inpaint_many_regions([item], lambda pairs: [inpaint_fn(img, m) for img, m in pairs], feather)[0]
@@ -0,0 +1,273 @@
+"""
+Chuyển động Ken Burns trên CPU (zoom / pan / parallax) cho panel_animator.py: engine "kenburns", thay SVD
+khi chỉ cần vài giây chuyển động nhẹ (không cần GPU, không cần tải model).
+
+- Ma trận affine của mọi frame được tính trước một lần (numpy, vector hóa theo frame); mỗi frame chỉ là
+  một cv2.warpAffine rồi đi thẳng vào encoder (video_writer.py).
+- Parallax: các hộp focus (bong bóng, mặt) là lớp trước, zoom nhanh hơn lớp nền; lớp trước chỉ được warp
+  và trộn (alpha uint8) trong hình chữ nhật bao của từng vùng. Không có hộp focus thì dùng zoom-in
+  (tách lớp trước từ chính ảnh đó mà không có vùng rõ ràng sẽ bị bóng mờ hai lớp).
+- Ảnh nguồn được thu nhỏ trước (INTER_AREA) về đúng độ phân giải cần ở mức zoom lớn nhất: warp không
+  phải đọc ảnh gốc lớn và không bị răng cưa khi thu nhỏ.
+- Điểm hướng tới (focus): tâm các hộp bong bóng / textBlocks gửi kèm panel; focus "auto" mà panel không có
+  hộp nào (hoặc focus "faces") thì tìm khuôn mặt bằng Haar cascade của OpenCV trên ảnh đã thu nhỏ.
+  Không có gì thì hướng vào giữa panel.
+- Encode là phần tốn nhất (libx264): mặc định preset KENBURNS_PRESET = superfast thay vì preset chung.
+
+Tham số (params của job): motion (auto | zoom-in | zoom-out | pan-left | pan-right | pan-up | pan-down |
+parallax), zoom, duration (giây), fps, focus (auto | boxes | faces | none), focusBoxes [[x, y, w, h]],
+preset, width / height (mặc định 1024x576 hoặc 576x1024 theo chiều panel, như SVD).
+
+Biến môi trường:
+    KENBURNS_FPS        fps mặc định (24)
+    KENBURNS_DURATION   Thời lượng mặc định, giây (2.0)
+    KENBURNS_ZOOM       Mức zoom tối đa mặc định (1.15)
+    KENBURNS_PRESET     Preset x264 / x265 của engine này (mặc định superfast)
+"""
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from mask_codec import polygon_points
+from video_writer import VideoWriter
+
+KENBURNS_FPS = int(os.environ.get('KENBURNS_FPS', '24'))
+KENBURNS_DURATION = float(os.environ.get('KENBURNS_DURATION', '2.0'))
+KENBURNS_ZOOM = float(os.environ.get('KENBURNS_ZOOM', '1.15'))
+KENBURNS_PRESET = os.environ.get('KENBURNS_PRESET', 'superfast')
+
+MOTIONS = ('zoom-in', 'zoom-out', 'pan-left', 'pan-right', 'pan-up', 'pan-down', 'parallax')
+# Panel dài hơn khung hình quá tỷ lệ này thì pan dọc theo chiều dài (motion "auto")
+PAN_ASPECT_RATIO = 1.3
+# Lớp nền của parallax chuyển động bằng tỷ lệ này so với lớp trước
+PARALLAX_BACKGROUND_RATE = 0.4
+# Ảnh tìm khuôn mặt được thu về cạnh dài tối đa này
+FACE_DETECT_SIZE = 480
+
+_face_detector = None
+
+
+def output_size(width: int, height: int, params: Dict[str, Any]) -> Tuple[int, int]:
+    if params.get('width') and params.get('height'):
+        return int(params['width']), int(params['height'])
+    return (576, 1024) if height > width else (1024, 576)
+
+
+def ease(t: np.ndarray) -> np.ndarray:
+    """smoothstep: bắt đầu / kết thúc chậm"""
+    return t * t * (3 - 2 * t)
+
+
+def detect_faces(image_rgb: np.ndarray) -> List[List[int]]:
+    """Hộp khuôn mặt [x, y, w, h] (Haar cascade mặt trực diện; nét vẽ truyện có thể không bắt được)"""
+    global _face_detector
+    if _face_detector is None:
+        _face_detector = cv2.CascadeClassifier(
+            os.path.join(cv2.data.haarcascades, 'haarcascade_frontalface_default.xml'))
+    gray = cv2.cvtColor(image_rgb, cv2.COLOR_RGB2GRAY)
+    ratio = min(1.0, FACE_DETECT_SIZE / max(gray.shape))
+    if ratio < 1.0:
+        gray = cv2.resize(gray, None, fx=ratio, fy=ratio, interpolation=cv2.INTER_AREA)
+    side = max(24, min(gray.shape) // 12)
+    faces = _face_detector.detectMultiScale(gray, scaleFactor=1.15, minNeighbors=5, minSize=(side, side))
+    return [[int(round(v / ratio)) for v in face] for face in faces]
+
+
+def panel_focus_boxes(panel: Dict[str, Any]) -> List[List[int]]:
+    """Hộp [x, y, w, h] của bong bóng ("bubbles") và textBlocks gửi kèm panel"""
+    polygons = [polygon_points(bubble) for bubble in panel.get('bubbles') or []]
+    polygons += [polygon_points(block, 'vertices') for block in panel.get('textBlocks') or []]
+    return [[int(v) for v in cv2.boundingRect(pts.astype(np.int32))] for pts in polygons if len(pts) >= 3]
+
+
+def focus_point(boxes: Sequence[Sequence[float]]) -> Optional[np.ndarray]:
+    """Tâm các hộp, trọng số theo diện tích. None nếu không có hộp"""
+    if len(boxes) == 0:
+        return None
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    centers = boxes[:, :2] + boxes[:, 2:] / 2
+    weights = np.maximum(boxes[:, 2] * boxes[:, 3], 1.0)
+    return (centers * weights[:, None]).sum(axis=0) / weights.sum()
+
+
+def pick_motion(src_size: Tuple[int, int], out_size: Tuple[int, int]) -> str:
+    """
+    motion "auto": panel dài hơn khung hình nhiều thì pan dọc theo chiều dài, không thì zoom-in
+    (plan_motion zoom vào focus nếu có)
+    """
+    src_aspect = src_size[0] / src_size[1]
+    out_aspect = out_size[0] / out_size[1]
+    if src_aspect > out_aspect * PAN_ASPECT_RATIO:
+        return 'pan-right'
+    if src_aspect < out_aspect / PAN_ASPECT_RATIO:
+        return 'pan-down'
+    return 'zoom-in'
+
+
+def affine_track(src_size: Tuple[int, int], out_size: Tuple[int, int], zooms: np.ndarray,
+                 centers: np.ndarray) -> np.ndarray:
+    """
+    Ma trận (N, 2, 3) đưa ảnh nguồn vào khung `out_size`: frame i phủ kín khung (zoom 1 = vừa phủ kín),
+    nhìn vào `centers[i]` (tọa độ nguồn, bị kẹp để khung không lộ ra ngoài ảnh)
+    """
+    src_w, src_h = src_size
+    out_w, out_h = out_size
+    scale = max(out_w / src_w, out_h / src_h) * np.maximum(zooms, 1.0)
+    half = np.stack([out_w / (2 * scale), out_h / (2 * scale)], axis=1)
+    centers = np.clip(centers, half, np.array([src_w, src_h]) - half)
+    matrices = np.zeros((len(zooms), 2, 3), dtype=np.float64)
+    matrices[:, 0, 0] = matrices[:, 1, 1] = scale
+    matrices[:, 0, 2] = out_w / 2 - scale * centers[:, 0]
+    matrices[:, 1, 2] = out_h / 2 - scale * centers[:, 1]
+    return matrices
+
+
+def plan_motion(motion: str, src_size: Tuple[int, int], out_size: Tuple[int, int], frames: int,
+                zoom: float = KENBURNS_ZOOM, focus: Optional[np.ndarray] = None) -> Dict[str, Any]:
+    """
+    Quỹ đạo của cả clip: {"motion", "matrices": (N, 2, 3), "foreground": (N, 2, 3) | None (parallax)}
+    """
+    src_w, src_h = src_size
+    if motion not in MOTIONS:
+        motion = pick_motion(src_size, out_size)
+    if motion == 'parallax' and focus is None:
+        motion = 'zoom-in'
+    t = ease(np.linspace(0.0, 1.0, max(frames, 1)))[:, None]
+    center = np.array([src_w / 2, src_h / 2])
+    target = center if focus is None else np.asarray(focus, dtype=np.float64)
+    foreground = None
+
+    if motion in ('zoom-in', 'zoom-out', 'parallax'):
+        zooms = 1 + (zoom - 1) * t[:, 0]
+        centers = center + (target - center) * t
+        if motion == 'parallax':
+            foreground = affine_track(src_size, out_size, zooms, centers)
+            rate = PARALLAX_BACKGROUND_RATE
+            zooms = 1 + (zoom - 1) * rate * t[:, 0]
+            centers = center + (target - center) * rate * t
+    else:
+        # Pan: zoom cố định, quét hết phần ảnh còn đi được theo một trục
+        zooms = np.full(len(t), max(zoom, 1.0))
+        axis = 0 if motion in ('pan-left', 'pan-right') else 1
+        scale = max(out_size[0] / src_w, out_size[1] / src_h) * zooms[0]
+        half = out_size[axis] / (2 * scale)
+        centers = np.repeat(target[None, :], len(t), axis=0)
+        centers[:, axis] = half + t[:, 0] * ((src_w if axis == 0 else src_h) - 2 * half)
+    matrices = affine_track(src_size, out_size, zooms, centers)
+    if motion in ('zoom-out', 'pan-left', 'pan-up'):
+        matrices = matrices[::-1]
+    return {"motion": motion, "matrices": matrices, "foreground": foreground}
+
+
+def foreground_alpha(shape: Sequence[int], boxes: Sequence[Sequence[float]]) -> np.ndarray:
+    """Alpha uint8 0..255 của lớp trước (parallax): các hộp focus, viền mờ vài pixel"""
+    h, w = shape[:2]
+    alpha = np.zeros((h, w), dtype=np.uint8)
+    for x, y, bw, bh in np.asarray(boxes, dtype=np.float64).reshape(-1, 4):
+        cv2.rectangle(alpha, (int(x), int(y)), (int(x + bw), int(y + bh)), 255, -1)
+    sigma = max(1.5, 0.004 * np.hypot(h, w))
+    return cv2.GaussianBlur(alpha, (0, 0), sigma)
+
+
+def alpha_regions(alpha: np.ndarray) -> List[Tuple[int, int, int, int]]:
+    """Hình chữ nhật bao các vùng alpha > 0, gộp các hình chồng nhau (mỗi pixel chỉ được trộn một lần)"""
+    contours, _ = cv2.findContours((alpha > 0).view(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    rects = [list(cv2.boundingRect(c)) for c in contours]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(rects)):
+            for j in range(i + 1, len(rects)):
+                a, b = rects[i], rects[j]
+                if a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]:
+                    x0, y0 = min(a[0], b[0]), min(a[1], b[1])
+                    x1, y1 = max(a[0] + a[2], b[0] + b[2]), max(a[1] + a[3], b[1] + b[3])
+                    rects[i] = [x0, y0, x1 - x0, y1 - y0]
+                    del rects[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return [tuple(rect) for rect in rects]
+
+
+def _blend_foreground(frame: np.ndarray, image_rgb: np.ndarray, matrix: np.ndarray, alpha: np.ndarray,
+                      alpha_box: Tuple[int, int, int, int]):
+    """Warp lớp trước + alpha chỉ trong ảnh của `alpha_box` trên frame rồi trộn tại chỗ"""
+    out_h, out_w = frame.shape[:2]
+    x, y, bw, bh = alpha_box
+    corners = np.array([[x, y, 1], [x + bw, y, 1], [x, y + bh, 1], [x + bw, y + bh, 1]], dtype=np.float64)
+    mapped = corners @ matrix.T
+    x0, y0 = np.maximum(np.floor(mapped.min(axis=0)).astype(int), 0)
+    x1, y1 = np.minimum(np.ceil(mapped.max(axis=0)).astype(int), [out_w, out_h])
+    if x1 <= x0 or y1 <= y0:
+        return
+    shifted = matrix.copy()
+    shifted[:, 2] -= (x0, y0)
+    size = (int(x1 - x0), int(y1 - y0))
+    front = cv2.warpAffine(image_rgb, shifted, size, flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+    weight = cv2.warpAffine(alpha, shifted, size, flags=cv2.INTER_LINEAR)
+    back = frame[y0:y1, x0:x1]
+    # back + (front - back) * weight / 255, số nguyên 16 bit
+    delta = cv2.subtract(front, back, dtype=cv2.CV_16S)
+    delta = cv2.multiply(delta, cv2.merge([weight, weight, weight]), scale=1 / 255, dtype=cv2.CV_16S)
+    frame[y0:y1, x0:x1] = cv2.add(back, delta, dtype=cv2.CV_8U)
+
+
+def render_frames(image_rgb: np.ndarray, plan: Dict[str, Any], out_size: Tuple[int, int],
+                  alpha: Optional[np.ndarray] = None):
+    """Sinh lần lượt từng frame (uint8 RGB, kích thước out_size)"""
+    foreground = plan.get("foreground")
+    regions = alpha_regions(alpha) if foreground is not None and alpha is not None else []
+    for i, matrix in enumerate(plan["matrices"]):
+        # Quỹ đạo đã kẹp trong ảnh nên không lộ viền: BORDER_REPLICATE chỉ cho pixel sát mép
+        frame = cv2.warpAffine(image_rgb, matrix, out_size, flags=cv2.INTER_LINEAR,
+                               borderMode=cv2.BORDER_REPLICATE)
+        for region in regions:
+            _blend_foreground(frame, image_rgb, foreground[i], alpha, region)
+        yield frame
+
+
+def prepare_motion(image_rgb: np.ndarray, params: Dict[str, Any], out_size: Tuple[int, int],
+                   frames: int) -> Dict[str, Any]:
+    """
+    Chuẩn bị một clip: ảnh nguồn đã thu nhỏ, quỹ đạo (plan_motion) và alpha lớp trước.
+    Trả về {"image", "plan", "alpha"}; frame lấy bằng render_frames(image, plan, out_size, alpha)
+    """
+    h, w = image_rgb.shape[:2]
+    zoom = float(params.get('zoom') or KENBURNS_ZOOM)
+
+    # Thu nhỏ ảnh nguồn về độ phân giải cần ở mức zoom lớn nhất
+    needed = min(1.0, max(out_size[0] / w, out_size[1] / h) * max(zoom, 1.0))
+    if needed < 1.0:
+        image_rgb = cv2.resize(image_rgb, (max(1, int(round(w * needed))), max(1, int(round(h * needed)))),
+                               interpolation=cv2.INTER_AREA)
+
+    focus_mode = params.get('focus', 'auto')
+    boxes = [[v * needed for v in box] for box in params.get('focusBoxes') or []] \
+        if focus_mode in ('auto', 'boxes') else []
+    if focus_mode == 'faces' or (focus_mode == 'auto' and not boxes):
+        boxes += detect_faces(image_rgb)
+    src_size = (image_rgb.shape[1], image_rgb.shape[0])
+
+    plan = plan_motion(params.get('motion', 'auto'), src_size, out_size, frames, zoom, focus_point(boxes))
+    alpha = foreground_alpha(image_rgb.shape, boxes) if plan["foreground"] is not None else None
+    return {"image": image_rgb, "plan": plan, "alpha": alpha}
+
+
+def render_clip(image_rgb: np.ndarray, output_path: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Render một clip Ken Burns ra `output_path`. Trả về thông tin file (xem video_writer.VideoWriter.close)"""
+    h, w = image_rgb.shape[:2]
+    out_size = output_size(w, h, params)
+    fps = params.get('fps') or KENBURNS_FPS
+    frames = max(2, int(round(float(params.get('duration') or KENBURNS_DURATION) * fps)))
+    motion = prepare_motion(image_rgb, params, out_size, frames)
+    with VideoWriter(output_path, fps, codec=params.get('codec'), crf=params.get('crf'),
+                     preset=params.get('preset') or KENBURNS_PRESET) as writer:
+        for frame in render_frames(motion["image"], motion["plan"], out_size, motion["alpha"]):
+            writer.write(frame)
+    info = dict(writer.info)
+    info["motion"] = motion["plan"]["motion"]
+    return info
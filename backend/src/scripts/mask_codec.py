@@ -0,0 +1,186 @@
+"""
+Format gọn để truyền mask / polygon giữa các script (bubble_detector, panel_inpainter, text_detector)
+thay cho danh sách điểm [{"x", "y"}, ...] hay ảnh PNG base64.
+
+- RLE kiểu COCO: mask nhị phân (H, W) duyệt theo cột, độ dài các đoạn 0/1 xen kẽ (bắt đầu bằng đoạn 0),
+  nén thành chuỗi ASCII giống pycocotools (`{"size": [h, w], "counts": "..."}`), đọc được bằng
+  pycocotools.mask.decode
+- Polygon delta: điểm đầu + hiệu tọa độ giữa các điểm liên tiếp, mã hóa cùng bảng ký tự của RLE
+
+Mã hóa số (giống rleToString của COCO): mỗi số chia thành các nhóm 5 bit từ thấp lên cao, bit 0x20 báo
+còn nhóm tiếp theo, bit 0x10 của nhóm cuối là dấu; ký tự = nhóm + 48. Encode / decode đều vector hóa
+bằng NumPy (không lặp Python theo từng số) và round-trip chính xác.
+"""
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+# Số nhóm 5 bit tối đa cho một số int64
+_MAX_GROUPS = 13
+
+
+# --- Mã hóa dãy số nguyên thành chuỗi ---
+def _encode_chars(values) -> tuple:
+    """-> (bytes ký tự của mọi số, số ký tự của từng số)"""
+    x = np.asarray(values, dtype=np.int64).ravel()
+    shifts = 5 * np.arange(_MAX_GROUPS, dtype=np.int64)
+    groups = (x[:, None] >> shifts) & 0x1f                     # (N, G)
+    rest = x[:, None] >> np.minimum(shifts + 5, 63)            # phần còn lại sau mỗi nhóm
+    more = np.where(groups & 0x10, rest != -1, rest != 0)      # còn nhóm sau không
+    # Nhóm k được ghi nếu mọi nhóm trước đó đều báo "còn"
+    emitted = np.ones_like(more)
+    emitted[:, 1:] = np.cumprod(more[:, :-1], axis=1).astype(bool)
+    chars = groups | np.where(more, 0x20, 0)
+    return (chars[emitted] + 48).astype(np.uint8).tobytes(), emitted.sum(axis=1)
+
+
+def ints_to_string(values: Sequence[int]) -> str:
+    if np.size(values) == 0:
+        return ''
+    return _encode_chars(values)[0].decode('ascii')
+
+
+def _decode_chars(c: np.ndarray) -> tuple:
+    """Mảng ký tự (đã trừ 48) -> (các số, vị trí ký tự cuối của từng số)"""
+    last = (c & 0x20) == 0                                     # nhóm cuối của mỗi số
+    ends = np.flatnonzero(last)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    # Vị trí của nhóm trong số của nó
+    position = np.arange(len(c)) - np.repeat(starts, ends - starts + 1)
+    values = np.add.reduceat((c & 0x1f) << (5 * position), starts)
+    # Số âm: bit dấu ở nhóm cuối -> mở rộng dấu
+    negative = (c[ends] & 0x10) != 0
+    values[negative] -= np.left_shift(1, 5 * (ends[negative] - starts[negative] + 1))
+    return values, ends
+
+
+def string_to_ints(text: str) -> np.ndarray:
+    if not text:
+        return np.zeros(0, dtype=np.int64)
+    c = np.frombuffer(text.encode('ascii'), dtype=np.uint8).astype(np.int64) - 48
+    return _decode_chars(c)[0]
+
+
+# --- RLE ---
+def rle_counts(mask: np.ndarray) -> np.ndarray:
+    """Mask nhị phân (H, W) -> độ dài các đoạn 0/1 xen kẽ theo thứ tự cột, bắt đầu bằng đoạn 0"""
+    flat = np.asarray(mask, dtype=bool).ravel(order='F')
+    if flat.size == 0:
+        return np.zeros(0, dtype=np.int64)
+    change = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    counts = np.diff(np.concatenate(([0], change, [flat.size])))
+    return np.concatenate(([0], counts)) if flat[0] else counts
+
+
+def mask_from_counts(counts: Sequence[int], shape) -> np.ndarray:
+    counts = np.asarray(counts, dtype=np.int64)
+    values = np.zeros(len(counts), dtype=np.uint8)
+    values[1::2] = 1
+    return np.repeat(values, counts).reshape(tuple(shape), order='F')
+
+
+def counts_to_string(counts: Sequence[int]) -> str:
+    """Nén counts như pycocotools: từ phần tử thứ 4 lưu hiệu với phần tử cách 2 vị trí"""
+    x = np.asarray(counts, dtype=np.int64).copy()
+    if len(x) > 3:
+        x[3:] -= np.asarray(counts, dtype=np.int64)[1:-2]
+    return ints_to_string(x)
+
+
+def string_to_counts(text: str) -> np.ndarray:
+    x = string_to_ints(text)
+    counts = x.copy()
+    # counts[i] = x[i] + counts[i - 2] với i > 2: cộng dồn riêng chuỗi chẵn (từ 2) và lẻ (từ 1)
+    if len(x) > 3:
+        counts[2::2] = np.cumsum(x[2::2])
+        counts[1::2] = np.cumsum(x[1::2])
+    return counts
+
+
+def encode_rle(mask: np.ndarray) -> Dict[str, Any]:
+    h, w = mask.shape[:2]
+    return {"size": [int(h), int(w)], "counts": counts_to_string(rle_counts(mask))}
+
+
+def decode_rle(rle: Dict[str, Any]) -> np.ndarray:
+    """-> mask uint8 0/1 (H, W). `counts` có thể là chuỗi nén hoặc list số (RLE chưa nén)"""
+    counts = rle["counts"]
+    counts = string_to_counts(counts) if isinstance(counts, str) else counts
+    return mask_from_counts(counts, rle["size"])
+
+
+# --- Polygon delta ---
+def encode_polygon(points) -> str:
+    """Điểm (N, 2) số nguyên -> chuỗi: x0, y0, dx1, dy1, ..."""
+    pts = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+    if len(pts) == 0:
+        return ''
+    deltas = np.diff(pts, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+    return ints_to_string(deltas)
+
+
+def decode_polygon(text: str) -> np.ndarray:
+    return np.cumsum(string_to_ints(text).reshape(-1, 2), axis=0)
+
+
+def encode_polygons(polygons: Sequence) -> List[str]:
+    """encode_polygon cho nhiều polygon trong một lượt vector hóa (tránh chi phí NumPy cho từng polygon nhỏ)"""
+    arrays = [np.asarray(p, dtype=np.int64).reshape(-1, 2) for p in polygons]
+    if not arrays:
+        return []
+    lengths = np.array([len(a) for a in arrays])
+    pts = np.concatenate(arrays) if lengths.sum() else np.zeros((0, 2), dtype=np.int64)
+    deltas = np.diff(pts, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+    # Điểm đầu của mỗi polygon lưu tọa độ tuyệt đối
+    firsts = np.cumsum(lengths) - lengths
+    firsts = firsts[lengths > 0]
+    deltas[firsts] = pts[firsts]
+    if not len(deltas):
+        return ['' for _ in arrays]
+    chars, per_value = _encode_chars(deltas)
+    # Ranh giới ký tự của từng polygon
+    char_ends = np.concatenate(([0], np.cumsum(per_value)))[np.cumsum(lengths) * 2].tolist()
+    text = chars.decode('ascii')
+    starts = [0] + char_ends[:-1]
+    return [text[a:b] for a, b in zip(starts, char_ends)]
+
+
+def decode_polygons(texts: Sequence[str]) -> List[np.ndarray]:
+    """decode_polygon cho nhiều chuỗi trong một lượt vector hóa"""
+    if not texts:
+        return []
+    joined = ''.join(texts)
+    if not joined:
+        return [np.zeros((0, 2), dtype=np.int64) for _ in texts]
+    c = np.frombuffer(joined.encode('ascii'), dtype=np.uint8).astype(np.int64) - 48
+    values, ends = _decode_chars(c)
+    # Số lượng số trong từng chuỗi = số ký tự kết thúc nằm trong đoạn của chuỗi đó
+    bounds = np.cumsum([len(t) for t in texts])
+    counts = np.diff(np.concatenate(([0], np.searchsorted(ends, bounds - 1, side='right'))))
+    deltas = values.reshape(-1, 2)
+    points = np.cumsum(deltas, axis=0)
+    # Cộng dồn riêng cho từng polygon: trừ tổng tích lũy trước điểm đầu của nó
+    point_counts = counts // 2
+    firsts = np.cumsum(point_counts) - point_counts
+    offsets = np.repeat(np.vstack((np.zeros((1, 2), dtype=np.int64), points))[firsts], point_counts, axis=0)
+    points = points - offsets
+    return np.split(points, np.cumsum(point_counts)[:-1])
+
+
+def vertices_to_polygon(vertices: Sequence[Dict[str, Any]]) -> str:
+    """[{"x", "y"}, ...] (Vision có thể bỏ field bằng 0) -> chuỗi polygon"""
+    return encode_polygon([[v.get('x', 0), v.get('y', 0)] for v in vertices])
+
+
+def polygon_to_vertices(text: str) -> List[Dict[str, int]]:
+    return [{"x": x, "y": y} for x, y in decode_polygon(text).tolist()]
+
+
+def polygon_points(item: Dict[str, Any], key: str = 'points') -> np.ndarray:
+    """Đọc điểm của bubble / textBlock ở cả hai dạng: chuỗi "polygon" hoặc danh sách điểm"""
+    if isinstance(item.get('polygon'), str):
+        return decode_polygon(item['polygon'])
+    raw = item.get(key) or []
+    if raw and isinstance(raw[0], dict):
+        return np.array([[v.get('x', 0), v.get('y', 0)] for v in raw], dtype=np.int64)
+    return np.asarray(raw, dtype=np.int64).reshape(-1, 2)
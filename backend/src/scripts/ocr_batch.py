@@ -0,0 +1,72 @@
+"""
+Lớp OCR theo batch: gom nhiều trang / panel crop của một chapter, gửi theo từng batch
+(batchAnnotateImages) với giới hạn số request song song, retry + backoff khi bị giới hạn quota,
+rồi trả kết quả về đúng key của từng ảnh.
+"""
+import sys
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Hashable, Tuple
+
+from ocr_client import OCRBridgeError
+
+# Vision API cho tối đa 16 ảnh mỗi batchAnnotateImages
+MAX_BATCH_SIZE = 16
+# Mã lỗi coi là "throttling": gRPC RESOURCE_EXHAUSTED / UNAVAILABLE, HTTP 429 / 503
+RETRYABLE_CODES = {8, 14, 429, 503, 'RESOURCE_EXHAUSTED', 'UNAVAILABLE'}
+
+
+class BatchOCR:
+    def __init__(self, client, batch_size: int = 8, concurrency: int = 4,
+                 max_retries: int = 5, base_delay: float = 0.5, max_delay: float = 8.0):
+        self.client = client
+        self.batch_size = max(1, min(int(batch_size), MAX_BATCH_SIZE))
+        self.concurrency = max(1, int(concurrency))
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def _annotate_with_retry(self, images: List[bytes]) -> List[Dict[str, Any]]:
+        attempt = 0
+        while True:
+            try:
+                return self.client.annotate_batch(images)
+            except OCRBridgeError as e:
+                if e.code not in RETRYABLE_CODES or attempt >= self.max_retries:
+                    raise
+                # Exponential backoff + jitter
+                delay = min(self.max_delay, self.base_delay * (2 ** attempt)) * (0.5 + random.random() / 2)
+                attempt += 1
+                print(f"[PY] OCR batch throttled (code={e.code}), retry {attempt}/{self.max_retries} sau {delay:.2f}s", file=sys.stderr)
+                time.sleep(delay)
+
+    def run(self, items: List[Tuple[Hashable, bytes]]) -> Dict[Hashable, Dict[str, Any]]:
+        """
+        items: danh sách (key, image_bytes). Trả về {key: response}, response có dạng
+        {"success": bool, "textBlocks": [...], "error": ...} giống bridge.
+        """
+        batches = [items[i:i + self.batch_size] for i in range(0, len(items), self.batch_size)]
+        print(f"[PY] OCR {len(items)} ảnh trong {len(batches)} batch (size={self.batch_size}, concurrency={self.concurrency})", file=sys.stderr)
+
+        results: Dict[Hashable, Dict[str, Any]] = {}
+
+        def process(batch):
+            keys = [key for key, _ in batch]
+            try:
+                responses = self._annotate_with_retry([image for _, image in batch])
+            except OCRBridgeError as e:
+                responses = [{"success": False, "error": str(e), "textBlocks": []}] * len(batch)
+            if len(responses) != len(keys):
+                # Bridge trả thiếu: ảnh không có response bị đánh dấu lỗi (không vào cache, lần sau OCR lại)
+                print(f"[PY][WARNING] OCR batch trả về {len(responses)} response cho {len(keys)} ảnh", file=sys.stderr)
+                missing = {"success": False, "error": "Bridge không trả về kết quả cho ảnh này", "textBlocks": []}
+                responses = list(responses[:len(keys)]) + [missing] * (len(keys) - len(responses))
+            return keys, responses
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for keys, responses in pool.map(process, batches):
+                for key, response in zip(keys, responses):
+                    results[key] = response
+
+        return results
@@ -0,0 +1,39 @@
+"""
+Cache kết quả OCR thô (`textBlocks`, tọa độ trên ảnh gửi đi) theo nội dung ảnh + phiên bản engine.
+
+Tọa độ panel không nằm trong key: sửa panel rồi chạy lại text detection chỉ phải làm lại
+bước gán text vào panel (rẻ), không gọi OCR nữa.
+
+Biến môi trường:
+    OCR_CACHE_DIR       Thư mục cache (mặc định scripts/cache/ocr)
+    OCR_CACHE_TTL       Thời gian sống (giây), mặc định 7 ngày
+    OCR_CACHE_MAX_MB    Dung lượng tối đa, mặc định 500MB
+    OCR_CACHE_DISABLED  Đặt "1" để tắt cache
+"""
+import os
+from typing import Optional
+
+from disk_cache import DiskCache, DEFAULT_CACHE_ROOT, hash_bytes
+
+# Tăng khi đổi format textBlocks để cache cũ tự vô hiệu
+OCR_CACHE_FORMAT = 'ocr-textblocks-v1'
+
+_cache: Optional[DiskCache] = None
+
+
+def get_ocr_cache() -> DiskCache:
+    global _cache
+    if _cache is None:
+        _cache = DiskCache(
+            os.environ.get('OCR_CACHE_DIR', os.path.join(DEFAULT_CACHE_ROOT, 'ocr')),
+            version=OCR_CACHE_FORMAT,
+            ttl_seconds=float(os.environ.get('OCR_CACHE_TTL', 7 * 24 * 3600)),
+            max_bytes=int(float(os.environ.get('OCR_CACHE_MAX_MB', 500)) * 1024 * 1024),
+            enabled=os.environ.get('OCR_CACHE_DISABLED') != '1',
+        )
+    return _cache
+
+
+def ocr_cache_key(image_bgr, engine_version: str) -> str:
+    """Key = hash pixel ảnh (không phụ thuộc encoder JPEG) + phiên bản engine OCR"""
+    return hash_bytes(engine_version, image_bgr)
@@ -0,0 +1,227 @@
+"""
+OCR client sống lâu trong process Python.
+
+Thay vì mỗi trang ghi file tạm rồi spawn `node vision_text_detector.js` (tốn Node startup,
+tạo client, bắt tay TLS), ta mở `vision_bridge.js` MỘT lần và gửi ảnh từ bộ nhớ qua stdin
+theo giao thức NDJSON. Bridge giữ nguyên client/kết nối giữa các request.
+
+Biến môi trường:
+    OCR_BRIDGE_CMD      Lệnh thay thế để mở bridge (vd: "python ocr_stub_server.py" khi test)
+    OCR_BRIDGE_TIMEOUT  Timeout mỗi request (giây), mặc định 30
+"""
+import sys
+import os
+import json
+import base64
+import shlex
+import atexit
+import itertools
+import threading
+import subprocess
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Dict, Any, List, Optional, Tuple
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+BRIDGE_SCRIPT_PATH = os.path.join(CURRENT_DIR, 'vision_bridge.js')
+DEFAULT_TIMEOUT = float(os.environ.get('OCR_BRIDGE_TIMEOUT', 30))
+# Phiên bản engine (feature Vision + logic gom chữ trong vision_text_detector.js), dùng làm key cache
+VISION_ENGINE_VERSION = 'google-vision:DOCUMENT_TEXT_DETECTION:group-blocks-v1'
+
+
+class OCRBridgeError(RuntimeError):
+    """Lỗi từ bridge (process chết, timeout, Vision API trả lỗi)"""
+
+    def __init__(self, message: str, code: Any = None):
+        super().__init__(message)
+        self.code = code
+
+
+class _BridgeProcess:
+    """Một process bridge cùng các request đang chờ và trạng thái khởi động của riêng nó"""
+
+    def __init__(self, proc: subprocess.Popen):
+        self.proc = proc
+        self.pending: Dict[int, Future] = {}
+        self.ready = threading.Event()
+        self.error: Optional[str] = None
+
+
+class VisionBridgeClient:
+    """
+    Giữ một process bridge mở và ghép request/response theo `id`.
+    Request đang chờ gắn với process đã nhận nó: reader của process cũ (sau close() + start())
+    không đụng tới request / trạng thái ready của process mới.
+    """
+
+    def __init__(self, credentials_path: str, command: Optional[List[str]] = None, timeout: float = DEFAULT_TIMEOUT):
+        self.credentials_path = credentials_path
+        self.command = command or self._default_command(credentials_path)
+        self.timeout = timeout
+        self._bridge: Optional[_BridgeProcess] = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _default_command(credentials_path: str) -> List[str]:
+        override = os.environ.get('OCR_BRIDGE_CMD')
+        if override:
+            return shlex.split(override) + [credentials_path]
+        return ['node', BRIDGE_SCRIPT_PATH, credentials_path]
+
+    # --- VÒNG ĐỜI PROCESS ---
+    def start(self):
+        with self._lock:
+            if self._bridge is not None and self._bridge.proc.poll() is None:
+                bridge = self._bridge
+            else:
+                bridge = self._spawn()
+        if not bridge.ready.wait(self.timeout):
+            self.close(bridge)
+            raise OCRBridgeError("OCR bridge không khởi động kịp")
+        if bridge.error:
+            self.close(bridge)
+            raise OCRBridgeError(f"OCR bridge không khởi động được: {bridge.error}")
+
+    def _spawn(self) -> _BridgeProcess:
+        """Mở process bridge mới (gọi khi đang giữ _lock)"""
+        print(f"[PY] Starting OCR bridge: {' '.join(self.command)}", file=sys.stderr)
+        proc = subprocess.Popen(
+            self.command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=sys.stderr,
+            cwd=CURRENT_DIR,
+            encoding='utf-8',
+            errors='replace',
+            bufsize=1,
+        )
+        self._bridge = _BridgeProcess(proc)
+        threading.Thread(target=self._read_loop, args=(self._bridge,), daemon=True).start()
+        return self._bridge
+
+    def close(self, bridge: Optional[_BridgeProcess] = None):
+        """Đóng process hiện tại (hoặc `bridge` nếu nó vẫn là process hiện tại)"""
+        with self._lock:
+            if bridge is not None and bridge is not self._bridge:
+                return
+            bridge, self._bridge = self._bridge, None
+        if bridge is None:
+            return
+        proc = bridge.proc
+        try:
+            proc.stdin.close()
+            proc.wait(timeout=5)
+        except Exception:
+            proc.kill()
+
+    def _read_loop(self, bridge: _BridgeProcess):
+        for line in bridge.proc.stdout:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                message = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"[PY][ERROR] OCR bridge trả về dòng lỗi: {line[:200]!r}", file=sys.stderr)
+                continue
+
+            if 'ready' in message:
+                # {"ready": false, "error": ...}: bridge không khởi động được (thiếu tham số, credentials...)
+                if message.get('ready') is not True:
+                    bridge.error = message.get('error') or 'unknown error'
+                bridge.ready.set()
+                continue
+
+            with self._lock:
+                future = bridge.pending.pop(message.get('id'), None)
+            if future is not None and not future.done():
+                future.set_result(message)
+
+        # Process kết thúc => hủy các request còn treo của process này
+        if not bridge.ready.is_set():
+            bridge.error = 'OCR bridge đã thoát'
+            bridge.ready.set()
+        self._fail_pending(bridge, OCRBridgeError("OCR bridge đã thoát"))
+
+    def _fail_pending(self, bridge: _BridgeProcess, error: Exception):
+        with self._lock:
+            pending, bridge.pending = bridge.pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+    # --- GỬI REQUEST ---
+    def submit(self, image_bytes: bytes) -> Future:
+        """Gửi ảnh (bytes đã encode JPEG/PNG) và trả về Future chứa response của bridge."""
+        return self._send({"image": base64.b64encode(image_bytes).decode('ascii')})[1]
+
+    def submit_batch(self, images: List[bytes]) -> Future:
+        """Gửi nhiều ảnh trong một request batchAnnotateImages."""
+        return self._send({"images": [base64.b64encode(image).decode('ascii') for image in images]})[1]
+
+    def _send(self, payload: Dict[str, Any]) -> Tuple[Tuple[_BridgeProcess, int], Future]:
+        """Trả về ((process, id), future); (process, id) dùng để bỏ request khỏi pending khi timeout"""
+        self.start()
+        request_id = next(self._ids)
+        future = Future()
+        line = json.dumps({"id": request_id, **payload})
+        with self._lock:
+            bridge = self._bridge
+            if bridge is None:
+                raise OCRBridgeError("OCR bridge đã bị đóng")
+            bridge.pending[request_id] = future
+            try:
+                bridge.proc.stdin.write(line + '\n')
+                bridge.proc.stdin.flush()
+            except (BrokenPipeError, OSError, ValueError) as e:
+                bridge.pending.pop(request_id, None)
+                raise OCRBridgeError(f"Không gửi được request tới OCR bridge: {e}")
+        return (bridge, request_id), future
+
+    def _wait(self, request, future: Future, timeout: Optional[float], message: str) -> Dict[str, Any]:
+        try:
+            return future.result(timeout or self.timeout)
+        except FutureTimeoutError:
+            # Response tới muộn sẽ không tìm thấy request trong pending và bị bỏ qua
+            bridge, request_id = request
+            with self._lock:
+                bridge.pending.pop(request_id, None)
+            raise OCRBridgeError(message)
+
+    def annotate(self, image_bytes: bytes, timeout: Optional[float] = None) -> Dict[str, Any]:
+        request, future = self._send({"image": base64.b64encode(image_bytes).decode('ascii')})
+        response = self._wait(request, future, timeout, "Vision API call timeout")
+
+        if not response.get('success', False):
+            raise OCRBridgeError(f"Vision API call failed: {response.get('error')}", response.get('code'))
+        return response
+
+    def annotate_batch(self, images: List[bytes], timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Trả về danh sách response theo thứ tự ảnh; lỗi riêng từng ảnh nằm trong phần tử tương ứng."""
+        request, future = self._send({"images": [base64.b64encode(image).decode('ascii') for image in images]})
+        response = self._wait(request, future, timeout, "Vision API batch call timeout")
+
+        if not response.get('success', False):
+            raise OCRBridgeError(f"Vision API batch call failed: {response.get('error')}", response.get('code'))
+        return response.get('responses', [])
+
+
+# --- SINGLETON CHO CẢ PROCESS ---
+_clients: Dict[str, VisionBridgeClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_bridge(credentials_path: str) -> VisionBridgeClient:
+    """Trả về bridge dùng chung (mỗi credentials một process), tự đóng khi thoát."""
+    with _clients_lock:
+        client = _clients.get(credentials_path)
+        if client is None:
+            client = VisionBridgeClient(credentials_path)
+            _clients[credentials_path] = client
+        return client
+
+
+@atexit.register
+def _close_all():
+    for client in list(_clients.values()):
+        client.close()
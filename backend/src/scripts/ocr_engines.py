@@ -0,0 +1,204 @@
+"""
+Engine OCR cho text_detector.py. Mọi engine trả về cùng schema với vision_text_detector.js:
+    [{"text": str, "vertices": [{"x": int, "y": int} x 4]}, ...]   (tọa độ trên ảnh đầu vào)
+
+- VisionEngine    : Google Cloud Vision qua OCR bridge (mặc định)
+- TesseractEngine : chạy offline trên CPU (pytesseract + gói ngôn ngữ `vie`), chia trang thành
+                    các dải ngang tại hàng trống và OCR song song trên nhiều core
+
+Chọn engine: tham số `--engine` / field "engine" trong request, hoặc biến môi trường OCR_ENGINE.
+"""
+import os
+import sys
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Hashable, Tuple, Optional
+
+import cv2
+import numpy as np
+
+from ocr_client import get_bridge, VISION_ENGINE_VERSION
+from ocr_batch import BatchOCR
+
+try:
+    import pytesseract
+    TESSERACT_AVAILABLE = True
+except ImportError:
+    TESSERACT_AVAILABLE = False
+
+DEFAULT_ENGINE = os.environ.get('OCR_ENGINE', 'vision')
+
+
+def encode_jpeg(image_bgr: np.ndarray) -> bytes:
+    """Encode ảnh thành JPEG bytes (gửi thẳng cho OCR, không cần file tạm)"""
+    ok, buffer = cv2.imencode('.jpg', image_bgr, [int(cv2.IMWRITE_JPEG_QUALITY), 90])
+    if not ok:
+        raise ValueError("Lỗi encode ảnh")
+    return buffer.tobytes()
+
+
+class OCREngine(ABC):
+    """Interface chung. `version` được dùng làm key cache, đổi khi output có thể thay đổi."""
+    name = 'base'
+    version = 'base'
+
+    @abstractmethod
+    def detect(self, image_bgr: np.ndarray) -> List[Dict[str, Any]]:
+        """OCR một ảnh BGR, trả về textBlocks (tọa độ trên ảnh đầu vào)"""
+
+    def close(self):
+        """Giải phóng tài nguyên giữ giữa các lần OCR (pool process...)"""
+
+    def detect_many(self, items: List[Tuple[Hashable, np.ndarray]], **options) -> Dict[Hashable, Dict[str, Any]]:
+        """OCR nhiều ảnh. Trả về {key: {"success": bool, "textBlocks": [...], "error": ...}}"""
+        results = {}
+        for key, image in items:
+            try:
+                results[key] = {"success": True, "textBlocks": self.detect(image)}
+            except Exception as e:
+                results[key] = {"success": False, "error": str(e), "textBlocks": []}
+        return results
+
+
+# --- GOOGLE CLOUD VISION (qua bridge) ---
+class VisionEngine(OCREngine):
+    name = 'vision'
+    version = VISION_ENGINE_VERSION
+
+    def __init__(self, credentials_path: str):
+        self.credentials_path = credentials_path
+
+    def detect(self, image_bgr: np.ndarray) -> List[Dict[str, Any]]:
+        # Qua BatchOCR để có cùng retry + backoff khi bị throttle như khi OCR nhiều ảnh
+        response = self.detect_many([(0, image_bgr)], batch_size=1, concurrency=1)[0]
+        if not response.get('success', False):
+            print(f"[PY][ERROR] Vision API call error: {response.get('error')}", file=sys.stderr)
+            raise RuntimeError(response.get('error', 'Vision API call failed'))
+        return response.get('textBlocks', [])
+
+    def detect_many(self, items, batch_size: int = 8, concurrency: int = 4, **options):
+        batch_ocr = BatchOCR(get_bridge(self.credentials_path), batch_size=batch_size, concurrency=concurrency)
+        return batch_ocr.run([(key, encode_jpeg(image)) for key, image in items])
+
+
+# --- TESSERACT (offline, CPU) ---
+def split_into_regions(image_bgr: np.ndarray, target_height: int = 1600, search: int = 240) -> List[Tuple[int, int]]:
+    """
+    Chia trang dài (webtoon) thành các dải ngang [y0, y1). Mỗi vết cắt được đặt tại hàng "trống"
+    nhất (ít biến thiên nhất) quanh bội số của target_height để không cắt ngang dòng chữ.
+    """
+    h = image_bgr.shape[0]
+    if h <= target_height + search:
+        return [(0, h)]
+
+    gray = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2GRAY) if image_bgr.ndim == 3 else image_bgr
+    row_activity = gray.astype(np.float32).std(axis=1)
+
+    cuts = [0]
+    while h - cuts[-1] > target_height + search:
+        lo = cuts[-1] + target_height - search
+        hi = min(cuts[-1] + target_height + search, h - 1)
+        cuts.append(lo + int(np.argmin(row_activity[lo:hi])))
+    cuts.append(h)
+    return list(zip(cuts[:-1], cuts[1:]))
+
+
+def _tesseract_region(args) -> List[Dict[str, Any]]:
+    """Chạy trong process con: OCR một dải ảnh, gom từ theo block của Tesseract"""
+    region_bgr, offset_y, lang, config, min_conf = args
+    rgb = cv2.cvtColor(region_bgr, cv2.COLOR_BGR2RGB)
+    data = pytesseract.image_to_data(rgb, lang=lang, config=config, output_type=pytesseract.Output.DICT)
+
+    blocks: Dict[Tuple[int, int], Dict[str, Any]] = {}
+    for i, word in enumerate(data['text']):
+        word = (word or '').strip()
+        if not word or float(data['conf'][i]) < min_conf:
+            continue
+        key = (data['page_num'][i], data['block_num'][i])
+        x, y, w, h = data['left'][i], data['top'][i] + offset_y, data['width'][i], data['height'][i]
+        line = (data['par_num'][i], data['line_num'][i])
+        block = blocks.setdefault(key, {"lines": {}, "box": [x, y, x + w, y + h]})
+        block["lines"].setdefault(line, []).append(word)
+        box = block["box"]
+        box[0], box[1] = min(box[0], x), min(box[1], y)
+        box[2], box[3] = max(box[2], x + w), max(box[3], y + h)
+
+    text_blocks = []
+    for block in blocks.values():
+        text = "\n".join(" ".join(words) for _, words in sorted(block["lines"].items()))
+        x1, y1, x2, y2 = (int(v) for v in block["box"])
+        text_blocks.append({
+            "text": text,
+            "vertices": [{"x": x1, "y": y1}, {"x": x2, "y": y1}, {"x": x2, "y": y2}, {"x": x1, "y": y2}]
+        })
+    return text_blocks
+
+
+class TesseractEngine(OCREngine):
+    name = 'tesseract'
+
+    def __init__(self, lang: Optional[str] = None, psm: int = 11, min_conf: float = 40,
+                 workers: Optional[int] = None, region_height: int = 1600):
+        if not TESSERACT_AVAILABLE:
+            raise RuntimeError("Thiếu thư viện pytesseract (pip install pytesseract, cài tesseract-ocr + tesseract-ocr-vie)")
+        self.lang = lang or os.environ.get('TESSERACT_LANG', 'vie')
+        # psm 11: sparse text, hợp với chữ rải rác trong bong bóng thoại
+        self.config = f'--psm {psm}'
+        self.min_conf = min_conf
+        self.workers = workers or os.cpu_count() or 1
+        self.region_height = region_height
+        # Pool tạo một lần cho cả engine (lần đầu cần chạy song song), đóng trong close()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # Chế độ stream gọi detect từ nhiều thread cùng lúc: chỉ một thread được tạo pool
+        self._pool_lock = threading.Lock()
+        self.version = f"tesseract:{pytesseract.get_tesseract_version()}:{self.lang}:psm{psm}:conf{min_conf}"
+
+    def _jobs(self, image_bgr: np.ndarray):
+        return [(image_bgr[y0:y1], y0, self.lang, self.config, self.min_conf)
+                for y0, y1 in split_into_regions(image_bgr, self.region_height)]
+
+    def _run(self, jobs) -> List[List[Dict[str, Any]]]:
+        if len(jobs) == 1 or self.workers == 1:
+            return [_tesseract_region(job) for job in jobs]
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            pool = self._pool
+        return list(pool.map(_tesseract_region, jobs))
+
+    def close(self):
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def detect(self, image_bgr: np.ndarray) -> List[Dict[str, Any]]:
+        jobs = self._jobs(image_bgr)
+        print(f"[PY] Tesseract OCR: {len(jobs)} vùng, {min(self.workers, len(jobs))} process", file=sys.stderr)
+        return [block for region_blocks in self._run(jobs) for block in region_blocks]
+
+    def detect_many(self, items, **options):
+        # Gom các dải của mọi ảnh vào cùng một pool để tận dụng hết core
+        owners, jobs = [], []
+        for key, image in items:
+            for job in self._jobs(image):
+                owners.append(key)
+                jobs.append(job)
+
+        results = {key: {"success": True, "textBlocks": []} for key, _ in items}
+        try:
+            for key, region_blocks in zip(owners, self._run(jobs)):
+                results[key]["textBlocks"].extend(region_blocks)
+        except Exception as e:
+            return {key: {"success": False, "error": str(e), "textBlocks": []} for key, _ in items}
+        return results
+
+
+def get_engine(name: Optional[str] = None, credentials_path: Optional[str] = None) -> OCREngine:
+    name = (name or DEFAULT_ENGINE).lower()
+    if name == 'vision':
+        return VisionEngine(credentials_path)
+    if name == 'tesseract':
+        return TesseractEngine()
+    raise ValueError(f"OCR engine không hợp lệ: {name} (vision | tesseract)")
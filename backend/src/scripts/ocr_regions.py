@@ -0,0 +1,222 @@
+"""
+Tiền xử lý OCR theo vùng: thay vì gửi cả trang (webtoon dài, phần lớn là tranh) cho OCR,
+ta tìm các vùng có khả năng chứa chữ, ghép chúng thành vài ảnh mosaic nhỏ gọn, OCR mosaic,
+rồi đổi tọa độ chữ ngược về tọa độ trang.
+
+Nguồn vùng ứng viên:
+  - Polygon bong bóng thoại (output của bubble_detector.py, tọa độ trang) nếu có
+  - Bộ lọc nhanh MSER: các vùng cực trị ổn định có kích thước/tỉ lệ giống ký tự,
+    gom theo hàng bằng morphology, chỉ giữ cụm có đủ nhiều "ký tự"
+
+Nếu mosaic không nhỏ hơn trang (chữ rải khắp trang) thì quay về OCR cả trang: mosaic chiếm từ
+FALLBACK_AREA_RATIO diện tích trang trở lên, hoặc (từ COMPARE_AREA_RATIO) JPEG của mosaic không nhẹ hơn JPEG cả trang.
+"""
+import sys
+import time
+from typing import List, Dict, Any, Tuple, Sequence
+
+import cv2
+import numpy as np
+
+Box = Tuple[int, int, int, int]  # (x, y, w, h)
+
+# Chiều rộng ảnh dùng để chạy MSER (trang lớn được thu nhỏ trước)
+DETECT_WIDTH = 600
+# Tỉ lệ diện tích mosaic / trang: từ mức này quay về OCR cả trang luôn
+FALLBACK_AREA_RATIO = 0.8
+# Từ mức này mới encode cả trang để so kích thước payload (mosaic nhỏ hơn thì chắc chắn nhẹ hơn)
+COMPARE_AREA_RATIO = 0.3
+
+
+def _mser_text_boxes(image_bgr: np.ndarray, min_chars: int = 3) -> List[Box]:
+    h, w = image_bgr.shape[:2]
+    scale = min(1.0, DETECT_WIDTH / float(w))
+    gray = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2GRAY)
+    if scale < 1.0:
+        gray = cv2.resize(gray, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+
+    mser = cv2.MSER_create()
+    mser.setDelta(5)
+    mser.setMinArea(12)
+    mser.setMaxArea(2500)
+    _, bboxes = mser.detectRegions(gray)
+    if len(bboxes) == 0:
+        return []
+
+    # Lọc vector hóa: giữ các vùng có kích thước / tỉ lệ giống ký tự
+    bboxes = np.asarray(bboxes, dtype=np.int32)
+    bw, bh = bboxes[:, 2], bboxes[:, 3]
+    aspect = bw / np.maximum(bh, 1)
+    keep = (bh >= 5) & (bh <= 60) & (aspect >= 0.1) & (aspect <= 4.0)
+    bboxes = bboxes[keep]
+    if len(bboxes) == 0:
+        return []
+
+    # Vẽ ký tự lên mask rồi nối thành dòng / khối chữ
+    char_mask = np.zeros(gray.shape, dtype=np.uint8)
+    for x, y, bw_, bh_ in bboxes:
+        char_mask[y:y + bh_, x:x + bw_] = 255
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (15, 9))
+    block_mask = cv2.dilate(char_mask, kernel, iterations=1)
+
+    n, labels, stats, _ = cv2.connectedComponentsWithStats(block_mask, connectivity=8)
+    # Đếm số ký tự (tâm MSER) rơi vào mỗi cụm
+    centers_x = bboxes[:, 0] + bboxes[:, 2] // 2
+    centers_y = bboxes[:, 1] + bboxes[:, 3] // 2
+    char_counts = np.bincount(labels[centers_y, centers_x], minlength=n)
+
+    boxes = []
+    for label in range(1, n):
+        if char_counts[label] < min_chars:
+            continue
+        x, y, bw_, bh_ = stats[label, :4]
+        boxes.append((int(x / scale), int(y / scale), int(np.ceil(bw_ / scale)), int(np.ceil(bh_ / scale))))
+    return boxes
+
+
+def _polygon_boxes(polygons: Sequence[Sequence[Sequence[float]]]) -> List[Box]:
+    boxes = []
+    for points in polygons or []:
+        pts = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+        if len(pts) < 3:
+            continue
+        x, y, w, h = cv2.boundingRect(pts)
+        boxes.append((x, y, w, h))
+    return boxes
+
+
+def merge_boxes(boxes: List[Box], pad: int, width: int, height: int) -> List[Box]:
+    """Nới rộng mỗi box `pad` px, gộp các box chồng nhau cho đến khi ổn định"""
+    rects = [[max(0, x - pad), max(0, y - pad), min(width, x + w + pad), min(height, y + h + pad)] for x, y, w, h in boxes]
+    merged = True
+    while merged:
+        merged = False
+        rects.sort(key=lambda r: (r[1], r[0]))
+        out = []
+        for r in rects:
+            for o in out:
+                if r[0] <= o[2] and o[0] <= r[2] and r[1] <= o[3] and o[1] <= r[3]:
+                    o[0], o[1] = min(o[0], r[0]), min(o[1], r[1])
+                    o[2], o[3] = max(o[2], r[2]), max(o[3], r[3])
+                    merged = True
+                    break
+            else:
+                out.append(list(r))
+        rects = out
+    return [(x1, y1, x2 - x1, y2 - y1) for x1, y1, x2, y2 in rects if x2 > x1 and y2 > y1]
+
+
+def find_text_regions(image_bgr: np.ndarray, bubble_polygons=None, pad: int = 8) -> List[Box]:
+    h, w = image_bgr.shape[:2]
+    boxes = _polygon_boxes(bubble_polygons) + _mser_text_boxes(image_bgr)
+    return merge_boxes(boxes, pad, w, h)
+
+
+def pack_mosaics(image_bgr: np.ndarray, boxes: List[Box], max_width: int = 2048,
+                 max_height: int = 4096, gap: int = 24) -> List[Tuple[np.ndarray, List[Tuple[Box, int, int]]]]:
+    """
+    Xếp các vùng lên nền trắng theo kiểu "kệ" (shelf packing), vùng cao xếp trước.
+    `gap` px trắng giữa các vùng để OCR không nối chữ của hai vùng khác nhau.
+    Trả về [(mosaic_bgr, [(box_trang, mx, my), ...]), ...]
+    """
+    if not boxes:
+        return []
+    width = max(max_width, max(w for _, _, w, _ in boxes) + 2 * gap)
+    ordered = sorted(boxes, key=lambda b: -b[3])
+
+    sheets = []  # mỗi sheet: list placement
+    placements, cursor_x, cursor_y, shelf_h = [], gap, gap, 0
+    for box in ordered:
+        _, _, bw, bh = box
+        if cursor_x + bw + gap > width:
+            cursor_x, cursor_y, shelf_h = gap, cursor_y + shelf_h + gap, 0
+        if placements and cursor_y + bh + gap > max_height:
+            sheets.append(placements)
+            placements, cursor_x, cursor_y, shelf_h = [], gap, gap, 0
+        placements.append((box, cursor_x, cursor_y))
+        cursor_x += bw + gap
+        shelf_h = max(shelf_h, bh)
+    sheets.append(placements)
+
+    mosaics = []
+    for sheet in sheets:
+        used_w = max(mx + b[2] for b, mx, _ in sheet) + gap
+        used_h = max(my + b[3] for b, _, my in sheet) + gap
+        canvas = np.full((used_h, used_w, 3), 255, dtype=np.uint8)
+        for (x, y, bw, bh), mx, my in sheet:
+            canvas[my:my + bh, mx:mx + bw] = image_bgr[y:y + bh, x:x + bw]
+        mosaics.append((canvas, sheet))
+    return mosaics
+
+
+def map_blocks_to_page(blocks: List[Dict[str, Any]], placements: List[Tuple[Box, int, int]]) -> List[Dict[str, Any]]:
+    """Đổi tọa độ textBlocks trên mosaic về tọa độ trang (theo ô chứa tâm cụm chữ)"""
+    if not blocks or not placements:
+        return []
+    tiles = np.array([[mx, my, bw, bh] for (_, _, bw, bh), mx, my in placements], dtype=np.float64)
+    mapped = []
+    for block in blocks:
+        vertices = block.get('vertices', [])
+        if not vertices:
+            continue
+        vx = np.array([v.get('x', 0) for v in vertices], dtype=np.float64)
+        vy = np.array([v.get('y', 0) for v in vertices], dtype=np.float64)
+        cx, cy = vx.mean(), vy.mean()
+
+        # Ô chứa tâm; nếu tâm rơi vào khe trắng thì lấy ô gần nhất
+        dx = np.maximum(np.maximum(tiles[:, 0] - cx, 0), cx - (tiles[:, 0] + tiles[:, 2]))
+        dy = np.maximum(np.maximum(tiles[:, 1] - cy, 0), cy - (tiles[:, 1] + tiles[:, 3]))
+        tile = int(np.argmin(dx * dx + dy * dy))
+        (x, y, bw, bh), mx, my = placements[tile]
+
+        local_x = np.clip(vx - mx, 0, bw)
+        local_y = np.clip(vy - my, 0, bh)
+        mapped.append({
+            "text": block.get('text', ''),
+            "vertices": [{"x": int(px + x), "y": int(py + y)} for px, py in zip(local_x, local_y)]
+        })
+    return mapped
+
+
+def jpeg_size(image_bgr: np.ndarray) -> int:
+    ok, buffer = cv2.imencode('.jpg', image_bgr, [int(cv2.IMWRITE_JPEG_QUALITY), 90])
+    return len(buffer) if ok else 0
+
+
+def build_region_mosaics(image_bgr: np.ndarray, bubble_polygons=None):
+    """
+    Trả về (mosaics, stats) cho một trang; stats chứa số vùng và kích thước payload.
+    mosaics là None khi OCR cả trang lợi hơn (stats["mode"] = "full", stats["fallback"] = lý do)
+    """
+    t0 = time.time()
+    boxes = find_text_regions(image_bgr, bubble_polygons)
+    mosaics = pack_mosaics(image_bgr, boxes)
+    page_pixels = int(image_bgr.shape[0] * image_bgr.shape[1])
+    mosaic_pixels = int(sum(m.shape[0] * m.shape[1] for m, _ in mosaics))
+    stats = {
+        "mode": "regions",
+        "regions": len(boxes),
+        "mosaics": len(mosaics),
+        "regionPixels": int(sum(w * h for _, _, w, h in boxes)),
+        "mosaicPixels": mosaic_pixels,
+        "pagePixels": page_pixels,
+    }
+
+    area_ratio = mosaic_pixels / float(page_pixels or 1)
+    if area_ratio >= FALLBACK_AREA_RATIO:
+        stats.update({"mode": "full", "fallback": "area"})
+    else:
+        stats["payloadBytes"] = int(sum(jpeg_size(m) for m, _ in mosaics))
+        if area_ratio >= COMPARE_AREA_RATIO:
+            stats["fullPageBytes"] = jpeg_size(image_bgr)
+            if stats["payloadBytes"] >= stats["fullPageBytes"]:
+                stats.update({"mode": "full", "fallback": "bytes"})
+    stats["regionSearchMs"] = int((time.time() - t0) * 1000)
+
+    if stats["mode"] == "full":
+        print(f"[PY] OCR regions: {stats['regions']} vùng -> mosaic {area_ratio:.0%} diện tích trang, "
+              f"OCR cả trang ({stats['fallback']})", file=sys.stderr)
+        return None, stats
+    print(f"[PY] OCR regions: {stats['regions']} vùng -> {stats['mosaics']} mosaic, "
+          f"{stats['payloadBytes']} bytes ({area_ratio:.0%} diện tích trang)", file=sys.stderr)
+    return mosaics, stats
@@ -0,0 +1,118 @@
+"""
+Stub OCR server dùng để test / benchmark mà không cần Vision API hay credentials.
+
+Nói cùng giao thức NDJSON với vision_bridge.js nên có thể thay thế trực tiếp:
+    OCR_BRIDGE_CMD="python ocr_stub_server.py --latency-ms 150" python text_detector.py ...
+
+Chế độ --once mô phỏng CLI cũ `node vision_text_detector.js <image_path> <credentials_path>`
+(một process cho một ảnh) để so sánh trong bench_ocr.py.
+--throttle-every N trả lỗi RESOURCE_EXHAUSTED (code 8) cho mỗi request thứ N để test retry/backoff.
+
+Kết quả trả về: textBlocks trong file --fixture (nếu có), ngược lại một cụm chữ giả
+sinh từ hash của ảnh để output luôn ổn định.
+"""
+import sys
+import json
+import time
+import base64
+import hashlib
+import argparse
+import threading
+
+
+def fake_text_blocks(image_bytes, fixture):
+    if fixture is not None:
+        return fixture
+    digest = hashlib.sha1(image_bytes).hexdigest()[:8]
+    return [{
+        "text": f"STUB {digest}",
+        "vertices": [{"x": 10, "y": 10}, {"x": 110, "y": 10}, {"x": 110, "y": 50}, {"x": 10, "y": 50}]
+    }]
+
+
+def build_response(image_bytes, args, fixture):
+    if args.latency_ms > 0:
+        time.sleep(args.latency_ms / 1000.0)
+    blocks = fake_text_blocks(image_bytes, fixture)
+    return {"success": True, "textBlocks": blocks, "hasText": len(blocks) > 0}
+
+
+def serve(args, fixture):
+    write_lock = threading.Lock()
+    counter = {"requests": 0}
+
+    def write_line(obj):
+        with write_lock:
+            sys.stdout.write(json.dumps(obj, ensure_ascii=False) + '\n')
+            sys.stdout.flush()
+
+    def handle(request):
+        with write_lock:
+            counter["requests"] += 1
+            throttled = args.throttle_every > 0 and counter["requests"] % args.throttle_every == 0
+        try:
+            if throttled:
+                write_line({"id": request.get('id'), "success": False, "error": "Quota exceeded (stub)", "code": 8})
+            elif 'images' in request:
+                # Batch: một round trip cho nhiều ảnh, độ trễ tính một lần
+                images = [base64.b64decode(image) for image in request['images']]
+                if args.latency_ms > 0:
+                    time.sleep(args.latency_ms / 1000.0)
+                responses = []
+                for image_bytes in images:
+                    blocks = fake_text_blocks(image_bytes, fixture)
+                    responses.append({"success": True, "textBlocks": blocks, "hasText": len(blocks) > 0})
+                write_line({"id": request.get('id'), "success": True, "responses": responses})
+            else:
+                image_bytes = base64.b64decode(request.get('image', ''))
+                write_line({"id": request.get('id'), **build_response(image_bytes, args, fixture)})
+        except Exception as e:
+            write_line({"id": request.get('id'), "success": False, "error": str(e), "textBlocks": [], "hasText": False})
+
+    write_line({"ready": True})
+    workers = []
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        # Mỗi request một thread để mô phỏng nhiều request song song như bridge thật
+        worker = threading.Thread(target=handle, args=(request,), daemon=True)
+        worker.start()
+        workers.append(worker)
+    for worker in workers:
+        worker.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub OCR server (giao thức vision_bridge.js)")
+    parser.add_argument('--latency-ms', type=float, default=0, help="Độ trễ giả lập cho mỗi request")
+    parser.add_argument('--startup-ms', type=float, default=0, help="Độ trễ khởi động (mô phỏng Node + tạo client)")
+    parser.add_argument('--throttle-every', type=int, default=0, help="Giả lập lỗi quota cho mỗi request thứ N")
+    parser.add_argument('--fixture', help="File JSON chứa danh sách textBlocks trả về")
+    parser.add_argument('--once', action='store_true', help="Chế độ một ảnh / một process như vision_text_detector.js")
+    parser.add_argument('paths', nargs='*', help="[--once] <image_path> <credentials_path> | <credentials_path>")
+    args = parser.parse_args()
+
+    sys.stdout.reconfigure(encoding='utf-8')
+    fixture = None
+    if args.fixture:
+        with open(args.fixture, 'r', encoding='utf-8') as f:
+            fixture = json.load(f)
+
+    if args.startup_ms > 0:
+        time.sleep(args.startup_ms / 1000.0)
+
+    if args.once:
+        if not args.paths:
+            print(json.dumps({"success": False, "error": "Usage: --once <image_path> <credentials_path>"}))
+            sys.exit(1)
+        with open(args.paths[0], 'rb') as f:
+            image_bytes = f.read()
+        sys.stdout.write(json.dumps(build_response(image_bytes, args, fixture), ensure_ascii=False))
+        return
+
+    serve(args, fixture)
+
+
+if __name__ == '__main__':
+    main()
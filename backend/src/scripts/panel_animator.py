@@ -1,29 +1,60 @@
+"""
+Sinh video cho từng panel bằng Stable Video Diffusion (hoặc Ken Burns trên CPU), qua hàng đợi job SQLite
+(render_queue.py).
+
+Mỗi panel là một job: chạy lại sau khi crash thì tiếp tục từ job chưa xong, panel có cùng ảnh + tham số
+đã render (output tồn tại) thì bỏ qua. Model chỉ được tải khi còn job phải render.
+
+Frame sinh ra được encode thẳng ra file trong thư mục output (video_writer.py: ffmpeg qua pipe hoặc PyAV),
+kết quả chỉ trả về đường dẫn, dung lượng và thời lượng clip. Request có thể gửi kèm:
+    "outputDir": "...",                                  # thư mục chứa clip (hoặc --output-dir)
+    "video": {"codec": "libx264", "crf": 20, "fps": 7},   # mặc định cho mọi panel (panel có thể gửi fps riêng)
+    "videoOutput": "base64"                              # trả thêm videoBase64 như bản cũ
+    "engine": "svd" | "kenburns"                         # engine mặc định của request (panel có thể gửi riêng)
+
+Engine "kenburns" (ken_burns.py): zoom / pan / parallax trên CPU, không tải model. Panel gửi kèm
+"motion", "zoom", "duration", "focus"; hộp bong bóng ("bubbles") / textBlocks của panel là điểm hướng tới.
+
+Usage:
+    python panel_animator.py request.json [--batch ID] [--output-dir DIR]   # thêm job, render hết batch
+    python panel_animator.py --worker [--batch ID] [--output-dir DIR]        # chỉ chạy worker cho các job đang chờ
+    python panel_animator.py --status [ID]                # tiến độ các batch (JSON)
+    python panel_animator.py --retry-failed [ID]          # đưa job đã lỗi quá số lần thử về hàng đợi
+"""
 import sys
 import json
 import base64
 import os
 import io
-import torch
-import tempfile
+import socket
 import warnings
+import numpy as np
 from PIL import Image
 
+from disk_cache import hash_bytes
+from render_queue import RenderQueue
+from video_writer import VIDEO_CODEC, VIDEO_CRF, VideoWriter
+import ken_burns
+
 # Tắt các cảnh báo không cần thiết
 warnings.filterwarnings("ignore")
 
 # --- ÁP DỤNG HƯỚNG DẪN TỪ HUGGING FACE ---
-try:
-    # Dùng DiffusionPipeline như hướng dẫn để tự động load cấu hình chuẩn
-    from diffusers import DiffusionPipeline 
-    from diffusers.utils import export_to_video
-    DIFFUSERS_AVAILABLE = True
-except ImportError:
-    DIFFUSERS_AVAILABLE = False
-
 MODEL_ID = "stabilityai/stable-video-diffusion-img2vid-xt"
+# Tham số render mặc định (thuộc key của job: đổi tham số là render lại)
+DEFAULT_PARAMS = {"model": MODEL_ID, "steps": 10, "seed": 42, "fps": 7, "motionBucketId": 127, "decodeChunkSize": 1,
+                  "codec": VIDEO_CODEC, "crf": VIDEO_CRF}
+# Engine mặc định khi request / panel không chọn: "svd" (Stable Video Diffusion) hoặc "kenburns" (CPU)
+ANIMATE_ENGINE = os.environ.get('ANIMATE_ENGINE', 'svd')
+ENGINES = ('svd', 'kenburns')
 
 def load_model():
-    if not DIFFUSERS_AVAILABLE:
+    # diffusers / torch chỉ được import khi thật sự phải render (--status, job đã có output không cần)
+    try:
+        import torch
+        # Dùng DiffusionPipeline như hướng dẫn để tự động load cấu hình chuẩn
+        from diffusers import DiffusionPipeline
+    except ImportError:
         return None, "Thiếu thư viện diffusers. Hãy chạy pip install -U diffusers transformers accelerate"
     
     try:
@@ -58,11 +89,15 @@ def load_model():
     except Exception as e:
         return None, str(e)
 
-def base64_to_pil(b64_string):
+def base64_to_png(b64_string):
+    """Ảnh base64 -> bytes PNG (RGB) chuẩn hóa: cùng ảnh cho cùng bytes, dùng làm key của job"""
     try:
-        img_data = base64.b64decode(b64_string)
-        return Image.open(io.BytesIO(img_data)).convert("RGB")
-    except: return None
+        image = Image.open(io.BytesIO(base64.b64decode(b64_string))).convert("RGB")
+    except Exception:
+        return None
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
 
 def resize_image_for_svd(image):
     # Resize về 1024x576 (chuẩn SVD)
@@ -71,87 +106,223 @@ def resize_image_for_svd(image):
     if h > w: target_w, target_h = 576, 1024
     return image.resize((target_w, target_h), Image.LANCZOS)
 
-def generate_video_clip(pipe, image_pil, output_path):
+def generate_video_clip(pipe, image_pil, output_path, params=DEFAULT_PARAMS):
+    """Sinh clip và encode thẳng ra `output_path`. Trả về thông tin file (path, size, duration, frames...)"""
+    import torch
     image_sized = resize_image_for_svd(image_pil)
     
     # Sinh video
     # Lưu ý: SVD là Image-to-Video, không cần prompt text
     frames = pipe(
         image=image_sized, 
-        decode_chunk_size=1, # Giảm xuống 1 để đỡ tốn RAM
-        num_inference_steps=10, 
-        generator=torch.manual_seed(42)
+        decode_chunk_size=params["decodeChunkSize"], # 1 để đỡ tốn RAM
+        num_inference_steps=params["steps"],
+        motion_bucket_id=params["motionBucketId"],
+        fps=params["fps"],
+        generator=torch.manual_seed(params["seed"])
     ).frames[0]
     
-    export_to_video(frames, output_path, fps=7)
-    return output_path
+    # Không qua export_to_video (file tạm + đọc lại): frame đi thẳng vào encoder
+    with VideoWriter(output_path, params["fps"], codec=params["codec"], crf=params["crf"]) as writer:
+        for frame in frames:
+            writer.write(frame)
+    return writer.info
 
-def process_animation(data, pipe):
-    img_b64 = data.get('imageB64')
-    if not img_b64: return {"success": False, "error": "No Image"}
-    
-    # Dọn dẹp VRAM
-    if torch.cuda.is_available(): torch.cuda.empty_cache()
+def kenburns_params(panel, video):
+    """Tham số engine kenburns (fps gửi kèm panel là fps gợi ý cho SVD nên không dùng ở đây)"""
+    params = {"engine": "kenburns", "fps": int(video.get('fps') or ken_burns.KENBURNS_FPS),
+              "codec": str(video.get('codec') or VIDEO_CODEC),
+              "crf": int(VIDEO_CRF if video.get('crf') is None else video['crf']),
+              "motion": panel.get('motion', 'auto'), "focus": panel.get('focus', 'auto'),
+              "focusBoxes": ken_burns.panel_focus_boxes(panel)}
+    if panel.get('zoom') is not None:
+        params["zoom"] = float(panel['zoom'])
+    if panel.get('duration') is not None:
+        params["duration"] = float(panel['duration'])
+    return params
 
-    image = base64_to_pil(img_b64)
-    if not image: return {"success": False, "error": "Decode Error"}
+def panel_params(panel, video=None, engine=ANIMATE_ENGINE):
+    """
+    Tham số render của panel: mặc định + cấu hình video của request (codec / crf / fps)
+    + motion_bucket_id / fps gửi kèm panel (như request gửi Kaggle). Panel có "engine" riêng thì theo panel
+    """
+    video = video or {}
+    engine = panel.get('engine') or engine
+    if engine not in ENGINES:
+        raise ValueError(f"Engine không hỗ trợ: {engine}")
+    if engine == 'kenburns':
+        return kenburns_params(panel, video)
+    params = dict(DEFAULT_PARAMS)
+    if video.get('codec'):
+        params["codec"] = str(video['codec'])
+    if video.get('crf') is not None:
+        params["crf"] = int(video['crf'])
+    if video.get('fps') is not None:
+        params["fps"] = int(video['fps'])
+    if panel.get('motion_bucket_id') is not None:
+        params["motionBucketId"] = int(panel['motion_bucket_id'])
+    if panel.get('fps') is not None:
+        params["fps"] = int(panel['fps'])
+    return params
 
-    try:
-        with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as tmp_file:
-            output_path = tmp_file.name
-        
-        sys.stderr.write(f"[PY] Rendering panel {data.get('panelId')}...\n")
-        generate_video_clip(pipe, image, output_path)
-        
-        with open(output_path, "rb") as f:
-            video_b64 = base64.b64encode(f.read()).decode('utf-8')
-        try: os.remove(output_path)
-        except: pass
+def enqueue_request(queue, request_data, batch):
+    """
+    Thêm mọi panel của request vào batch. Panel lỗi input trả về ngay:
+    {position: {"fileName", "panelId", "error"}} (fileName / panelId để xếp kết quả đúng file)
+    """
+    errors = {}
+    position = 0
+    for file_info in request_data.get('filesData', []):
+        panels = file_info.get('panels', [])
+        sys.stderr.write(f"[PY] Processing {file_info.get('fileName')} ({len(panels)} panels)\n")
+        for panel in panels:
+            img_b64 = panel.get('imageB64')
+            image_png = base64_to_png(img_b64) if img_b64 else None
+            failed = {"fileName": file_info.get('fileName'), "panelId": panel.get('panelId')}
+            if image_png is None:
+                errors[position] = {**failed, "error": "No Image" if not img_b64 else "Decode Error"}
+            else:
+                try:
+                    params = panel_params(panel, request_data.get('video'),
+                                          request_data.get('engine') or ANIMATE_ENGINE)
+                except ValueError as e:
+                    errors[position] = {**failed, "error": str(e)}
+                else:
+                    queue.enqueue(batch, position, image_png, params, file_info.get('fileName'),
+                                  panel.get('panelId'))
+            position += 1
+    return errors
 
-        return { "success": True, "videoBase64": video_b64 }
-    except Exception as e:
-        sys.stderr.write(f"[PY][ERROR] Render Error: {str(e)}\n")
-        return {"success": False, "error": str(e)}
+def run_worker(queue, batch=None):
+    """
+    Render các job đang chờ tới khi hết. Trả về lỗi tải model (None nếu không có).
+    Model SVD chỉ được tải khi gặp job engine "svd"
+    """
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    released = queue.release_dead_workers(socket.gethostname())
+    if released:
+        sys.stderr.write(f"[PY] Tiếp tục {released} job của worker đã dừng giữa chừng\n")
+    pipe = None
+    while True:
+        job = queue.claim(worker, batch)
+        if job is None:
+            return None
+        output_path = queue.output_path(job['job_key'])
+        if os.path.exists(output_path):
+            queue.complete(job, output_path, cached=True)
+            continue
+        engine = job['params'].get('engine', 'svd')
+        if engine == 'svd' and pipe is None:
+            pipe, error = load_model()
+            if error:
+                queue.fail(job, error)
+                return error
+
+        sys.stderr.write(f"[PY] Rendering {job['file_name']} - panel {job['panel_id']} [{engine}] "
+                         f"(lần thử {job['attempts']})...\n")
+        if engine == 'svd':
+            # Dọn dẹp VRAM
+            import torch
+            if torch.cuda.is_available(): torch.cuda.empty_cache()
+        try:
+            image = Image.open(queue.input_path(job['job_key'])).convert("RGB")
+            # Ghi file tạm rồi rename: output dở dang (crash giữa chừng) không bị coi là đã xong
+            tmp_path = output_path[:-len(queue.output_ext)] + '.tmp' + queue.output_ext
+            if engine == 'kenburns':
+                info = ken_burns.render_clip(np.asarray(image), tmp_path, job['params'])
+            else:
+                info = generate_video_clip(pipe, image, tmp_path, job['params'])
+            os.replace(tmp_path, output_path)
+            info.pop("path", None)
+            queue.complete(job, output_path, meta=info)
+        except Exception as e:
+            sys.stderr.write(f"[PY][ERROR] Render Error: {str(e)}\n")
+            queue.fail(job, str(e))
+
+def batch_results(queue, batch, errors, with_video=False):
+    """
+    Kết quả theo format cũ {"data": [{"fileName", "panels": [...]}]}: mỗi panel xong có videoPath,
+    videoSize (byte), duration (giây); with_video thì thêm videoBase64 đọc từ file
+    """
+    jobs = {job['position']: job for job in queue.jobs(batch)}
+    output_results = []
+    for position in sorted(set(jobs) | set(errors)):
+        job = jobs.get(position)
+        if job is None:
+            error = errors[position]
+            file_name = error["fileName"]
+            result = {"panelId": error["panelId"], "success": False, "error": error["error"]}
+        else:
+            file_name = job['file_name']
+            result = {"panelId": job['panel_id'], "success": job['status'] == 'done', "attempts": job['attempts'],
+                      "cached": bool(job['cached'])}
+            if job['status'] == 'done':
+                meta = job['output_meta'] or {}
+                result["videoPath"] = job['output_path']
+                result["videoSize"] = meta.get("size", os.path.getsize(job['output_path']))
+                result["duration"] = meta.get("duration")
+                if with_video:
+                    with open(job['output_path'], "rb") as f:
+                        result["videoBase64"] = base64.b64encode(f.read()).decode('utf-8')
+            else:
+                result["error"] = job['error'] or f"Job {job['status']}"
+        if not output_results or output_results[-1]["fileName"] != file_name:
+            output_results.append({"fileName": file_name, "panels": []})
+        output_results[-1]["panels"].append(result)
+    return output_results
+
+def cli_option(name):
+    """Giá trị của `--name value` trên dòng lệnh (None nếu không có)"""
+    if name in sys.argv[:-1] and not sys.argv[sys.argv.index(name) + 1].startswith('--'):
+        return sys.argv[sys.argv.index(name) + 1]
+    return None
 
 def main():
     sys.stdout.reconfigure(encoding='utf-8')
-    
-    if len(sys.argv) < 2:
+    output_dir = cli_option('--output-dir')
+
+    if any(flag in sys.argv for flag in ('--status', '--retry-failed', '--worker')):
+        queue = RenderQueue(output_dir=output_dir)
+    if '--status' in sys.argv:
+        print(json.dumps(queue.status(cli_option('--status')), ensure_ascii=False)); return
+    if '--retry-failed' in sys.argv:
+        print(json.dumps({"requeued": queue.retry_failed(cli_option('--retry-failed'))})); return
+    if '--worker' in sys.argv:
+        error = run_worker(queue, cli_option('--batch'))
+        print(json.dumps({"error": error} if error else queue.status(cli_option('--batch')), ensure_ascii=False))
+        if error: sys.exit(1)
+        return
+
+    if len(sys.argv) < 2 or sys.argv[1].startswith('--'):
         print(json.dumps({"error": "Thiếu đường dẫn file input"})); sys.exit(1)
         
     input_file_path = sys.argv[1]
-    
-    # Load model
-    pipe, error = load_model()
-    if error:
-        print(json.dumps({"error": error})); sys.exit(1)
 
     try:
         if not os.path.exists(input_file_path):
              print(json.dumps({"error": "File input không tồn tại"})); sys.exit(1)
 
-        with open(input_file_path, 'r', encoding='utf-8') as f:
-            request_data = json.load(f)
+        with open(input_file_path, 'rb') as f:
+            raw = f.read()
+        request_data = json.loads(raw.decode('utf-8'))
+        queue = RenderQueue(output_dir=output_dir or request_data.get('outputDir'))
 
-        files_data = request_data.get('filesData', [])
-        output_results = []
+        # Batch mặc định = hash nội dung request: chạy lại cùng file input là tiếp tục batch cũ
+        batch = cli_option('--batch') or request_data.get('batchId') or hash_bytes('animate', raw)[:16]
+        sys.stderr.write(f"[PY] Batch {batch}\n")
+        errors = enqueue_request(queue, request_data, batch)
 
-        for file_info in files_data:
-            processed_panels = []
-            panels = file_info.get('panels', [])
-            sys.stderr.write(f"[PY] Processing {file_info.get('fileName')} ({len(panels)} panels)\n")
-            
-            for panel in panels:
-                result = process_animation(panel, pipe)
-                processed_panels.append({"panelId": panel.get('panelId'), **result})
-                
-            output_results.append({"fileName": file_info.get('fileName'), "panels": processed_panels})
+        error = run_worker(queue, batch)
+        if error:
+            print(json.dumps({"error": error, "batch": batch})); sys.exit(1)
 
-        print(json.dumps({"data": output_results}, ensure_ascii=False))
+        with_video = request_data.get('videoOutput') == 'base64'
+        print(json.dumps({"data": batch_results(queue, batch, errors, with_video), "batch": batch,
+                          "progress": queue.status(batch).get(batch)}, ensure_ascii=False))
 
     except Exception as e:
         sys.stderr.write(f"[PY][FATAL] {str(e)}\n")
         print(json.dumps({"error": str(e)})); sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
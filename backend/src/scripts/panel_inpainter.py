@@ -1,3 +1,7 @@
+import time
+STARTED_AT = time.time()
+
+import re
 import sys
 import json
 import base64
@@ -5,50 +9,87 @@ import cv2
 import numpy as np
 import traceback
 import os
+import uuid
 from PIL import Image
 
+from stream_io import iter_request, make_writer, request_is_empty
+from seg_cache import MASK_THRESHOLD, INPAINT_PREDICT_ARGS, predict_segmentation
+from mask_codec import decode_rle, polygon_points
+from inpaint_regions import ROI_PADDING, MAX_WORKING_SIZE, FILL_MODE, FEATHER_PX, inpaint_many_regions
+from region_cache import get_region_cache, method_version
+from mask_compose import MASK_SCALE, compose_mask
+from bubble_classical import classical_segmentation
+
 # --- 1. MONKEY PATCH CHO PILLOW ---
 if not hasattr(Image, 'ANTIALIAS'):
     Image.ANTIALIAS = Image.Resampling.LANCZOS
 
 # --- 2. KHỞI TẠO ---
-try:
-    from simple_lama_inpainting import SimpleLama
-    LAMA_AVAILABLE = True
-except ImportError:
-    LAMA_AVAILABLE = False
-
-try:
-    from ultralytics import YOLO
-    YOLO_AVAILABLE = True
-except ImportError:
-    YOLO_AVAILABLE = False
-
+# torch / simple_lama_inpainting / ultralytics chỉ được import khi tải model (LazyModels): request không có gì
+# để xóa, chỉ có textBlocks hoặc tô được hết bằng classical_fill.py không phải chờ import / tải model
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
-SEG_MODEL_PATH = os.path.join(CURRENT_DIR, 'models', 'finetune_detect.pt')
+SEG_MODEL_PATH = os.environ.get('BUBBLE_MODEL_PATH') or os.path.join(CURRENT_DIR, 'models', 'finetune_detect.pt')
+# "roi": chỉ inpaint các vùng quanh mask (inpaint_regions.py), "full": chạy LaMa trên cả panel
+INPAINT_MODE = os.environ.get('INPAINT_MODE', 'roi')
+# Số crop tối đa trong một batch LaMa (0 = theo thiết bị: GPU 4, CPU 1 vì batch không nhanh hơn chạy lần lượt),
+# bước làm tròn kích thước khi gom bucket (px) và số panel đã decode tối đa giữ trong bộ nhớ trước khi inpaint
+BATCH_SIZE = int(os.environ.get('INPAINT_BATCH_SIZE', '0'))
+BUCKET_STEP = int(os.environ.get('INPAINT_BUCKET_STEP', '64'))
+WINDOW_PANELS = int(os.environ.get('INPAINT_WINDOW_PANELS', '8'))
+# Trần bộ nhớ cho ảnh đã decode / kết quả chưa ghi ra (MB): vượt thì inpaint và ghi ngay, ngừng đọc stdin
+# trong lúc đó (backpressure lên process gửi request)
+MAX_BUFFER_MB = float(os.environ.get('INPAINT_MAX_BUFFER_MB', '512'))
 
-def load_models():
-    lama = None
-    seg_model = None
-    error = None
-
-    if not LAMA_AVAILABLE: return None, None, "Thiếu thư viện simple-lama-inpainting"
-    if not YOLO_AVAILABLE: return None, None, "Thiếu thư viện ultralytics"
+def load_lama():
+    try:
+        from simple_lama_inpainting import SimpleLama
+    except ImportError:
+        raise RuntimeError("Thiếu thư viện simple-lama-inpainting")
+    sys.stderr.write("[PY] Đang tải model LaMa...\n")
+    return SimpleLama()
 
+def load_segmentation():
+    """Model YOLO-seg finetune, None nếu không có (bong bóng khi đó được tìm bằng bubble_classical.py)"""
+    if not os.path.exists(SEG_MODEL_PATH):
+        sys.stderr.write(f"[PY][WARNING] Không tìm thấy {SEG_MODEL_PATH}. Tìm bong bóng bằng engine classical...\n")
+        return None
     try:
-        sys.stderr.write("[PY] Đang tải model LaMa...\n")
-        lama = SimpleLama()
-        
-        if os.path.exists(SEG_MODEL_PATH):
-            sys.stderr.write(f"[PY] Đang tải Segmentation: {SEG_MODEL_PATH}\n")
-            seg_model = YOLO(SEG_MODEL_PATH)
-        else:
-            sys.stderr.write(f"[PY][WARNING] Không tìm thấy {SEG_MODEL_PATH}. Dùng yolov8n-seg.pt...\n")
-            seg_model = YOLO("yolov8n-seg.pt")
-    except Exception as e:
-        error = str(e)
+        from ultralytics import YOLO
+    except ImportError:
+        sys.stderr.write("[PY][WARNING] Thiếu thư viện ultralytics. Tìm bong bóng bằng engine classical...\n")
+        return None
+    sys.stderr.write(f"[PY] Đang tải Segmentation: {SEG_MODEL_PATH}\n")
+    return YOLO(SEG_MODEL_PATH)
+
+class LazyModels:
+    """
+    Tải model ở lần đầu cần đến: segmentation khi panel không kèm bong bóng trong request,
+    LaMa khi còn mask phải inpaint sau bước tô cổ điển. Lỗi tải được nhớ lại (không tải lại cho từng panel).
+    """
+    def __init__(self):
+        self.models = {}
+        self.errors = {}
+        self.load_ms = {}
+
+    def _get(self, name, loader):
+        if name in self.errors:
+            raise RuntimeError(self.errors[name])
+        if name not in self.models:
+            start = time.time()
+            try:
+                self.models[name] = loader()
+            except Exception as e:
+                self.errors[name] = str(e)
+                raise
+            self.load_ms[name] = int((time.time() - start) * 1000)
+            sys.stderr.write(f"[PY] Tải {name}: {self.load_ms[name]}ms\n")
+        return self.models[name]
+
+    def lama(self):
+        return self._get('lama', load_lama)
 
-    return lama, seg_model, error
+    def segmentation(self):
+        return self._get('segmentation', load_segmentation)
 
 def base64_to_image(b64_string):
     try:
@@ -87,121 +128,308 @@ def expand_contour_with_offset(contour, offset_px=10):
     
     return np.array(expanded_points).reshape(-1, 1, 2)
 
-def get_bubble_mask_yolo(image_bgr, model):
+def bubble_instances_yolo(image_bgr, model):
+    """Mask nhị phân (kích thước panel) của từng bong bóng YOLO tìm được (model None: engine classical)"""
     h, w = image_bgr.shape[:2]
-    final_mask = np.zeros((h, w), dtype=np.uint8)
-    offset_px = 35
 
-    results = model.predict(image_bgr, conf=0.2, iou=0.4, retina_masks=True, verbose=False)
+    if model is None:
+        classes, masks = classical_segmentation(image_bgr)
+    else:
+        # Mask retina (độ phân giải panel); dùng lại kết quả của lần xóa trước trên cùng panel nếu có
+        classes, masks, cached = predict_segmentation(image_bgr, model, predict_args=INPAINT_PREDICT_ARGS)
+        if cached:
+            sys.stderr.write("[PY] Dùng lại segmentation từ cache\n")
     
-    if results[0].masks is not None:
-        classes = results[0].boxes.cls.cpu().numpy()
-        masks = results[0].masks.data.cpu().numpy()
-        for i, m in enumerate(masks):
-            cls_id = int(classes[i])
-            if cls_id != 1:
-                continue
-            m_resized = cv2.resize(m, (w, h))
-            binary_mask = (m_resized > 0.5).astype(np.uint8) * 255
-
-            kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (offset_px, offset_px))
-            dilated_mask = cv2.dilate(binary_mask, kernel, iterations=1)
-            
-            contours, _ = cv2.findContours(dilated_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-            
-            for cnt in contours:
-                cv2.drawContours(final_mask, [cnt], -1, 255, -1)
-    
-    # Làm mịn nhẹ
-    final_mask = cv2.GaussianBlur(final_mask, (5, 5), 0)
-    _, final_mask = cv2.threshold(final_mask, 127, 255, cv2.THRESH_BINARY)
-    
-    return final_mask
+    instance_masks = []
+    for i, m in enumerate(masks):
+        cls_id = int(classes[i])
+        if cls_id != 1:
+            continue
+        m_resized = cv2.resize(m.astype(np.float32), (w, h))
+        instance_masks.append((m_resized > MASK_THRESHOLD).astype(np.uint8) * 255)
+    return instance_masks
 
-def get_text_mask_vision(image_shape, text_blocks):
+def bubble_instances_from_request(image_shape, data):
     """
-    Tạo mask từ danh sách textBlocks của Vision API
+    Mask bong bóng gửi kèm request (output của bubble_detector), bỏ qua bước segmentation:
+    `bubbleMasks`: [{"size", "counts"}] (RLE) hoặc `bubbles`: [{"points"} | {"polygon"}].
+    Trả về None nếu request không có. Mask khác kích thước panel (mask cũ / của panel khác) -> ValueError
     """
     h, w = image_shape[:2]
-    text_mask = np.zeros((h, w), dtype=np.uint8)
-    
-    if not text_blocks:
-        return text_mask
-
-    for block in text_blocks:
-        vertices = block.get('vertices', [])
-        if len(vertices) < 3: continue
-        
-        # Chuyển đổi tọa độ thành numpy array
-        pts = np.array([[int(v.get('x', 0)), int(v.get('y', 0))] for v in vertices], np.int32)
-        
-        # Vẽ đa giác màu trắng
-        cv2.fillPoly(text_mask, [pts], 255)
-
-    # Phình mask ra để xóa sạch viền chữ (đặc biệt là SFX có viền màu)
-    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (20, 20))
-    text_mask = cv2.dilate(text_mask, kernel, iterations=1)
-    
-    return text_mask
+    instance_masks = []
+    for i, rle in enumerate(data.get('bubbleMasks') or []):
+        size = [int(v) for v in rle.get("size") or []]
+        if size != [h, w]:
+            raise ValueError(f"bubbleMasks[{i}] có size {size}, không khớp panel {h}x{w}")
+        instance_masks.append(decode_rle(rle) * 255)
+    if not instance_masks:
+        for bubble in data.get('bubbles') or []:
+            pts = polygon_points(bubble)
+            if len(pts) < 3:
+                continue
+            mask = np.zeros((h, w), dtype=np.uint8)
+            cv2.fillPoly(mask, [pts.astype(np.int32)], 255)
+            instance_masks.append(mask)
+    if not instance_masks and 'bubbles' not in data and 'bubbleMasks' not in data:
+        return None
+    return instance_masks
+
+def text_polygons(text_blocks):
+    """Polygon của các textBlocks: "vertices" [{"x", "y"}] hoặc "polygon" (delta, mask_codec.py)"""
+    return [polygon_points(block, 'vertices') for block in text_blocks or []]
+
+def get_bubble_mask_yolo(image_bgr, model, scale=MASK_SCALE):
+    return compose_mask(image_bgr.shape, bubble_instances_yolo(image_bgr, model), scale=scale)
+
+def get_bubble_mask_from_request(image_shape, data, scale=MASK_SCALE):
+    instance_masks = bubble_instances_from_request(image_shape, data)
+    return None if instance_masks is None else compose_mask(image_shape, instance_masks, scale=scale)
+
+def get_text_mask_vision(image_shape, text_blocks, scale=MASK_SCALE):
+    """
+    Tạo mask từ danh sách textBlocks của Vision API (phình ra để xóa sạch viền chữ, đặc biệt là SFX có viền màu)
+    """
+    return compose_mask(image_shape, text_polygons=text_polygons(text_blocks), scale=scale)
 
-def process_inpainting(data, lama_model, seg_model):
+def lama_inpaint(lama_model, image_bgr, mask):
+    """LaMa trên một ảnh BGR. SimpleLama pad ảnh lên bội số 8, output được cắt về kích thước đầu vào"""
+    h, w = image_bgr.shape[:2]
+    result_pil = lama_model(Image.fromarray(cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB)), Image.fromarray(mask))
+    return cv2.cvtColor(np.array(result_pil)[:h, :w], cv2.COLOR_RGB2BGR)
+
+def default_batch_size(lama_model):
+    return BATCH_SIZE or (4 if lama_model.device.type == 'cuda' else 1)
+
+def lama_inpaint_batch(lama_model, pairs, batch_size=None, bucket_step=BUCKET_STEP):
+    """
+    LaMa cho nhiều (ảnh BGR, mask). Các ảnh được gom theo kích thước làm tròn lên bội số `bucket_step`,
+    mỗi batch `batch_size` ảnh được pad phản chiếu (như SimpleLama) lên kích thước lớn nhất trong batch
+    làm tròn bội số 8, chạy thẳng lama_model.model rồi cắt về kích thước gốc. Batch 1 ảnh cho kết quả
+    giống hệt SimpleLama. Trả về list ảnh BGR theo thứ tự đầu vào.
+    """
+    import torch
+    batch_size = batch_size or default_batch_size(lama_model)
+    results = [None] * len(pairs)
+    buckets = {}
+    for idx, (image, _) in enumerate(pairs):
+        h, w = image.shape[:2]
+        buckets.setdefault((-(-h // bucket_step) * bucket_step, -(-w // bucket_step) * bucket_step), []).append(idx)
+
+    for indices in buckets.values():
+        for offset in range(0, len(indices), batch_size):
+            chunk = indices[offset:offset + batch_size]
+            bucket_h = -(-max(pairs[i][0].shape[0] for i in chunk) // 8) * 8
+            bucket_w = -(-max(pairs[i][0].shape[1] for i in chunk) // 8) * 8
+            images, masks = [], []
+            for i in chunk:
+                image, mask = pairs[i]
+                pad = ((0, bucket_h - image.shape[0]), (0, bucket_w - image.shape[1]))
+                rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB).astype(np.float32) / 255
+                images.append(np.pad(rgb, pad + ((0, 0),), mode='symmetric').transpose(2, 0, 1))
+                masks.append(np.pad(mask, pad, mode='symmetric')[None])
+            with torch.inference_mode():
+                image_batch = torch.from_numpy(np.stack(images)).to(lama_model.device)
+                mask_batch = (torch.from_numpy(np.stack(masks)).to(lama_model.device) > 0) * 1
+                output = lama_model.model(image_batch, mask_batch)
+                output = np.clip(output.permute(0, 2, 3, 1).cpu().numpy() * 255, 0, 255).astype(np.uint8)
+            for i, filled in zip(chunk, output):
+                h, w = pairs[i][0].shape[:2]
+                results[i] = cv2.cvtColor(np.ascontiguousarray(filled[:h, :w]), cv2.COLOR_RGB2BGR)
+    return results
+
+def prepare_inpainting(data, models, options=None):
+    """
+    Decode panel và dựng mask cần xóa (`models`: LazyModels, chỉ tải segmentation khi cần).
+    Trả về (kết quả cuối, None) nếu không cần inpaint / có lỗi, ngược lại (None, job) với job là item cho
+    inpaint_many_regions
+    """
+    options = options or {}
     img_b64 = data.get('imageB64')
-    if not img_b64: return {"success": False, "error": "Thiếu imageB64"}
+    if not img_b64: return {"success": False, "error": "Thiếu imageB64"}, None
 
     image = base64_to_image(img_b64)
-    if image is None: return {"success": False, "error": "Lỗi Base64"}
+    if image is None: return {"success": False, "error": "Lỗi Base64"}, None
 
     try:
-        # 1. Tìm Mask bong bóng (YOLO)
-        bubble_mask = get_bubble_mask_yolo(image, seg_model)
-        
-        # 2. MỚI: Tìm Mask cho chữ lơ lửng (từ textBlocks gửi xuống)
-        # SỬA Ở ĐÂY: Dùng data.get thay vì panel_data.get
-        text_blocks = data.get('textBlocks', [])
-        vision_mask = get_text_mask_vision(image.shape, text_blocks)
-
-        # 3. GỘP CẢ 2 MASK LẠI (Phép cộng)
-        combined_mask = cv2.bitwise_or(bubble_mask, vision_mask)
+        # 1. Mask bong bóng: dùng mask gửi kèm request nếu có, không thì chạy YOLO.
+        # eraseBubbles = false: chỉ xóa textBlocks (không cần segmentation)
+        if data.get('eraseBubbles', options.get('eraseBubbles', True)) is False:
+            bubble_masks = []
+        else:
+            bubble_masks = bubble_instances_from_request(image.shape, data)
+            if bubble_masks is None:
+                bubble_masks = bubble_instances_yolo(image, models.segmentation())
+
+        # 2. Gộp với polygon chữ lơ lửng (textBlocks gửi xuống) rồi phình một lượt (mask_compose.py)
+        scale = float(data.get('maskScale', options.get('maskScale', MASK_SCALE)))
+        combined_mask = compose_mask(image.shape, bubble_masks, text_polygons(data.get('textBlocks', [])),
+                                     scale=scale)
                 
         if np.count_nonzero(combined_mask) == 0:
-            return {"success": True, "inpaintedImageB64": img_b64, "message": "Không tìm thấy nội dung cần xóa"}
-
-        # 4. Inpaint bằng LaMa
-        image_pil = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-        mask_pil = Image.fromarray(combined_mask)
-        result_pil = lama_model(image_pil, mask_pil)
-        
-        result_bgr = cv2.cvtColor(np.array(result_pil), cv2.COLOR_RGB2BGR)
-        output_b64 = image_to_base64(result_bgr)
-        
-        return {"success": True, "inpaintedImageB64": output_b64}
+            return {"success": True, "inpaintedImageB64": img_b64, "message": "Không tìm thấy nội dung cần xóa"}, None
+
+        # 4. Tham số inpaint: mặc định chỉ trên các crop quanh vùng mask (inpaint_regions.py);
+        # panel / crop lớn chạy LaMa trên bản thu nhỏ (cạnh dài <= maxWorkingSize), ngoài mask giữ nguyên
+        job = {
+            "image": image,
+            "mask": combined_mask,
+            "mode": data.get('inpaintMode') or options.get('inpaintMode') or INPAINT_MODE,
+            "padding": int(data.get('roiPadding', options.get('roiPadding', ROI_PADDING))),
+            "maxWorkingSize": int(data.get('maxWorkingSize', options.get('maxWorkingSize', MAX_WORKING_SIZE))),
+            # "auto": vùng trên nền phẳng tô cổ điển (classical_fill.py), chỉ vùng có texture qua LaMa
+            "fillMode": data.get('fillMode') or options.get('fillMode') or FILL_MODE
+        }
+        # 5. Vùng đã inpaint ở lần chạy trước trên cùng panel được dán lại từ cache (region_cache.py)
+        if data.get('regionCache', options.get('regionCache', True)) is not False:
+            cache = get_region_cache(method_version(job["mode"], job["padding"], job["maxWorkingSize"], FEATHER_PX,
+                                                    job["fillMode"]))
+            if cache.enabled:
+                job["regionCache"] = cache
+        return None, job
+    except Exception as e:
+        sys.stderr.write(f"[PY][ERROR] Logic failed: {str(e)}\n")
+        return {"success": False, "error": str(e)}, None
+
+def inpaint_jobs(jobs, models, batch_size=None, encode=True):
+    """
+    Inpaint crop của nhiều panel chung các batch LaMa (LaMa chỉ được tải nếu còn crop sau bước tô cổ điển).
+    Trả về list kết quả theo thứ tự jobs (`encode=False`: ảnh BGR ở "inpaintedImage" thay vì base64)
+    """
+    if not jobs:
+        return []
+    inpaint_many = lambda pairs: lama_inpaint_batch(models.lama(), pairs, batch_size)
+    results = []
+    for (result_bgr, stats), job in zip(inpaint_many_regions(jobs, inpaint_many), jobs):
+        methods = f", {stats['methods']}" if 'methods' in stats else ''
+        cached = f", cache {stats['regionCache']}" if 'regionCache' in stats else ''
+        sys.stderr.write(f"[PY] Inpaint {stats['mode']}: {stats['regions']} crop LaMa, "
+                         f"{stats['inpaintPixels']}/{stats['imagePixels']} px, ~{stats['inpaintMs']}ms{methods}{cached}\n")
+        image = {"inpaintedImageB64": image_to_base64(result_bgr)} if encode else {"inpaintedImage": result_bgr}
+        results.append({"success": True, **image, "inpaintStats": stats})
+    return results
+
+def save_artifact(directory, file_index, result):
+    """Ghi ảnh kết quả của panel vào `directory`, thay ảnh trong result bằng đường dẫn (inpaintedImagePath)"""
+    name = f"f{file_index:03d}_p{re.sub(r'[^0-9A-Za-z_-]', '_', str(result.get('panelId')))}"
+    if 'inpaintedImage' in result:
+        path = os.path.join(directory, name + '.jpg')
+        cv2.imwrite(path, result.pop('inpaintedImage'), [int(cv2.IMWRITE_JPEG_QUALITY), 95])
+    elif 'inpaintedImageB64' in result:
+        # Panel không cần xóa gì: ghi lại nguyên ảnh gửi lên
+        data = base64.b64decode(result.pop('inpaintedImageB64'))
+        path = os.path.join(directory, name + ('.png' if data[:4] == b'\x89PNG' else '.jpg'))
+        with open(path, 'wb') as f:
+            f.write(data)
+    else:
+        return
+    result['inpaintedImagePath'] = path
+
+def pending_bytes(result, job):
+    """Dung lượng (ước lượng) một panel chiếm trong hàng đợi: ảnh / mask đã decode và chuỗi base64 giữ lại"""
+    size = len(result.get('inpaintedImageB64') or '')
+    if job is not None:
+        size += job["image"].nbytes + job["mask"].nbytes
+    return size
+
+def process_inpainting(data, models, options=None):
+    """Inpaint một panel (không batch với panel khác)"""
+    result, job = prepare_inpainting(data, models, options)
+    if job is None:
+        return result
+    try:
+        batch_size = int((options or {}).get('batchSize') or 0)
+        return inpaint_jobs([job], models, batch_size)[0]
     except Exception as e:
         sys.stderr.write(f"[PY][ERROR] Logic failed: {str(e)}\n")
         return {"success": False, "error": str(e)}
 
 def main():
     sys.stdout.reconfigure(encoding='utf-8')
-    lama, seg_model, error = load_models()
-    if error:
-        print(json.dumps({"error": error})); sys.exit(1)
+    if request_is_empty():
+        return
+    models = LazyModels()
+    timings = {"startupMs": int((time.time() - STARTED_AT) * 1000)}
+
+    ndjson = '--ndjson' in sys.argv
+    cli_artifact_dir = sys.argv[sys.argv.index('--artifact-dir') + 1] if '--artifact-dir' in sys.argv[:-1] else None
+    writer = make_writer(ndjson)
+    file_meta = {}
+    # Option cấp request (inpaintMode, roiPadding, batchSize, artifactDir, maxBufferMb, ...) đứng trước filesData
+    options = {}
+    # Hàng đợi theo đúng thứ tự input: ('start', i, None) / ('panel', i, result) / ('end', i, meta)
+    pending, jobs, slots = [], [], []
+    # held: số byte đang giữ trong hàng đợi, peak: lớn nhất trong cả request
+    state = {"held": 0, "peak": 0, "artifactDir": None}
+
+    def artifact_dir():
+        # artifactDir: ảnh kết quả ghi ra file, stdout chỉ còn đường dẫn. Mỗi request ghi vào thư mục con riêng
+        # (thời điểm + pid + uuid) để các request / worker dùng chung artifactDir không ghi đè file của nhau
+        if state["artifactDir"] is None:
+            root = cli_artifact_dir or options.get('artifactDir') or ''
+            state["artifactDir"] = ''
+            if root:
+                run_id = f"{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}_{uuid.uuid4().hex[:8]}"
+                state["artifactDir"] = os.path.join(root, run_id)
+                os.makedirs(state["artifactDir"], exist_ok=True)
+        return state["artifactDir"]
+
+    def flush():
+        batch_size = int(options.get('batchSize') or 0)
+        directory = artifact_dir()
+        try:
+            results = inpaint_jobs(jobs, models, batch_size, encode=not directory)
+        except Exception as e:
+            sys.stderr.write(f"[PY][ERROR] Logic failed: {str(e)}\n")
+            results = [{"success": False, "error": str(e)}] * len(jobs)
+        for slot, result in zip(slots, results):
+            slot.update(result)
+        for kind, file_index, payload in pending:
+            if kind == 'start':
+                writer.start_file(file_index)
+            elif kind == 'panel':
+                if directory:
+                    save_artifact(directory, file_index, payload)
+                writer.write_panel(file_index, payload)
+            else:
+                writer.end_file(file_index, payload)
+        pending.clear()
+        jobs.clear()
+        slots.clear()
+        state["held"] = 0
 
     try:
-        input_stream = sys.stdin.read()
-        if not input_stream: return
-        request_data = json.loads(input_stream)
-        output_results = []
-
-        for file_info in request_data.get('filesData', []):
-            processed_panels = []
-            for panel in file_info.get('panels', []):
-                sys.stderr.write(f"[PY] Processing {file_info.get('fileName')} - P{panel.get('panelId')}...\n")
-                result = process_inpainting(panel, lama, seg_model)
-                processed_panels.append({"panelId": panel.get('panelId'), **result})
-            output_results.append({"fileName": file_info.get('fileName'), "panels": processed_panels})
-
-        print(json.dumps({"data": output_results}, ensure_ascii=False))
+        # Đọc từng panel từ stdin; crop của một cửa sổ panel được inpaint chung các batch rồi ghi kết quả ngay
+        for event, file_index, payload in iter_request(options, ndjson):
+            if event == 'file_start':
+                file_meta = payload
+                pending.append(('start', file_index, None))
+            elif event == 'file_end':
+                pending.append(('end', file_index, payload))
+            else:
+                panel = payload
+                slot_id = panel.get('panelId')
+                sys.stderr.write(f"[PY] Processing {file_meta.get('fileName')} - P{panel.get('panelId')}...\n")
+                result, job = prepare_inpainting(panel, models, options)
+                del panel, payload  # input (base64) không còn cần
+                slot = {"panelId": slot_id, **(result or {})}
+                pending.append(('panel', file_index, slot))
+                state["held"] += pending_bytes(slot, job)
+                state["peak"] = max(state["peak"], state["held"])
+                if job is not None:
+                    jobs.append(job)
+                    slots.append(slot)
+                max_bytes = float(options.get('maxBufferMb') or MAX_BUFFER_MB) * 1024 * 1024
+                # Không còn panel chờ LaMa thì ghi ngay; đủ cửa sổ hoặc vượt trần bộ nhớ thì inpaint rồi ghi
+                if not jobs or len(jobs) >= WINDOW_PANELS or state["held"] >= max_bytes:
+                    flush()
+        flush()
+        timings.update(modelLoadMs=models.load_ms, totalMs=int((time.time() - STARTED_AT) * 1000),
+                       peakBufferMb=round(state["peak"] / 1024 / 1024, 1))
+        sys.stderr.write(f"[PY] Inpaint timings: {json.dumps(timings)}\n")
+        writer.close(timings=timings)
     except Exception as e:
-        print(json.dumps({"error": str(e)})); sys.exit(1)
+        sys.stderr.write(f"[PY][ERROR] {str(e)}\n")
+        writer.close(error=str(e)); sys.exit(1)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
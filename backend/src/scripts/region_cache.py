@@ -0,0 +1,83 @@
+"""
+Cache kết quả inpaint theo từng vùng cho inpaint_regions.py / panel_inpainter.py.
+
+Người dùng thường thêm / bớt một textBlock rồi chạy lại removeBubbles cho cả panel. Mỗi vùng liên thông của
+mask đã inpaint bằng LaMa được lưu lại (pixel fill trong bbox của vùng, PNG), key = hash pixel panel gốc +
+vị trí và mask của vùng. Lần chạy sau các vùng hit được dán thẳng lên panel, chỉ vùng mới / vùng đã đổi
+mask mới đưa vào LaMa (với các vùng đã dán làm ngữ cảnh).
+
+- version = format + phương pháp inpaint (model LaMa, mode, padding, maxWorkingSize, feather, fillMode):
+  đổi model hoặc tham số là cache cũ tự miss
+- vùng tô bằng classical_fill.py không được cache (tô lại rẻ hơn đọc cache)
+
+Biến môi trường:
+    REGION_CACHE_DIR       Thư mục cache (mặc định scripts/cache/inpaint_regions)
+    REGION_CACHE_TTL       Thời gian sống (giây), mặc định 7 ngày
+    REGION_CACHE_MAX_MB    Dung lượng tối đa, mặc định 300MB
+    REGION_CACHE_DISABLED  Đặt "1" để tắt cache
+"""
+import os
+import base64
+from typing import Any, Dict, Optional
+
+import cv2
+import numpy as np
+
+from disk_cache import DiskCache, DEFAULT_CACHE_ROOT, hash_bytes
+
+# Tăng khi đổi format value để cache cũ tự vô hiệu
+REGION_CACHE_FORMAT = 'inpaint-region-v1'
+
+_caches: Dict[str, DiskCache] = {}
+
+
+def lama_fingerprint() -> str:
+    """Model LaMa đang dùng: file LAMA_MODEL (tên, dung lượng, mtime) hoặc big-lama mặc định của SimpleLama"""
+    path = os.environ.get('LAMA_MODEL')
+    if path and os.path.exists(path):
+        stat = os.stat(path)
+        return f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return 'big-lama'
+
+
+def method_version(mode: str, padding: int, max_working_size: int, feather: int, fill_mode: str) -> str:
+    # fillMode: với "auto" vùng LaMa có ngữ cảnh là các vùng đã tô cổ điển nên kết quả khác "lama"
+    return (f"lama={lama_fingerprint()}|mode={mode}|padding={padding}|maxWorkingSize={max_working_size}"
+            f"|feather={feather}|fillMode={fill_mode}")
+
+
+def get_region_cache(method: str) -> DiskCache:
+    version = f"{REGION_CACHE_FORMAT}|{method}"
+    if version not in _caches:
+        _caches[version] = DiskCache(
+            os.environ.get('REGION_CACHE_DIR', os.path.join(DEFAULT_CACHE_ROOT, 'inpaint_regions')),
+            version=version,
+            ttl_seconds=float(os.environ.get('REGION_CACHE_TTL', 7 * 24 * 3600)),
+            max_bytes=int(float(os.environ.get('REGION_CACHE_MAX_MB', 300)) * 1024 * 1024),
+            enabled=os.environ.get('REGION_CACHE_DISABLED') != '1',
+        )
+    return _caches[version]
+
+
+def panel_digest(image_bgr: np.ndarray) -> str:
+    return hash_bytes('panel', image_bgr)
+
+
+def region_key(digest: str, x: int, y: int, region_mask: np.ndarray) -> str:
+    """Key của một vùng: panel + góc trên trái bbox + mask nhị phân của vùng trong bbox"""
+    return hash_bytes(digest, f"{x},{y}", np.packbits(region_mask > 0, axis=-1))
+
+
+def encode_region(pixels: np.ndarray, region_mask: np.ndarray) -> Dict[str, Any]:
+    """Pixel fill trong bbox (ngoài vùng đặt 0 để PNG nén tốt hơn)"""
+    crop = np.where(region_mask[..., None] > 0 if pixels.ndim == 3 else region_mask > 0, pixels, 0)
+    _, buffer = cv2.imencode('.png', crop.astype(np.uint8))
+    return {"png": base64.b64encode(buffer).decode('ascii')}
+
+
+def decode_region(value: Any) -> Optional[np.ndarray]:
+    try:
+        buffer = np.frombuffer(base64.b64decode(value["png"]), np.uint8)
+        return cv2.imdecode(buffer, cv2.IMREAD_UNCHANGED)
+    except (KeyError, TypeError, ValueError):
+        return None
@@ -0,0 +1,233 @@
+"""
+Hàng đợi job render trên file SQLite (panel_animator.py).
+
+Mỗi panel cần render là một job: (batch, position) -> key = hash(ảnh, tham số render), trạng thái, số lần thử,
+đường dẫn output + thông tin file (size, duration...). Ảnh input được ghi ra `<root>/inputs/<key>.png` để DB
+không chứa base64.
+
+- Output nằm ở đường dẫn cố định theo key (`<output_dir>/<key><ext>`, mặc định output_dir = `<root>/outputs`):
+  panel có cùng ảnh + tham số đã được render vào thư mục đó (ở batch nào cũng vậy) thì không render lại.
+- Worker nhận job bằng `claim` (một transaction BEGIN IMMEDIATE, an toàn khi nhiều process dùng chung DB).
+  Job đang chạy có hạn `leaseUntil`; worker chết giữa chừng thì job được nhận lại sau khi hết hạn
+  (worker cùng máy mà process đã chết thì nhận lại ngay, xem `release_dead_workers`).
+- Job lỗi được đưa lại hàng đợi cho tới khi hết `max_attempts` lần thử.
+
+Biến môi trường:
+    RENDER_QUEUE_DIR        Thư mục DB + inputs + outputs (mặc định scripts/cache/render_queue)
+    RENDER_MAX_ATTEMPTS     Số lần thử tối đa mỗi job (mặc định 3)
+    RENDER_LEASE_SECONDS    Thời gian giữ job của một worker (mặc định 1800)
+"""
+import os
+import json
+import time
+import sqlite3
+from typing import Any, Dict, List, Optional
+
+from disk_cache import DEFAULT_CACHE_ROOT, hash_bytes
+
+QUEUE_DIR = os.environ.get('RENDER_QUEUE_DIR', os.path.join(DEFAULT_CACHE_ROOT, 'render_queue'))
+MAX_ATTEMPTS = int(os.environ.get('RENDER_MAX_ATTEMPTS', '3'))
+LEASE_SECONDS = float(os.environ.get('RENDER_LEASE_SECONDS', '1800'))
+
+STATUSES = ('pending', 'running', 'done', 'failed')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    batch       TEXT NOT NULL,
+    position    INTEGER NOT NULL,
+    file_name   TEXT,
+    panel_id    TEXT,
+    job_key     TEXT NOT NULL,
+    params      TEXT NOT NULL,
+    status      TEXT NOT NULL DEFAULT 'pending',
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    output_path TEXT,
+    error       TEXT,
+    worker      TEXT,
+    lease_until REAL,
+    output_meta TEXT,
+    cached      INTEGER NOT NULL DEFAULT 0,
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL,
+    PRIMARY KEY (batch, position)
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_until);
+CREATE INDEX IF NOT EXISTS jobs_key ON jobs (job_key);
+"""
+# Cột thêm sau phiên bản đầu của schema (DB cũ được ALTER TABLE khi mở)
+ADDED_COLUMNS = {"output_meta": "TEXT"}
+
+
+def job_key(image_bytes: bytes, params: Dict[str, Any]) -> str:
+    return hash_bytes('render', image_bytes, json.dumps(params, sort_keys=True))
+
+
+class RenderQueue:
+    def __init__(self, root: str = QUEUE_DIR, output_ext: str = '.mp4', max_attempts: int = MAX_ATTEMPTS,
+                 lease_seconds: float = LEASE_SECONDS, output_dir: Optional[str] = None):
+        self.root = root
+        self.output_ext = output_ext
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.output_dir = output_dir or os.path.join(root, 'outputs')
+        os.makedirs(os.path.join(root, 'inputs'), exist_ok=True)
+        os.makedirs(self.output_dir, exist_ok=True)
+        # isolation_level=None: tự quản lý transaction (BEGIN IMMEDIATE khi nhận job)
+        self.db = sqlite3.connect(os.path.join(root, 'queue.sqlite'), timeout=30, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(SCHEMA)
+        columns = {row['name'] for row in self.db.execute('PRAGMA table_info(jobs)')}
+        for name, kind in ADDED_COLUMNS.items():
+            if name not in columns:
+                self.db.execute(f'ALTER TABLE jobs ADD COLUMN {name} {kind}')
+
+    def close(self):
+        self.db.close()
+
+    def input_path(self, key: str) -> str:
+        return os.path.join(self.root, 'inputs', key + '.png')
+
+    def output_path(self, key: str) -> str:
+        return os.path.join(self.output_dir, key + self.output_ext)
+
+    def known_meta(self, key: str, output_path: str) -> Optional[str]:
+        """Thông tin file (JSON) của output đã có, lấy từ job khác cùng key + cùng đường dẫn"""
+        row = self.db.execute("SELECT output_meta FROM jobs WHERE job_key = ? AND output_path = ?"
+                              " AND output_meta IS NOT NULL LIMIT 1", (key, output_path)).fetchone()
+        return row['output_meta'] if row else None
+
+    def enqueue(self, batch: str, position: int, image_png: bytes, params: Dict[str, Any],
+                file_name: Optional[str] = None, panel_id: Any = None) -> str:
+        """
+        Thêm job (bỏ qua nếu (batch, position) đã có: chạy lại cùng request là tiếp tục batch cũ).
+        Output của key đã tồn tại thì job được đánh dấu xong ngay (cached). Trả về key.
+        """
+        key = job_key(image_png, params)
+        now = time.time()
+        output_path = self.output_path(key)
+        exists = os.path.exists(output_path)
+        if not exists and not os.path.exists(self.input_path(key)):
+            tmp_path = self.input_path(key) + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(image_png)
+            os.replace(tmp_path, self.input_path(key))
+        self.db.execute(
+            "INSERT OR IGNORE INTO jobs (batch, position, file_name, panel_id, job_key, params, status, output_path,"
+            " output_meta, cached, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (batch, position, file_name, None if panel_id is None else str(panel_id), key,
+             json.dumps(params, sort_keys=True), 'done' if exists else 'pending',
+             output_path if exists else None, self.known_meta(key, output_path) if exists else None,
+             int(exists), now, now))
+        return key
+
+    def claim(self, worker: str, batch: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Nhận một job chờ (hoặc job của worker đã hết hạn giữ), tăng attempts. None nếu hết job"""
+        now = time.time()
+        where = "(status = 'pending' OR (status = 'running' AND lease_until < ?))"
+        args: List[Any] = [now]
+        if batch is not None:
+            where += " AND batch = ?"
+            args.append(batch)
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            row = self.db.execute(f"SELECT * FROM jobs WHERE {where} ORDER BY created_at, batch, position LIMIT 1",
+                                  args).fetchone()
+            if row is None:
+                self.db.execute('COMMIT')
+                return None
+            self.db.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, lease_until = ?,"
+                " updated_at = ? WHERE batch = ? AND position = ?",
+                (worker, now + self.lease_seconds, now, row['batch'], row['position']))
+            self.db.execute('COMMIT')
+        except Exception:
+            self.db.execute('ROLLBACK')
+            raise
+        job = dict(row)
+        job['attempts'] += 1
+        job['params'] = json.loads(job['params'])
+        return job
+
+    def complete(self, job: Dict[str, Any], output_path: str, cached: bool = False,
+                 meta: Optional[Dict[str, Any]] = None):
+        """
+        Đánh dấu xong job, cùng mọi job khác đang chờ cùng key (đánh dấu cached).
+        `meta`: thông tin file output (size, duration...); None thì giữ thông tin đã biết của output đó
+        """
+        meta_json = json.dumps(meta) if meta is not None else self.known_meta(job['job_key'], output_path)
+        self.db.execute(
+            "UPDATE jobs SET status = 'done', output_path = ?, output_meta = ?, error = NULL, lease_until = NULL,"
+            " cached = CASE WHEN batch = ? AND position = ? THEN ? ELSE 1 END, updated_at = ?"
+            " WHERE job_key = ? AND status != 'done'",
+            (output_path, meta_json, job['batch'], job['position'], int(cached), time.time(), job['job_key']))
+
+    def fail(self, job: Dict[str, Any], error: str):
+        """Lỗi: đưa lại hàng đợi, hoặc 'failed' nếu đã thử đủ max_attempts lần"""
+        status = 'failed' if job['attempts'] >= self.max_attempts else 'pending'
+        self.db.execute(
+            "UPDATE jobs SET status = ?, error = ?, lease_until = NULL, updated_at = ? WHERE batch = ? AND position = ?",
+            (status, error, time.time(), job['batch'], job['position']))
+
+    def release_dead_workers(self, host: str) -> int:
+        """
+        Đưa lại hàng đợi các job 'running' của worker trên máy `host` mà process đã chết (crash giữa chừng),
+        không phải chờ hết lease. Worker có dạng "host:pid". Trả về số job
+        """
+        released = 0
+        rows = self.db.execute("SELECT batch, position, worker FROM jobs WHERE status = 'running' AND worker LIKE ?",
+                               (host + ':%',)).fetchall()
+        for row in rows:
+            pid = int(row['worker'].rsplit(':', 1)[1])
+            try:
+                os.kill(pid, 0)
+                continue
+            except ProcessLookupError:
+                pass
+            except OSError:
+                continue
+            released += self.db.execute(
+                "UPDATE jobs SET status = 'pending', lease_until = NULL, updated_at = ?"
+                " WHERE batch = ? AND position = ? AND status = 'running' AND worker = ?",
+                (time.time(), row['batch'], row['position'], row['worker'])).rowcount
+        return released
+
+    def retry_failed(self, batch: Optional[str] = None) -> int:
+        """Đưa các job 'failed' về hàng đợi (reset attempts). Trả về số job"""
+        query = "UPDATE jobs SET status = 'pending', attempts = 0, updated_at = ? WHERE status = 'failed'"
+        args: List[Any] = [time.time()]
+        if batch is not None:
+            query += " AND batch = ?"
+            args.append(batch)
+        return self.db.execute(query, args).rowcount
+
+    def jobs(self, batch: str) -> List[Dict[str, Any]]:
+        rows = self.db.execute("SELECT * FROM jobs WHERE batch = ? ORDER BY position", (batch,)).fetchall()
+        jobs = [dict(row) for row in rows]
+        for job in jobs:
+            job['output_meta'] = json.loads(job['output_meta']) if job['output_meta'] else None
+        return jobs
+
+    def status(self, batch: Optional[str] = None) -> Dict[str, Any]:
+        """Tiến độ theo batch: {batch: {"total", "pending", "running", "done", "failed", "cached", "files": {...}}}"""
+        query = ("SELECT batch, file_name, status, COUNT(*) AS n, SUM(cached) AS cached, MAX(updated_at) AS updated"
+                 " FROM jobs")
+        args: List[Any] = []
+        if batch is not None:
+            query += " WHERE batch = ?"
+            args.append(batch)
+        report: Dict[str, Any] = {}
+        for row in self.db.execute(query + " GROUP BY batch, file_name, status", args):
+            entry = report.setdefault(row['batch'], {"total": 0, **{s: 0 for s in STATUSES}, "cached": 0,
+                                                     "updatedAt": 0, "files": {}})
+            entry["total"] += row['n']
+            entry[row['status']] += row['n']
+            entry["cached"] += row['cached'] or 0
+            entry["updatedAt"] = max(entry["updatedAt"], row['updated'])
+            file_entry = entry["files"].setdefault(row['file_name'], {"total": 0, "done": 0})
+            file_entry["total"] += row['n']
+            if row['status'] == 'done':
+                file_entry["done"] += row['n']
+        for entry in report.values():
+            entry["progress"] = round(entry["done"] / entry["total"], 4) if entry["total"] else 1.0
+        return report
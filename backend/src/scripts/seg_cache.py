@@ -0,0 +1,130 @@
+"""
+Cache kết quả segmentation (YOLO-seg) dùng chung giữa bubble_detector.py và panel_inpainter.py.
+
+Hai script chạy cùng model trên cùng các panel crop (detect bong bóng rồi xóa bong bóng), nên kết quả
+của lần chạy trước được lưu lại theo hash pixel của crop.
+
+- bubble_detector: SEG_PREDICT_ARGS (retina_masks=False, mask ở độ phân giải input của model: đủ cho polygon,
+  batch nhanh hơn)
+- panel_inpainter: INPAINT_PREDICT_ARGS (retina_masks=True, mask ở độ phân giải panel: mép mask nét như
+  trước khi có cache). Tham số predict nằm trong version nên hai loại mask không bao giờ bị dùng lẫn
+
+- version = format + fingerprint file model (tên, dung lượng, mtime) + tham số predict:
+  thay model hoặc đổi conf / iou là cache cũ tự miss
+- value   = {"shape": [mh, mw], "classes": [...], "masks": [counts, ...]}: mask nhị phân ở độ phân giải
+  input của model (đã bỏ viền letterbox), RLE nén kiểu COCO (mask_codec.py)
+
+Biến môi trường:
+    SEG_CACHE_DIR       Thư mục cache (mặc định scripts/cache/segmentation)
+    SEG_CACHE_TTL       Thời gian sống (giây), mặc định 7 ngày
+    SEG_CACHE_MAX_MB    Dung lượng tối đa, mặc định 200MB
+    SEG_CACHE_DISABLED  Đặt "1" để tắt cache
+"""
+import os
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from disk_cache import DiskCache, DEFAULT_CACHE_ROOT, hash_bytes
+from mask_codec import counts_to_string, string_to_counts, rle_counts, mask_from_counts
+
+# Tăng khi đổi format value để cache cũ tự vô hiệu
+SEG_CACHE_FORMAT = 'seg-rle-v2'
+# Tham số predict của bubble_detector (retina_masks=False: mask ở độ phân giải input của model,
+# scale về panel khi cần) và của panel_inpainter (mask ở độ phân giải panel cho mép vùng xóa)
+SEG_PREDICT_ARGS = dict(conf=0.2, iou=0.4, retina_masks=False, verbose=False)
+INPAINT_PREDICT_ARGS = dict(SEG_PREDICT_ARGS, retina_masks=True)
+MASK_THRESHOLD = 0.5
+
+_caches: Dict[str, DiskCache] = {}
+
+
+def model_fingerprint(model, predict_args: Dict[str, Any] = SEG_PREDICT_ARGS) -> str:
+    path = getattr(model, 'ckpt_path', None)
+    if path and os.path.exists(path):
+        stat = os.stat(path)
+        ident = f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    else:
+        ident = getattr(model, 'model_name', None) or type(model).__name__
+    args = ",".join(f"{k}={predict_args[k]}" for k in sorted(predict_args) if k != 'verbose')
+    return f"{ident}|{args}"
+
+
+def get_seg_cache(model, predict_args: Dict[str, Any] = SEG_PREDICT_ARGS) -> DiskCache:
+    version = f"{SEG_CACHE_FORMAT}|{model_fingerprint(model, predict_args)}"
+    if version not in _caches:
+        _caches[version] = DiskCache(
+            os.environ.get('SEG_CACHE_DIR', os.path.join(DEFAULT_CACHE_ROOT, 'segmentation')),
+            version=version,
+            ttl_seconds=float(os.environ.get('SEG_CACHE_TTL', 7 * 24 * 3600)),
+            max_bytes=int(float(os.environ.get('SEG_CACHE_MAX_MB', 200)) * 1024 * 1024),
+            enabled=os.environ.get('SEG_CACHE_DISABLED') != '1',
+        )
+    return _caches[version]
+
+
+def seg_cache_key(image_bgr) -> str:
+    return hash_bytes('segmentation', image_bgr)
+
+
+# --- Chuyển đổi kết quả ultralytics <-> dữ liệu cache ---
+def mask_content_box(mask_shape, h, w):
+    """(top, left, new_h, new_w): vùng ảnh thật trong mask letterbox, bỏ phần viền pad"""
+    mh, mw = mask_shape
+    r = min(mh / h, mw / w)
+    new_h, new_w = int(round(h * r)), int(round(w * r))
+    top, left = int(round((mh - new_h) / 2 - 0.1)), int(round((mw - new_w) / 2 - 0.1))
+    return top, left, new_h, new_w
+
+
+def segmentation_from_result(result, h: int, w: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Result của model.predict -> (classes (N,), masks nhị phân uint8 (N, mh, mw) không còn viền letterbox)"""
+    if result.masks is None:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, 0, 0), dtype=np.uint8)
+    classes = result.boxes.cls.cpu().numpy().astype(np.int64)
+    masks = result.masks.data.cpu().numpy()
+    top, left, new_h, new_w = mask_content_box(masks.shape[1:], h, w)
+    masks = (masks[:, top:top + new_h, left:left + new_w] > MASK_THRESHOLD).astype(np.uint8)
+    return classes, masks
+
+
+def encode_segmentation(classes: np.ndarray, masks: np.ndarray) -> Dict[str, Any]:
+    return {
+        "shape": list(masks.shape[1:]),
+        "classes": [int(c) for c in classes],
+        "masks": [counts_to_string(rle_counts(m)) for m in masks],
+    }
+
+
+def decode_segmentation(value: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray]:
+    shape = tuple(value["shape"])
+    classes = np.asarray(value["classes"], dtype=np.int64)
+    if not value["masks"]:
+        return classes, np.zeros((0,) + shape, dtype=np.uint8)
+    return classes, np.stack([mask_from_counts(string_to_counts(counts), shape) for counts in value["masks"]])
+
+
+def load_segmentation(cache: DiskCache, key: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    value = cache.get(key)
+    if value is None:
+        return None
+    try:
+        return decode_segmentation(value)
+    except (KeyError, ValueError, TypeError):
+        return None
+
+
+def predict_segmentation(image_bgr, model, cache: Optional[DiskCache] = None,
+                         predict_args: Dict[str, Any] = SEG_PREDICT_ARGS) -> Tuple[np.ndarray, np.ndarray, bool]:
+    """Segment một panel, ưu tiên cache. Trả về (classes, masks, cached)"""
+    cache = cache or get_seg_cache(model, predict_args)
+    key = seg_cache_key(image_bgr)
+    cached = load_segmentation(cache, key)
+    if cached is not None:
+        return cached[0], cached[1], True
+
+    h, w = image_bgr.shape[:2]
+    result = model.predict(image_bgr, **predict_args)[0]
+    classes, masks = segmentation_from_result(result, h, w)
+    cache.set(key, encode_segmentation(classes, masks))
+    return classes, masks, False
@@ -0,0 +1,201 @@
+"""
+Đọc request / ghi kết quả theo kiểu streaming cho các script nhận dữ liệu qua stdin
+(bubble_detector.py, panel_inpainter.py).
+
+Request cũ là một JSON lớn {"filesData": [{"fileName", "panels": [{..., base64}, ...]}, ...]}.
+Thay vì sys.stdin.read() + json.loads (nhiều bản sao của cả request trong RAM), ta:
+  - JSON  : parse tăng dần bằng ijson, mỗi lần chỉ giữ một panel
+            (không có ijson thì quay về json.load như cũ)
+  - NDJSON: (`--ndjson`) mỗi dòng một panel {"fileName", "panelId", ...}, các dòng liên tiếp
+            cùng fileName thuộc cùng một file; có thể có dòng {"options": {...}}
+
+Các event được trả về theo thứ tự: ('file_start', index, meta), ('panel', index, panel),
+('file_end', index, meta). Mọi key cấp cao nhất khác filesData (kể cả object / mảng như "video") được đưa vào
+`options`; với ijson, key đứng sau filesData chỉ có mặt sau khi đã xử lý hết panel (có cảnh báo ra stderr),
+nên các option ảnh hưởng tới từng panel phải được gửi trước filesData. `meta` là dict các field vô hướng của file ({"fileName": ...}); với ijson
+nó được điền dần (fileName thường đứng trước panels nên đã có khi gặp panel đầu tiên).
+
+Kết quả được ghi ngay khi từng panel xong:
+  - JsonResultWriter  : vẫn đúng format {"data": [{"panels": [...], "fileName"}, ...], ...} (controller không đổi)
+  - NdjsonResultWriter: mỗi panel một dòng {"type": "panel", ...}, cuối cùng {"type": "summary", ...}
+"""
+import sys
+import json
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+try:
+    import ijson
+    IJSON_AVAILABLE = True
+except ImportError:
+    IJSON_AVAILABLE = False
+
+Event = Tuple[str, int, Optional[Dict[str, Any]]]
+
+FILES_KEY = 'filesData'
+FILES_PREFIX = 'filesData.item'
+PANELS_PREFIX = 'filesData.item.panels.item'
+SCALAR_EVENTS = ('string', 'number', 'boolean', 'null')
+# Chuỗi base64 của panel dài vài MB: buffer mặc định 64KB của ijson làm việc nối chuỗi chậm ~10 lần
+READ_BUFFER_SIZE = 1 << 20
+
+
+def _build_value(parser, event, value):
+    """Dựng cả object / mảng bắt đầu bằng (event, value) từ các event tiếp theo của parser"""
+    builder = ijson.ObjectBuilder()
+    builder.event(event, value)
+    depth = 1
+    for _, inner_event, inner_value in parser:
+        builder.event(inner_event, inner_value)
+        if inner_event in ('start_map', 'start_array'):
+            depth += 1
+        elif inner_event in ('end_map', 'end_array'):
+            depth -= 1
+            if depth == 0:
+                break
+    return builder.value
+
+
+def _iter_ijson_events(stream, options: Dict[str, Any]) -> Iterator[Event]:
+    parser = ijson.parse(stream, use_float=True, buf_size=READ_BUFFER_SIZE)
+    file_index = -1
+    file_meta: Dict[str, Any] = {}
+    files_seen = False
+    for prefix, event, value in parser:
+        if prefix and '.' not in prefix and prefix != FILES_KEY and event not in ('map_key', 'end_map', 'end_array'):
+            # Option cấp cao nhất (batchSize, "video": {...}, ...)
+            options[prefix] = _build_value(parser, event, value) if event in ('start_map', 'start_array') else value
+            if files_seen:
+                sys.stderr.write(f"[PY][WARNING] Option '{prefix}' đứng sau filesData: không áp dụng cho các panel "
+                                 f"đã xử lý (gửi option trước filesData)\n")
+            continue
+        if prefix == FILES_KEY and event == 'start_array':
+            files_seen = True
+        if prefix == FILES_PREFIX and event == 'start_map':
+            file_index += 1
+            file_meta = {}
+            yield 'file_start', file_index, file_meta
+        elif prefix == FILES_PREFIX and event == 'end_map':
+            yield 'file_end', file_index, file_meta
+        elif prefix == PANELS_PREFIX and event == 'start_map':
+            # Dựng object của một panel, bỏ đi ngay sau khi xử lý xong
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+            for inner_prefix, inner_event, inner_value in parser:
+                if inner_prefix == PANELS_PREFIX and inner_event == 'end_map':
+                    break
+                builder.event(inner_event, inner_value)
+            yield 'panel', file_index, builder.value
+        elif event in SCALAR_EVENTS and prefix.startswith(FILES_PREFIX + '.') and prefix.count('.') == 2:
+            file_meta[prefix.rsplit('.', 1)[1]] = value
+
+
+def _iter_document_events(request_data: Dict[str, Any], options: Dict[str, Any]) -> Iterator[Event]:
+    options.update({k: v for k, v in request_data.items() if k != 'filesData'})
+    for file_index, file_info in enumerate(request_data.get('filesData', [])):
+        file_meta = {k: v for k, v in file_info.items() if k != 'panels'}
+        yield 'file_start', file_index, file_meta
+        for panel in file_info.get('panels', []):
+            yield 'panel', file_index, panel
+        yield 'file_end', file_index, file_meta
+
+
+def _iter_ndjson_events(stream, options: Dict[str, Any]) -> Iterator[Event]:
+    file_index, file_name = -1, None
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        item = json.loads(line)
+        if 'options' in item and 'panelId' not in item:
+            options.update(item['options'])
+            continue
+        if file_index < 0 or item.get('fileName') != file_name:
+            if file_index >= 0:
+                yield 'file_end', file_index, {"fileName": file_name}
+            file_index, file_name = file_index + 1, item.get('fileName')
+            yield 'file_start', file_index, {"fileName": file_name}
+        yield 'panel', file_index, item
+    if file_index >= 0:
+        yield 'file_end', file_index, {"fileName": file_name}
+
+
+def request_is_empty(stream=None) -> bool:
+    """stdin không có dữ liệu: script thoát im lặng (không ghi gì ra stdout) như khi còn đọc cả request"""
+    stream = stream or sys.stdin.buffer
+    # peek chờ tới khi có byte đầu tiên hoặc EOF, không lấy dữ liệu ra khỏi buffer
+    return not stream.peek(1)
+
+
+def iter_request(options: Dict[str, Any], ndjson: bool = False, stream=None) -> Iterator[Event]:
+    """Đọc request từ stdin theo từng panel. `options` được điền dần các option cấp cao nhất."""
+    if ndjson:
+        return _iter_ndjson_events(stream or sys.stdin, options)
+    if IJSON_AVAILABLE:
+        return _iter_ijson_events(stream or sys.stdin.buffer, options)
+    sys.stderr.write("[PY][WARNING] Thiếu ijson, đọc toàn bộ request vào bộ nhớ (pip install ijson)\n")
+    raw = (stream or sys.stdin).read()
+    return _iter_document_events(json.loads(raw) if raw else {}, options)
+
+
+class JsonResultWriter:
+    """Ghi {"data": [...]} từng phần; file đang mở được đóng lại nếu gặp lỗi giữa chừng để JSON vẫn hợp lệ"""
+
+    def __init__(self, out=None):
+        self.out = out or sys.stdout
+        self.file_count = 0
+        self.panel_count = 0
+        self.file_open = False
+        self.out.write('{"data": [')
+
+    def start_file(self, file_index: int):
+        if self.file_count:
+            self.out.write(', ')
+        self.out.write('{"panels": [')
+        self.file_count += 1
+        self.panel_count = 0
+        self.file_open = True
+
+    def write_panel(self, file_index: int, panel_result: Dict[str, Any]):
+        if self.panel_count:
+            self.out.write(', ')
+        self.out.write(json.dumps(panel_result, ensure_ascii=False))
+        self.out.flush()
+        self.panel_count += 1
+
+    def end_file(self, file_index: int, file_meta: Optional[Dict[str, Any]]):
+        self.out.write(f'], "fileName": {json.dumps((file_meta or {}).get("fileName"), ensure_ascii=False)}}}')
+        self.file_open = False
+
+    def close(self, **extra):
+        if self.file_open:
+            self.end_file(-1, None)
+        self.out.write(']')
+        for key, value in extra.items():
+            self.out.write(f', {json.dumps(key)}: {json.dumps(value, ensure_ascii=False)}')
+        self.out.write('}\n')
+        self.out.flush()
+
+
+class NdjsonResultWriter:
+    def __init__(self, out=None):
+        self.out = out or sys.stdout
+
+    def _line(self, message: Dict[str, Any]):
+        self.out.write(json.dumps(message, ensure_ascii=False) + '\n')
+        self.out.flush()
+
+    def start_file(self, file_index: int):
+        pass
+
+    def write_panel(self, file_index: int, panel_result: Dict[str, Any]):
+        self._line({"type": "panel", "fileIndex": file_index, **panel_result})
+
+    def end_file(self, file_index: int, file_meta: Optional[Dict[str, Any]]):
+        self._line({"type": "file", "fileIndex": file_index, "fileName": (file_meta or {}).get('fileName')})
+
+    def close(self, **extra):
+        self._line({"type": "summary", **extra})
+
+
+def make_writer(ndjson: bool = False, out=None):
+    return NdjsonResultWriter(out) if ndjson else JsonResultWriter(out)
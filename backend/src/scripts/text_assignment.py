@@ -0,0 +1,107 @@
+"""
+Gán cụm chữ (textBlocks) vào panel bằng NumPy thay cho vòng lặp panel x block trong Python.
+
+Quy tắc giữ nguyên như vòng lặp cũ trong detect_text_in_comic:
+  1. Nếu tâm cụm chữ nằm trong một (hoặc nhiều) panel -> chọn panel ĐẦU TIÊN chứa nó.
+  2. Ngược lại -> chọn panel có tâm gần nhất (khoảng cách Euclid, hòa thì lấy panel đứng trước).
+Tâm cụm chữ = tổng tọa độ các đỉnh / 4 (giống get_center).
+"""
+from typing import List, Dict, Any, Sequence, Tuple
+import numpy as np
+
+# Giới hạn số cặp (block, panel) mỗi lần tính để không cấp phát ma trận quá lớn
+MAX_PAIRS_PER_CHUNK = 4_000_000
+
+
+def vertices_to_array(blocks: Sequence[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Trả về (vertices, counts): vertices shape (N, K, 2) float64 (K = số đỉnh lớn nhất, phần thiếu = 0),
+    counts shape (N,) là số đỉnh thật của mỗi block. Tọa độ thiếu 'x'/'y' (Vision bỏ qua số 0) coi là 0.
+    """
+    coords = [[(v.get('x', 0), v.get('y', 0)) for v in b.get('vertices', [])] for b in blocks]
+    counts = np.fromiter((len(c) for c in coords), dtype=np.int64, count=len(coords))
+    k = int(counts.max()) if len(coords) else 0
+    if len(coords) and (counts == k).all():
+        # Trường hợp thường gặp: mọi block đều có 4 đỉnh -> tạo mảng một lần
+        return np.asarray(coords, dtype=np.float64).reshape(len(coords), k, 2), counts
+
+    vertices = np.zeros((len(coords), k, 2), dtype=np.float64)
+    for i, c in enumerate(coords):
+        if c:
+            vertices[i, :len(c)] = c
+    return vertices, counts
+
+
+def assign_centers_to_panels(centers: np.ndarray, panels: np.ndarray) -> np.ndarray:
+    """
+    centers: (N, 2), panels: (P, 4) dạng (x, y, w, h). Trả về (N,) index panel, -1 nếu không có panel.
+    """
+    n, p = len(centers), len(panels)
+    if n == 0 or p == 0:
+        return np.full(n, -1, dtype=np.int64)
+
+    px, py, pw, ph = (panels[:, i] for i in range(4))
+    panel_cx, panel_cy = px + pw / 2, py + ph / 2
+
+    assignments = np.empty(n, dtype=np.int64)
+    chunk = max(1, MAX_PAIRS_PER_CHUNK // p)
+    for start in range(0, n, chunk):
+        cx = centers[start:start + chunk, 0:1]
+        cy = centers[start:start + chunk, 1:2]
+
+        # (n_chunk, P) mask: tâm nằm trong panel
+        inside = (px <= cx) & (cx <= px + pw) & (py <= cy) & (cy <= py + ph)
+        has_inside = inside.any(axis=1)
+        result = inside.argmax(axis=1)
+
+        # Block nằm ngoài mọi panel: khoảng cách tới tâm panel, argmin lấy panel đầu tiên khi hòa
+        outside = ~has_inside
+        if outside.any():
+            result[outside] = np.hypot(cx[outside] - panel_cx, cy[outside] - panel_cy).argmin(axis=1)
+
+        assignments[start:start + chunk] = result
+
+    return assignments
+
+
+def assign_text_blocks(blocks: Sequence[Dict[str, Any]], panel_coords: Sequence[Tuple[int, int, int, int]]):
+    """
+    Trả về (assignments, local_vertices, counts):
+      assignments   (N,) index panel của mỗi block (-1 nếu block rỗng / không có panel)
+      local_vertices (N, K, 2) tọa độ đỉnh đã trừ gốc (x, y) của panel được gán
+      counts        (N,) số đỉnh thật của mỗi block
+    """
+    vertices, counts = vertices_to_array(blocks)
+    panels = np.asarray(panel_coords, dtype=np.float64).reshape(-1, 4)
+
+    centers = vertices.sum(axis=1) / 4 if vertices.shape[1] else np.zeros((len(blocks), 2))
+    assignments = assign_centers_to_panels(centers, panels)
+    assignments[counts == 0] = -1
+
+    local_vertices = vertices.copy()
+    valid = assignments >= 0
+    if valid.any():
+        local_vertices[valid] -= panels[assignments[valid], None, 0:2]
+    return assignments, local_vertices, counts
+
+
+def group_blocks_by_panel(blocks: Sequence[Dict[str, Any]], panel_coords) -> List[List[Dict[str, Any]]]:
+    """Tiện ích cho detect_text_in_comic: trả về danh sách textBlocks (tọa độ local) cho từng panel."""
+    grouped: List[List[Dict[str, Any]]] = [[] for _ in panel_coords]
+    if not blocks or not grouped:
+        return grouped
+
+    assignments, local_vertices, counts = assign_text_blocks(blocks, panel_coords)
+    # Giữ kiểu int khi mọi tọa độ là số nguyên (Vision trả về int) để JSON output không đổi
+    if np.array_equal(local_vertices, np.round(local_vertices)):
+        local_vertices = local_vertices.astype(np.int64)
+    local_list = local_vertices.tolist()
+    panel_of = assignments.tolist()
+    count_of = counts.tolist()
+
+    for i in np.flatnonzero(assignments >= 0).tolist():
+        grouped[panel_of[i]].append({
+            "text": blocks[i]["text"],
+            "vertices": [{"x": x, "y": y} for x, y in local_list[i][:count_of[i]]]
+        })
+    return grouped
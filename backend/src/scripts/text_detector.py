@@ -7,11 +7,16 @@ import cv2
 import numpy as np
 import os
 import time
-import subprocess
-import tempfile
-import math
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from ocr_cache import get_ocr_cache, ocr_cache_key
+from ocr_engines import get_engine, OCREngine, encode_jpeg
+from ocr_regions import build_region_mosaics, map_blocks_to_page
+from text_assignment import group_blocks_by_panel
+from mask_codec import encode_polygons
+
 # YOLOv12 imports
 try:
     from ultralytics import YOLO
@@ -51,86 +56,92 @@ def read_image_bgr(path: str) -> np.ndarray:
 
 def encode_image_to_base64(image_bgr: np.ndarray) -> str:
     """Encode ảnh thành base64 string"""
-    ok, buffer = cv2.imencode('.jpg', image_bgr, [int(cv2.IMWRITE_JPEG_QUALITY), 90])
-    if not ok: 
-        raise ValueError("Lỗi encode ảnh")
-    return base64.b64encode(buffer.tobytes()).decode('utf-8')
+    return base64.b64encode(encode_jpeg(image_bgr)).decode('utf-8')
 
 def crop_panel(image_bgr: np.ndarray, x: int, y: int, w: int, h: int) -> np.ndarray:
     """Crop panel từ ảnh gốc"""
     return image_bgr[y:y+h, x:x+w]
 
-def call_vision_api(image_base64: str, credentials_path: str) -> Dict[str, Any]:
-    """Gọi Google Cloud Vision API để detect text"""
-    try:
-        # Tạo file tạm để lưu ảnh
-        with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as temp_file:
-            # Decode base64 và lưu vào file tạm
-            image_data = base64.b64decode(image_base64)
-            temp_file.write(image_data)
-            temp_file_path = temp_file.name
-        
-        # Gọi Node.js script để sử dụng Vision API
-        node_script_path = os.path.join(os.path.dirname(__file__), 'vision_text_detector.js')
-        
-        cmd = [
-            'node', 
-            node_script_path,
-            temp_file_path,
-            credentials_path
-        ]
-        
-        print(f"[PY] Calling Vision API with cmd: {' '.join(cmd)}", file=sys.stderr)
-        
-        result = subprocess.run(
-            cmd, 
-            capture_output=True, 
-            text=True, 
-            timeout=30,
-            cwd=os.path.dirname(__file__),
-            encoding='utf-8',
-            errors='replace'
-        )
-        
-        # Cleanup temp file
-        try:
-            os.unlink(temp_file_path)
-        except:
-            pass
-        
-        if result.returncode != 0:
-            print(f"[PY][ERROR] Vision API call failed: {result.stderr}", file=sys.stderr)
-            raise RuntimeError(f"Vision API call failed: {result.stderr}")
-        
-        # Parse JSON response
-        if not result.stdout:
-            print(f"[PY][ERROR] Vision API returned empty stdout", file=sys.stderr)
-            raise RuntimeError("Vision API returned empty response")
-        
-        # Debug stdout content
-        print(f"[PY] Raw stdout length: {len(result.stdout)}", file=sys.stderr)
-        print(f"[PY] Raw stdout preview: {repr(result.stdout[:200])}", file=sys.stderr)
-            
-        try:
-            response = json.loads(result.stdout)
-            print(f"[PY] Vision API response parsed successfully", file=sys.stderr)
-        except json.JSONDecodeError as e:
-            print(f"[PY][ERROR] JSON decode error: {e}", file=sys.stderr)
-            print(f"[PY][ERROR] Raw stdout: {result.stdout}", file=sys.stderr)
-            raise RuntimeError(f"Failed to parse Vision API response: {e}")
-        
-        return response
-        
-    except subprocess.TimeoutExpired:
-        print(f"[PY][ERROR] Vision API call timeout", file=sys.stderr)
-        raise RuntimeError("Vision API call timeout")
-    except json.JSONDecodeError as e:
-        print(f"[PY][ERROR] Failed to parse Vision API response: {e}", file=sys.stderr)
-        print(f"[PY][ERROR] Raw response: {result.stdout}", file=sys.stderr)
-        raise RuntimeError(f"Failed to parse Vision API response: {e}")
-    except Exception as e:
-        print(f"[PY][ERROR] Vision API call error: {str(e)}", file=sys.stderr)
-        raise
+def ocr_images(images: List[Tuple[Any, np.ndarray]], engine: OCREngine, **options) -> Tuple[Dict[Any, Dict[str, Any]], int]:
+    """
+    OCR nhiều ảnh: ảnh đã OCR trước đó (cùng nội dung, cùng engine) lấy từ cache, phần còn lại gửi một lượt
+    qua engine.detect_many (Vision: batch + retry qua BatchOCR). `options`: batch_size, concurrency.
+    Trả về ({key: {"success", "textBlocks", "error"?}}, số cache hit)
+    """
+    cache = get_ocr_cache()
+    responses, items, cache_keys = {}, [], {}
+    for key, image in images:
+        cache_keys[key] = ocr_cache_key(image, engine.version)
+        cached = cache.get(cache_keys[key])
+        if cached is not None:
+            responses[key] = {"success": True, "textBlocks": cached}
+        else:
+            items.append((key, image))
+    hits = len(responses)
+    if hits:
+        print(f"[PY] OCR cache hit {hits}/{len(images)} ảnh", file=sys.stderr)
+
+    fresh = engine.detect_many(items, **options) if items else {}
+    for key, response in fresh.items():
+        if response.get('success', False):
+            cache.set(cache_keys[key], response.get('textBlocks', []))
+    responses.update(fresh)
+    return responses, hits
+
+def offset_text_blocks(blocks: List[Dict[str, Any]], ox: int, oy: int) -> List[Dict[str, Any]]:
+    """Đổi tọa độ textBlocks của một crop về tọa độ trang"""
+    return [{
+        "text": block.get('text', ''),
+        "vertices": [{"x": v.get('x', 0) + ox, "y": v.get('y', 0) + oy} for v in block.get('vertices', [])]
+    } for block in blocks]
+
+def page_regions(image_bgr: np.ndarray, ocr_mode: str = 'full', bubble_polygons=None, panel_coords=None,
+                 granularity: str = 'page'):
+    """
+    Các ảnh cần OCR của một trang: ([(tag, ảnh, hàm đổi textBlocks về tọa độ trang hoặc None)], stats).
+    ocr_mode='regions': mosaic các vùng nghi có chữ (bong bóng + MSER, xem ocr_regions.py), hoặc cả trang
+    nếu mosaic không nhẹ hơn; ưu tiên hơn granularity. granularity='panel': từng panel crop; còn lại cả trang
+    """
+    if ocr_mode == 'regions':
+        mosaics, stats = build_region_mosaics(image_bgr, bubble_polygons)
+        if mosaics is not None:
+            return [(('mosaic', m_idx), mosaic,
+                     lambda blocks, placements=placements: map_blocks_to_page(blocks, placements))
+                    for m_idx, (mosaic, placements) in enumerate(mosaics)], stats
+        return [(('page', 0), image_bgr, None)], stats
+    if granularity == 'panel' and panel_coords:
+        regions = []
+        for p_idx, (px, py, pw, ph) in enumerate(panel_coords):
+            x0, y0 = max(int(px), 0), max(int(py), 0)
+            crop = crop_panel(image_bgr, x0, y0, int(pw), int(ph))
+            if crop.size == 0: continue
+            regions.append((('panel', p_idx), crop, lambda blocks, x0=x0, y0=y0: offset_text_blocks(blocks, x0, y0)))
+        return regions, {"mode": "panel"}
+    return [(('page', 0), image_bgr, None)], {"mode": "full"}
+
+def collect_page_blocks(regions, responses: Dict[Any, Dict[str, Any]], key=lambda tag: tag) -> List[Dict[str, Any]]:
+    """Gom textBlocks của các ảnh một trang về tọa độ trang; ảnh OCR lỗi -> RuntimeError"""
+    blocks = []
+    for tag, _, to_page in regions:
+        response = responses.get(key(tag), {"success": False, "error": "Không có kết quả OCR"})
+        if not response.get('success', False):
+            raise RuntimeError(response.get('error', 'OCR thất bại'))
+        text_blocks = response.get('textBlocks', [])
+        blocks.extend(to_page(text_blocks) if to_page else text_blocks)
+    return blocks
+
+def ocr_page(image_bgr: np.ndarray, engine: OCREngine, ocr_mode: str = 'full', bubble_polygons=None,
+             panel_coords=None, granularity: str = 'page', **options):
+    """
+    OCR một trang (xem page_regions); mọi ảnh của trang gửi chung một lượt detect_many.
+    Trả về (textBlocks, cached, stats)
+    """
+    t0 = time.time()
+    regions, stats = page_regions(image_bgr, ocr_mode, bubble_polygons, panel_coords, granularity)
+    responses, hits = ocr_images([(tag, image) for tag, image, _ in regions], engine, **options)
+    blocks = collect_page_blocks(regions, responses)
+    stats["ocrTimeMs"] = int((time.time() - t0) * 1000)
+    return blocks, bool(regions) and hits == len(regions), stats
 
 
 # --- YOLOv12 PANEL DETECTION (MỚI) ---
@@ -220,52 +231,48 @@ def detect_panels_opencv(image_bgr: np.ndarray) -> List[tuple]:
     
     return panels
 
-def get_center(vertices):
-    """Tính tâm của cụm chữ dựa vào tọa độ 4 góc"""
-    x_coords = [v.get('x', 0) for v in vertices]
-    y_coords = [v.get('y', 0) for v in vertices]
-    return (sum(x_coords) / 4, sum(y_coords) / 4)
-
-def get_distance(px, py, rect):
-    """Tính khoảng cách từ điểm đến tâm của hình chữ nhật (Panel)"""
-    rx, ry, rw, rh = rect
-    cx, cy = rx + rw/2, ry + rh/2
-    return math.hypot(px - cx, py - cy)
-
 # --- HÀM ĐIỀU PHỐI CHÍNH (ĐÃ CẬP NHẬT) ---
-def detect_text_in_comic(image_bgr, credentials_path, model_path=None, panel_coords_json=None):
-    start_time = time.time()
-    h, w, _ = image_bgr.shape
-
-    # Detect panels (SỬ DỤNG LOGIC MỚI)
-    panel_coords = []
-    
+def resolve_panels(image_bgr, model_path=None, panel_coords_json=None):
+    """Lấy tọa độ panel từ JSON (nếu có), ngược lại detect bằng YOLO/OpenCV. Trả về (panel_coords, method)"""
     if panel_coords_json:
         print("[PY] Using panels from JSON input", file=sys.stderr)
         try:
-            panel_list = json.loads(panel_coords_json)
-            panel_coords = [(p['x'], p['y'], p['w'], p['h']) for p in panel_list]
-            method = "JSON_Input"
+            panel_list = json.loads(panel_coords_json) if isinstance(panel_coords_json, str) else panel_coords_json
+            return [(p['x'], p['y'], p['w'], p['h']) for p in panel_list], "JSON_Input"
         except Exception as e:
             print(f"[PY][ERROR] Failed to parse panel_coords_json: {e}", file=sys.stderr)
             print("[PY] Falling back to YOLO/OpenCV detection", file=sys.stderr)
-            panel_coords_json = None
 
-    if not panel_coords_json:
-        if YOLO_AVAILABLE:
-            print("[PY] Using YOLOv12 for panel detection", file=sys.stderr)
-            panel_coords = detect_panels_yolo(original, model_path)
-            method = "YOLOv12"
-        else:
-            print("[PY] Using OpenCV for panel detection (fallback)", file=sys.stderr)
-            panel_coords = detect_panels_opencv(original)
-            method = "OpenCV"
-    
-    image_base64 = encode_image_to_base64(image_bgr)
-    print("[PY] Calling Vision API on FULL image...", file=sys.stderr)
-    vision_result = call_vision_api(image_base64, credentials_path)
+    if YOLO_AVAILABLE:
+        print("[PY] Using YOLOv12 for panel detection", file=sys.stderr)
+        return detect_panels_yolo(image_bgr, model_path), "YOLOv12"
+
+    print("[PY] Using OpenCV for panel detection (fallback)", file=sys.stderr)
+    return detect_panels_opencv(image_bgr), "OpenCV"
+
+def detect_text_in_comic(image_bgr, credentials_path, model_path=None, panel_coords_json=None, engine_name=None,
+                         ocr_mode='full', bubble_polygons=None):
+    start_time = time.time()
+    engine = get_engine(engine_name, credentials_path)
+
+    # Detect panels (SỬ DỤNG LOGIC MỚI)
+    panel_coords, method = resolve_panels(image_bgr, model_path, panel_coords_json)
     
-    all_text_blocks = vision_result.get('textBlocks', [])
+    print(f"[PY] Running OCR ({engine.name}, mode={ocr_mode})...", file=sys.stderr)
+    try:
+        all_text_blocks, cached, ocr_stats = ocr_page(image_bgr, engine, ocr_mode, bubble_polygons)
+    finally:
+        engine.close()
+
+    result = build_text_result(image_bgr, panel_coords, method, all_text_blocks, start_time)
+    result["ocrEngine"] = engine.name
+    result["ocrCached"] = cached
+    result["ocrStats"] = ocr_stats
+    return result
+
+def build_text_result(image_bgr, panel_coords, method, all_text_blocks, start_time):
+    """Gán textBlocks (tọa độ trang) vào panel và dựng JSON kết quả + ảnh annotate"""
+    h, w, _ = image_bgr.shape
 
     panels_with_text = []
     for i, (px, py, pw, ph) in enumerate(panel_coords):
@@ -275,44 +282,10 @@ def detect_text_in_comic(image_bgr, credentials_path, model_path=None, panel_coo
             "textContent": ""
         })
 
-    # 3. GÁN TEXT VÀO PANEL GẦN NHẤT
-    for block in all_text_blocks:
-        vertices = block.get('vertices', [])
-        if len(vertices) == 0: continue
-        
-        # Lấy tâm cụm chữ
-        cx, cy = get_center(vertices)
-        
-        assigned_panel_idx = -1
-        min_distance = float('inf')
-        
-        for idx, (px, py, pw, ph) in enumerate(panel_coords):
-            # Kiểm tra xem tâm cụm chữ có nằm trong Panel này không
-            if px <= cx <= px + pw and py <= cy <= py + ph:
-                assigned_panel_idx = idx
-                break # Đã nằm trong panel thì chốt luôn
-            
-            # Nếu không nằm trong panel nào, tìm panel gần nhất
-            dist = get_distance(cx, cy, (px, py, pw, ph))
-            if dist < min_distance:
-                min_distance = dist
-                assigned_panel_idx = idx
-                
-        # Gán cụm chữ vào panel đó
-        if assigned_panel_idx != -1:
-            # Điều chỉnh tọa độ chữ về hệ tọa độ CỦA PANEL (Crop) để sau này Inpaint dễ vẽ Mask
-            panel_x, panel_y = panel_coords[assigned_panel_idx][0], panel_coords[assigned_panel_idx][1]
-            local_vertices = []
-            for v in vertices:
-                local_vertices.append({
-                    "x": v.get('x', 0) - panel_x,
-                    "y": v.get('y', 0) - panel_y
-                })
-            
-            panels_with_text[assigned_panel_idx]["textBlocks"].append({
-                "text": block["text"],
-                "vertices": local_vertices
-            })
+    # 3. GÁN TEXT VÀO PANEL GẦN NHẤT (vector hóa bằng NumPy, xem text_assignment.py)
+    # Tọa độ chữ được đổi về hệ tọa độ CỦA PANEL (Crop) để sau này Inpaint dễ vẽ Mask
+    for p, blocks in zip(panels_with_text, group_blocks_by_panel(all_text_blocks, panel_coords)):
+        p["textBlocks"] = blocks
 
     all_text = []
     result_img = image_bgr.copy() # Tạo bản sao ảnh để vẽ UI
@@ -349,7 +322,7 @@ def detect_text_in_comic(image_bgr, credentials_path, model_path=None, panel_coo
         "width": int(w),
         "height": int(h),
         "processingTime": duration_ms,
-        "detectionMethod": method if 'method' in locals() else "JSON_Input",
+        "detectionMethod": method,
         "totalTextDetected": len([p for p in panels_with_text if p['textDetected']]),
         "allText": "\n".join(all_text),
         "summary": {
@@ -360,14 +333,222 @@ def detect_text_in_comic(image_bgr, credentials_path, model_path=None, panel_coo
     }
 
 
+# --- CHẾ ĐỘ CHAPTER: OCR THEO BATCH CHO NHIỀU TRANG ---
+def detect_text_in_chapter(pages, credentials_path, model_path=None, batch_size=8, concurrency=4, granularity='page',
+                           engine_name=None, ocr_mode='full'):
+    """
+    pages: [{"imagePath": str, "panels": [{x, y, w, h}, ...] (tùy chọn), "bubbles": [[[x, y], ...], ...] (tùy chọn)}]
+    granularity='page' gửi cả trang, 'panel' gửi từng panel crop (tọa độ chữ được đổi lại về trang).
+    ocr_mode='regions' chỉ gửi mosaic các vùng nghi có chữ (ưu tiên hơn granularity).
+    Toàn bộ ảnh được gom lại và OCR một lượt qua engine (Vision: batch qua BatchOCR,
+    Tesseract: song song trên nhiều core), sau đó gán text cho từng trang.
+    """
+    start_time = time.time()
+    engine = get_engine(engine_name, credentials_path)
+    prepared = {}
+    page_errors = {}
+    images = []
+
+    # Ảnh cần OCR của từng trang: cùng cách chia với chế độ stream (page_regions), key = (trang, tag)
+    for idx, page in enumerate(pages):
+        image_path = page.get('imagePath')
+        try:
+            image = read_image_bgr(image_path)
+            panel_coords, method = resolve_panels(image, model_path, page.get('panels'))
+        except Exception as e:
+            page_errors[idx] = str(e)
+            continue
+        regions, stats = page_regions(image, ocr_mode, page.get('bubbles'), panel_coords, granularity)
+        prepared[idx] = (image, panel_coords, method, regions, stats)
+        images.extend(((idx, tag), region) for tag, region, _ in regions)
+
+    # Ảnh của cả chapter OCR một lượt (Vision: batch + retry qua BatchOCR, Tesseract: song song trên nhiều core)
+    ocr_start = time.time()
+    try:
+        responses, cache_hits = ocr_images(images, engine, batch_size=batch_size, concurrency=concurrency)
+    finally:
+        engine.close()
+    ocr_ms = int((time.time() - ocr_start) * 1000)
+
+    results = []
+    for idx, page in enumerate(pages):
+        image_path = page.get('imagePath')
+        if idx not in page_errors:
+            image, panel_coords, method, regions, stats = prepared[idx]
+            try:
+                blocks = collect_page_blocks(regions, responses, key=lambda tag, idx=idx: (idx, tag))
+            except RuntimeError as e:
+                page_errors[idx] = str(e)
+        if idx in page_errors:
+            results.append({"imagePath": image_path, "success": False, "error": page_errors[idx], "data": None})
+            continue
+        data = build_text_result(image, panel_coords, method, blocks, start_time)
+        data["ocrStats"] = stats
+        results.append({"imagePath": image_path, "success": True, "data": data})
+
+    return {
+        "data": results,
+        "ocrStats": {
+            "engine": engine.name,
+            "mode": ocr_mode,
+            "images": len(images),
+            "cacheHits": cache_hits,
+            "batchSize": batch_size,
+            "concurrency": concurrency,
+            "ocrTimeMs": ocr_ms,
+            "totalTimeMs": int((time.time() - start_time) * 1000)
+        }
+    }
+
+# --- CHẾ ĐỘ CHAPTER STREAMING (ASYNCIO) ---
+async def detect_text_in_chapter_stream(pages, credentials_path, emit, model_path=None, concurrency=8,
+                                        granularity='page', engine_name=None, ocr_mode='full', batch_size=8):
+    """
+    Xử lý nhiều trang song song: đọc ảnh, OCR (I/O mạng qua bridge) và gán text của các trang
+    khác nhau chồng lên nhau, tối đa `concurrency` trang cùng lúc (Semaphore).
+    Mỗi trang xong được `emit` ngay (không đợi cả chapter), nên tổng thời gian xấp xỉ
+    các lần OCR chậm nhất thay vì tổng của chúng.
+    """
+    loop = asyncio.get_running_loop()
+    engine = get_engine(engine_name, credentials_path)
+    semaphore = asyncio.Semaphore(max(1, int(concurrency)))
+    # cv2 / chờ bridge đều nhả GIL nên chạy trong thread pool là đủ
+    executor = ThreadPoolExecutor(max_workers=max(2, int(concurrency) * 2))
+    start_time = time.time()
+    ocr_total_ms = [0]
+
+    def run(fn, *args):
+        return loop.run_in_executor(executor, fn, *args)
+
+    async def process_page(idx, page):
+        image_path = page.get('imagePath')
+        async with semaphore:
+            page_start = time.time()
+            try:
+                image = await run(read_image_bgr, image_path)
+                panel_coords, method = await run(resolve_panels, image, model_path, page.get('panels'))
+
+                ocr_start = time.time()
+                # Mọi ảnh của trang (cả trang / panel crop / mosaic) đi chung một batch Vision, có retry khi bị throttle
+                blocks, cached, ocr_stats = await run(
+                    lambda: ocr_page(image, engine, ocr_mode, page.get('bubbles'), panel_coords, granularity,
+                                     batch_size=batch_size))
+                ocr_ms = int((time.time() - ocr_start) * 1000)
+                ocr_total_ms[0] += ocr_ms
+
+                data = await run(build_text_result, image, panel_coords, method, blocks, page_start)
+                data.update({"ocrEngine": engine.name, "ocrCached": cached, "ocrStats": {**ocr_stats, "ocrTimeMs": ocr_ms}})
+                result = {"index": idx, "imagePath": image_path, "success": True, "data": data}
+            except Exception as e:
+                print(f"[PY][ERROR] Page {idx} ({image_path}) failed: {str(e)}", file=sys.stderr)
+                result = {"index": idx, "imagePath": image_path, "success": False, "error": str(e), "data": None}
+        emit(result)
+        return result
+
+    try:
+        results = await asyncio.gather(*(process_page(idx, page) for idx, page in enumerate(pages)))
+    finally:
+        executor.shutdown(wait=False)
+        engine.close()
+
+    return {
+        "engine": engine.name,
+        "mode": ocr_mode,
+        "pages": len(pages),
+        "succeeded": sum(1 for r in results if r["success"]),
+        "concurrency": concurrency,
+        "sumOcrTimeMs": ocr_total_ms[0],
+        "wallTimeMs": int((time.time() - start_time) * 1000)
+    }
+
+def pop_option(argv, name):
+    """Lấy và xóa `--name value` khỏi argv (giữ nguyên thứ tự tham số vị trí)"""
+    if name in argv:
+        idx = argv.index(name)
+        if idx + 1 < len(argv):
+            value = argv[idx + 1]
+            del argv[idx:idx + 2]
+            return value
+    return None
+
+def encode_result_vertices(result):
+    """`--vertex-format delta`: thay "vertices" của mỗi textBlock bằng chuỗi "polygon" (mask_codec.py)"""
+    blocks = [block for panel in (result or {}).get('panels', []) for block in panel.get('textBlocks', [])]
+    points = [[[v.get('x', 0), v.get('y', 0)] for v in block.pop('vertices', [])] for block in blocks]
+    for block, polygon in zip(blocks, encode_polygons(points)):
+        block['polygon'] = polygon
+    return result
+
+def main_chapter(engine_name=None, ocr_mode='full', vertex_format='points'):
+    """python text_detector.py --chapter <credentials_path> [model_path]  (JSON request qua STDIN)"""
+    credentials_path = sys.argv[2] if len(sys.argv) > 2 else None
+    model_path = sys.argv[3] if len(sys.argv) > 3 else None
+    if not credentials_path:
+        print(json.dumps({"error": "Usage: python text_detector.py --chapter <credentials_path> [model_path] < request.json"}))
+        sys.exit(1)
+
+    try:
+        request_data = json.loads(sys.stdin.read() or '{}')
+        compact = (request_data.get('vertexFormat') or vertex_format) == 'delta'
+
+        if request_data.get('stream'):
+            # NDJSON: mỗi trang một dòng {"type": "page", ...} ngay khi xong, cuối cùng một dòng "summary"
+            def emit(page_result):
+                if compact:
+                    encode_result_vertices(page_result.get('data'))
+                print(json.dumps({"type": "page", **page_result}, ensure_ascii=False), flush=True)
+
+            summary = asyncio.run(detect_text_in_chapter_stream(
+                request_data.get('pages', []),
+                credentials_path,
+                emit,
+                model_path,
+                concurrency=request_data.get('concurrency', 8),
+                granularity=request_data.get('granularity', 'page'),
+                engine_name=request_data.get('engine') or engine_name,
+                ocr_mode=request_data.get('ocrMode') or ocr_mode,
+                batch_size=request_data.get('batchSize', 8)
+            ))
+            print(json.dumps({"type": "summary", "ocrStats": summary}, ensure_ascii=False), flush=True)
+            sys.exit(0)
+
+        result = detect_text_in_chapter(
+            request_data.get('pages', []),
+            credentials_path,
+            model_path,
+            batch_size=request_data.get('batchSize', 8),
+            concurrency=request_data.get('concurrency', 4),
+            granularity=request_data.get('granularity', 'page'),
+            engine_name=request_data.get('engine') or engine_name,
+            ocr_mode=request_data.get('ocrMode') or ocr_mode
+        )
+        if compact:
+            for page in result.get('data', []):
+                encode_result_vertices(page.get('data'))
+        print(json.dumps(result, ensure_ascii=False))
+        sys.exit(0)
+    except Exception as e:
+        error_details = traceback.format_exc()
+        print(f"[PY][ERROR] Chapter text detection failed: {str(e)}", file=sys.stderr)
+        print(json.dumps({"error": "Script Python xử lý chapter thất bại", "details": error_details}))
+        sys.exit(2)
+
+
 # --- HÀM MAIN (ĐÃ CẬP NHẬT) ---
 def main():
     sys.stdout.reconfigure(encoding='utf-8')
+    engine_name = pop_option(sys.argv, '--engine')
+    ocr_mode = pop_option(sys.argv, '--ocr-mode') or 'full'
+    vertex_format = pop_option(sys.argv, '--vertex-format') or 'points'
+    bubbles_json = pop_option(sys.argv, '--bubbles')
+    if len(sys.argv) > 1 and sys.argv[1] == '--chapter':
+        return main_chapter(engine_name, ocr_mode, vertex_format)
+
     print(f"[PY] Text detector script started with {len(sys.argv)} arguments", file=sys.stderr)
     
     if len(sys.argv) < 3:
         print("[PY][ERROR] Thiếu đường dẫn ảnh hoặc credentials", file=sys.stderr)
-        print(json.dumps({"error": "Usage: python text_detector.py <image_path> <credentials_path> [model_path] [panel_json_string]"}))
+        print(json.dumps({"error": "Usage: python text_detector.py <image_path> <credentials_path> [model_path] [panel_json_string] [--engine vision|tesseract] [--ocr-mode full|regions] [--bubbles polygons_json] [--vertex-format points|delta]"}))
         sys.exit(1)
 
     image_path = sys.argv[1]
@@ -379,13 +560,20 @@ def main():
     
     try:
         image = read_image_bgr(image_path)
+        # Polygon bong bóng (tọa độ trang) cho --ocr-mode regions, cùng dạng "bubbles" của chế độ chapter
+        bubble_polygons = json.loads(bubbles_json) if bubbles_json else None
         
         result = detect_text_in_comic(
             image, 
             credentials_path, 
             model_path, 
-            panel_json_string # <-- Truyền vào
+            panel_json_string, # <-- Truyền vào
+            engine_name,
+            ocr_mode,
+            bubble_polygons
         )
+        if vertex_format == 'delta':
+            encode_result_vertices(result)
         
         print(json.dumps(result, ensure_ascii=False, indent=2))
         sys.exit(0)
@@ -0,0 +1,275 @@
+"""
+Dựng video cả chapter trong MỘT lần encode, thay cho createScene (mỗi panel một lần ffmpeg) + createFinalMovie
+(mỗi scene một lần ffmpeg ghép audio + concat) của videoService.js: không còn file scene / chunk trung gian.
+
+Mỗi panel là một đoạn của timeline, frame được sinh lần lượt và đi thẳng vào encoder (video_writer.py):
+  - "kenburns": zoom / pan / parallax từ ảnh panel (ken_burns.py)
+  - "clip" (hoặc "svd"): clip đã render (vd output của panel_animator.py), phát xuôi rồi ngược (boomerang)
+    cho đủ thời lượng như createScene; thiếu videoPath thì dùng kenburns
+  - "still": ảnh tĩnh
+Chuyển cảnh giữa hai panel được tính bằng NumPy trên các frame chồng nhau: "crossfade", "fade" (qua màn
+đen) hoặc "cut". Audio của panel ("audioPath") được cắt theo thời lượng panel, đặt đúng vị trí và trộn
+ngay trong lần encode đó (cần backend ffmpeg).
+
+Request (JSON):
+{
+  "output": "/path/chapter.mp4",                       # hoặc "outputDir" + "fileName" (hoặc --output)
+  "width": 1280, "height": 720, "fps": 25,
+  "video": {"codec": "libx264", "crf": 20, "preset": "veryfast"},
+  "transition": {"type": "crossfade", "duration": 0.5}, # mặc định giữa các panel
+  "fadeIn": 0.5, "fadeOut": 0.5,                       # mờ dần từ / về màn đen ở đầu / cuối video
+  "panels": [
+    {"engine": "kenburns", "duration": 3.0, "imageB64": "..." | "imagePath": "...",
+     "motion": "auto", "zoom": 1.15, "focus": "auto", "bubbles": [...], "textBlocks": [...],
+     "videoPath": "...", "audioPath": "...", "transition": {...}}   # transition: sang panel kế tiếp
+  ]
+}
+
+Usage:
+    python timeline_renderer.py request.json [--output PATH]
+Output (stdout): {"success", "path", "size", "duration", "frames", "panels", "timings"}
+"""
+import os
+import sys
+import json
+import time
+import base64
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+import ken_burns
+from video_writer import VideoWriter, pick_encoder
+
+DEFAULT_WIDTH = 1280
+DEFAULT_HEIGHT = 720
+DEFAULT_FPS = 25
+DEFAULT_DURATION = 3.0
+DEFAULT_TRANSITION = {"type": "crossfade", "duration": 0.5}
+TRANSITIONS = ('crossfade', 'fade', 'cut')
+
+
+def load_image(panel: Dict[str, Any]) -> Optional[np.ndarray]:
+    """Ảnh RGB của panel từ imageB64 hoặc imagePath (None nếu không có / lỗi)"""
+    if panel.get('imageB64'):
+        data = panel['imageB64']
+        if ',' in data[:100]:
+            data = data.split(',', 1)[1]
+        image = cv2.imdecode(np.frombuffer(base64.b64decode(data), np.uint8), cv2.IMREAD_COLOR)
+    elif panel.get('imagePath') and os.path.exists(panel['imagePath']):
+        image = cv2.imread(panel['imagePath'], cv2.IMREAD_COLOR)
+    else:
+        return None
+    return None if image is None else cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+def fit_frame(image: np.ndarray, out_size: Tuple[int, int]) -> np.ndarray:
+    """Thu / phóng giữ tỷ lệ vào khung, phần thừa là viền đen (như scale + pad của createScene)"""
+    out_w, out_h = out_size
+    h, w = image.shape[:2]
+    scale = min(out_w / w, out_h / h)
+    new_w, new_h = max(1, int(round(w * scale))), max(1, int(round(h * scale)))
+    resized = cv2.resize(image, (new_w, new_h),
+                         interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LANCZOS4)
+    frame = np.zeros((out_h, out_w, 3), dtype=np.uint8)
+    x, y = (out_w - new_w) // 2, (out_h - new_h) // 2
+    frame[y:y + new_h, x:x + new_w] = resized[..., :3]
+    return frame
+
+
+def still_frames(image: np.ndarray, out_size: Tuple[int, int], count: int) -> Iterator[np.ndarray]:
+    frame = fit_frame(image, out_size)
+    for _ in range(count):
+        yield frame
+
+
+def clip_frames(path: str, out_size: Tuple[int, int], count: int, fps: float) -> Iterator[np.ndarray]:
+    """Clip đã render: đọc hết frame (clip ngắn), phát xuôi rồi ngược lặp lại, đổi về fps của timeline"""
+    capture = cv2.VideoCapture(path)
+    source_fps = capture.get(cv2.CAP_PROP_FPS) or fps
+    frames = []
+    while True:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        frames.append(fit_frame(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), out_size))
+    capture.release()
+    if not frames:
+        raise RuntimeError(f"Không đọc được clip: {path}")
+    sequence = frames + frames[-2:0:-1]
+    for k in range(count):
+        yield sequence[int(k * source_fps / fps) % len(sequence)]
+
+
+def kenburns_frames(image: np.ndarray, panel: Dict[str, Any], out_size: Tuple[int, int],
+                    count: int) -> Iterator[np.ndarray]:
+    params = {"motion": panel.get('motion', 'auto'), "zoom": panel.get('zoom'), "focus": panel.get('focus', 'auto'),
+              "focusBoxes": ken_burns.panel_focus_boxes(panel)}
+    motion = ken_burns.prepare_motion(image, params, out_size, count)
+    yield from ken_burns.render_frames(motion["image"], motion["plan"], out_size, motion["alpha"])
+
+
+def panel_engine(panel: Dict[str, Any]) -> str:
+    engine = panel.get('engine', 'kenburns')
+    if engine in ('clip', 'svd'):
+        if panel.get('videoPath') and os.path.exists(panel['videoPath']):
+            return 'clip'
+        sys.stderr.write(f"[PY][WARNING] Panel {panel.get('panelId')}: không có videoPath, dùng kenburns\n")
+        return 'kenburns'
+    return engine if engine in ('kenburns', 'still') else 'kenburns'
+
+
+def segment_frames(segment: Dict[str, Any], out_size: Tuple[int, int], fps: float) -> Iterator[np.ndarray]:
+    """Frame của một đoạn (ảnh chỉ được decode khi tới lượt đoạn đó)"""
+    panel, count = segment["panel"], segment["frames"]
+    if segment["engine"] == 'clip':
+        return clip_frames(panel['videoPath'], out_size, count, fps)
+    image = load_image(panel)
+    if image is None:
+        raise RuntimeError(f"Panel {panel.get('panelId')}: không có ảnh (imageB64 / imagePath)")
+    if segment["engine"] == 'still':
+        return still_frames(image, out_size, count)
+    return kenburns_frames(image, panel, out_size, count)
+
+
+def plan_timeline(panels: List[Dict[str, Any]], fps: float,
+                  default_transition: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Các đoạn của timeline: {"panel", "engine", "frames", "start" (frame), "overlap" (số frame chồng với
+    đoạn sau), "transition"}. Chuyển cảnh không dài quá nửa đoạn ngắn hơn ở hai bên.
+    """
+    segments = []
+    for panel in panels:
+        duration = float(panel.get('duration') or DEFAULT_DURATION)
+        segments.append({"panel": panel, "engine": panel_engine(panel),
+                         "frames": max(1, int(round(duration * fps))), "overlap": 0, "transition": 'cut'})
+    start = 0
+    for i, segment in enumerate(segments):
+        segment["start"] = start
+        if i + 1 < len(segments):
+            transition = {**default_transition, **(segment["panel"].get('transition') or {})}
+            kind = transition.get('type', 'crossfade')
+            if kind not in TRANSITIONS:
+                kind = 'crossfade'
+            limit = min(segment["frames"], segments[i + 1]["frames"]) // 2
+            overlap = 0 if kind == 'cut' else min(limit, int(round(float(transition.get('duration', 0)) * fps)))
+            segment["overlap"], segment["transition"] = overlap, kind if overlap else 'cut'
+        start += segment["frames"] - segment["overlap"]
+    return segments
+
+
+def _weight(w: float) -> int:
+    return int(round(min(max(w, 0.0), 1.0) * 256))
+
+
+def mix(a: np.ndarray, b: np.ndarray, w: float) -> np.ndarray:
+    """a * (1 - w) + b * w, số nguyên 16 bit"""
+    q = _weight(w)
+    return ((a.astype(np.uint16) * (256 - q) + b.astype(np.uint16) * q) >> 8).astype(np.uint8)
+
+
+def dim(frame: np.ndarray, w: float) -> np.ndarray:
+    """frame * w (w = 0: màn đen)"""
+    q = _weight(w)
+    return frame if q >= 256 else ((frame.astype(np.uint16) * q) >> 8).astype(np.uint8)
+
+
+def transition_frame(before: np.ndarray, after: np.ndarray, w: float, kind: str) -> np.ndarray:
+    if kind == 'fade':
+        return dim(before, 1 - 2 * w) if w < 0.5 else dim(after, 2 * w - 1)
+    return mix(before, after, w)
+
+
+def audio_tracks(segments: List[Dict[str, Any]], fps: float) -> List[Dict[str, Any]]:
+    tracks = []
+    for segment in segments:
+        path = segment["panel"].get('audioPath')
+        if not path:
+            continue
+        if not os.path.exists(path):
+            sys.stderr.write(f"[PY][WARNING] Không thấy audio: {path}\n")
+            continue
+        tracks.append({"path": path, "start": segment["start"] / fps, "duration": segment["frames"] / fps})
+    if tracks:
+        try:
+            pick_encoder('ffmpeg')
+        except RuntimeError:
+            sys.stderr.write("[PY][WARNING] Không có ffmpeg: video sẽ không có audio\n")
+            return []
+    return tracks
+
+
+def render_timeline(request: Dict[str, Any], output_path: str) -> Dict[str, Any]:
+    fps = float(request.get('fps') or DEFAULT_FPS)
+    out_size = (int(request.get('width') or DEFAULT_WIDTH), int(request.get('height') or DEFAULT_HEIGHT))
+    panels = request.get('panels') or []
+    if not panels:
+        raise ValueError("Timeline không có panel nào")
+    segments = plan_timeline(panels, fps, {**DEFAULT_TRANSITION, **(request.get('transition') or {})})
+    total = segments[-1]["start"] + segments[-1]["frames"]
+    fade_in = int(round(float(request.get('fadeIn') or 0) * fps))
+    fade_out = int(round(float(request.get('fadeOut') or 0) * fps))
+    video = request.get('video') or {}
+
+    written = 0
+    with VideoWriter(output_path, fps, codec=video.get('codec'), crf=video.get('crf'), preset=video.get('preset'),
+                     audio=audio_tracks(segments, fps)) as writer:
+        carry: List[np.ndarray] = []
+        carry_kind = 'cut'
+        for segment in segments:
+            sys.stderr.write(f"[PY] Panel {segment['panel'].get('panelId')} [{segment['engine']}] "
+                             f"{segment['frames'] / fps:.2f}s\n")
+            head, tail_start = len(carry), segment["frames"] - segment["overlap"]
+            tail = []
+            for k, frame in enumerate(segment_frames(segment, out_size, fps)):
+                if k >= tail_start:
+                    # Phần cuối chồng với đoạn sau: giữ lại để trộn khi đoạn sau bắt đầu
+                    tail.append(frame)
+                    continue
+                if k < head:
+                    frame = transition_frame(carry[k], frame, (k + 1) / (head + 1), carry_kind)
+                if written < fade_in:
+                    frame = dim(frame, (written + 1) / (fade_in + 1))
+                if written >= total - fade_out:
+                    frame = dim(frame, (total - written) / (fade_out + 1))
+                writer.write(frame)
+                written += 1
+            carry, carry_kind = tail, segment["transition"]
+    info = dict(writer.info)
+    info["panels"] = [{"panelId": s["panel"].get('panelId'), "engine": s["engine"], "start": round(s["start"] / fps, 3),
+                       "duration": round(s["frames"] / fps, 3)} for s in segments]
+    return info
+
+
+def output_target(request: Dict[str, Any], cli_output: Optional[str]) -> str:
+    if cli_output:
+        return cli_output
+    if request.get('output'):
+        return request['output']
+    directory = request.get('outputDir') or os.getcwd()
+    return os.path.join(directory, request.get('fileName') or f"chapter_{int(time.time())}.mp4")
+
+
+def main():
+    sys.stdout.reconfigure(encoding='utf-8')
+    if len(sys.argv) < 2 or sys.argv[1].startswith('--'):
+        print(json.dumps({"error": "Thiếu đường dẫn file input"})); sys.exit(1)
+    cli_output = sys.argv[sys.argv.index('--output') + 1] if '--output' in sys.argv[:-1] else None
+
+    started = time.time()
+    try:
+        with open(sys.argv[1], 'r', encoding='utf-8') as f:
+            request = json.load(f)
+        output_path = output_target(request, cli_output)
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        info = render_timeline(request, output_path)
+        info["timings"] = {"totalMs": round((time.time() - started) * 1000)}
+        print(json.dumps({"success": True, **info}, ensure_ascii=False))
+    except Exception as e:
+        sys.stderr.write(f"[PY][ERROR] {str(e)}\n")
+        print(json.dumps({"error": str(e)})); sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Ghi frame thẳng vào encoder video (không qua file tạm / base64) cho panel_animator.py.
+
+Hai backend, cùng một giao diện `VideoWriter`:
+  - ffmpeg: tiến trình `ffmpeg` nhận frame RGB thô qua stdin (rawvideo) và encode thẳng ra file
+  - pyav:   thư viện PyAV (`pip install av`), encode trong process
+Mặc định (VIDEO_ENCODER=auto) dùng ffmpeg nếu có trên PATH, không thì PyAV.
+
+Frame là ảnh PIL hoặc mảng numpy HxWx3 uint8 (RGB). Kích thước lấy theo frame đầu tiên (cắt về số chẵn
+cho yuv420p). `close()` trả về {"path", "size", "duration", "frames", "fps", "codec"}.
+
+`audio` (chỉ backend ffmpeg): [{"path", "start", "duration"}] - mỗi file audio được cắt còn `duration` giây,
+đặt ở giây `start` của video và trộn thành một track AAC ngay trong lần encode đó.
+
+Biến môi trường:
+    VIDEO_ENCODER   auto | ffmpeg | pyav (mặc định auto)
+    FFMPEG_BIN      Đường dẫn ffmpeg (mặc định "ffmpeg")
+    VIDEO_CODEC     Codec (mặc định libx264)
+    VIDEO_CRF       CRF (mặc định 20, càng nhỏ càng nét)
+    VIDEO_PRESET    Preset của x264 / x265 (mặc định veryfast)
+    VIDEO_PIX_FMT   Pixel format output (mặc định yuv420p)
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+from fractions import Fraction
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+VIDEO_ENCODER = os.environ.get('VIDEO_ENCODER', 'auto')
+FFMPEG_BIN = os.environ.get('FFMPEG_BIN', 'ffmpeg')
+VIDEO_CODEC = os.environ.get('VIDEO_CODEC', 'libx264')
+VIDEO_CRF = int(os.environ.get('VIDEO_CRF', '20'))
+VIDEO_PRESET = os.environ.get('VIDEO_PRESET', 'veryfast')
+VIDEO_PIX_FMT = os.environ.get('VIDEO_PIX_FMT', 'yuv420p')
+
+
+def pick_encoder(encoder: str = VIDEO_ENCODER) -> str:
+    """Backend sẽ dùng ('ffmpeg' / 'pyav'); RuntimeError nếu không có backend nào"""
+    if encoder in ('auto', 'ffmpeg') and shutil.which(FFMPEG_BIN):
+        return 'ffmpeg'
+    if encoder in ('auto', 'pyav'):
+        try:
+            import av  # noqa: F401
+            return 'pyav'
+        except ImportError:
+            pass
+    raise RuntimeError(f"Không có encoder video '{encoder}': cần ffmpeg trên PATH (FFMPEG_BIN) hoặc pip install av")
+
+
+def audio_filter(audio: List[Dict[str, Any]], first_input: int = 1) -> str:
+    """filter_complex trộn các track audio (input thứ first_input trở đi) thành [aout]"""
+    chains, labels = [], []
+    for i, track in enumerate(audio):
+        steps = []
+        if track.get('duration'):
+            steps.append(f"atrim=duration={float(track['duration']):.3f}")
+        steps.append(f"adelay=delays={int(round(float(track.get('start', 0)) * 1000))}:all=1")
+        chains.append(f"[{first_input + i}:a]{','.join(steps)}[a{i}]")
+        labels.append(f"[a{i}]")
+    # Không apad + -shortest: audio vô hạn làm hàng đợi của ffmpeg đầy khi frame video tới chậm.
+    # Track đã được cắt theo `duration` nên audio không dài hơn video; phần cuối thiếu audio là im lặng
+    chains.append(f"{''.join(labels)}amix=inputs={len(audio)}:normalize=0[aout]")
+    return ';'.join(chains)
+
+
+class _FfmpegBackend:
+    def __init__(self, path, width, height, fps, codec, crf, preset, pix_fmt, audio=None):
+        command = [FFMPEG_BIN, '-y', '-loglevel', 'error',
+                   '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{width}x{height}', '-r', str(fps), '-i', '-']
+        if audio:
+            for track in audio:
+                command += ['-i', track['path']]
+            command += ['-filter_complex', audio_filter(audio), '-map', '0:v', '-map', '[aout]',
+                        '-c:a', 'aac', '-b:a', '160k']
+        else:
+            command += ['-an']
+        command += ['-c:v', codec, '-pix_fmt', pix_fmt]
+        if crf is not None:
+            command += ['-crf', str(crf)]
+        if preset and codec in ('libx264', 'libx265'):
+            command += ['-preset', preset]
+        if path.endswith(('.mp4', '.mov')):
+            command += ['-movflags', '+faststart']
+        # stderr ra file tạm: pipe stderr không được đọc trong lúc ghi có thể làm ffmpeg bị nghẽn
+        self.stderr = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(command + [path], stdin=subprocess.PIPE, stderr=self.stderr)
+        # (code, stderr) sau khi ffmpeg đã kết thúc: close() gọi lại chỉ trả về / báo lại kết quả đó
+        self.result = None
+
+    def write(self, frame: np.ndarray):
+        if self.result is not None:
+            raise RuntimeError(f"ffmpeg đã dừng ({self.result[0]}): {self.result[1]}")
+        try:
+            self.process.stdin.write(frame.tobytes())
+        except BrokenPipeError:
+            # ffmpeg thoát giữa chừng (lỗi encode, hết dung lượng...): không nhận thêm frame
+            code, message = self._finish()
+            raise RuntimeError(f"ffmpeg dừng khi đang nhận frame ({code}): {message}")
+
+    def _finish(self):
+        if self.result is None:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+            code = self.process.wait()
+            self.stderr.seek(0)
+            message = self.stderr.read().decode('utf-8', 'replace').strip()[-500:]
+            self.stderr.close()
+            self.result = (code, message)
+        return self.result
+
+    def close(self):
+        code, message = self._finish()
+        if code != 0:
+            raise RuntimeError(f"ffmpeg lỗi ({code}): {message}")
+
+    def abort(self):
+        if self.result is None:
+            self.process.kill()
+            self.process.wait()
+            self.stderr.close()
+            self.result = (self.process.returncode, 'aborted')
+
+
+class _PyAvBackend:
+    def __init__(self, path, width, height, fps, codec, crf, preset, pix_fmt, audio=None):
+        if audio:
+            raise RuntimeError("Ghép audio cần backend ffmpeg (VIDEO_ENCODER=ffmpeg)")
+        import av
+        options = {}
+        if crf is not None:
+            options['crf'] = str(crf)
+        if preset and codec in ('libx264', 'libx265'):
+            options['preset'] = preset
+        self.av = av
+        self.container = av.open(path, mode='w')
+        self.stream = self.container.add_stream(codec, rate=Fraction(fps).limit_denominator(1001), options=options)
+        self.stream.width, self.stream.height, self.stream.pix_fmt = width, height, pix_fmt
+
+    def write(self, frame: np.ndarray):
+        video_frame = self.av.VideoFrame.from_ndarray(frame, format='rgb24')
+        self.container.mux(self.stream.encode(video_frame))
+
+    def close(self):
+        self.container.mux(self.stream.encode())
+        self.container.close()
+
+    def abort(self):
+        self.container.close()
+
+
+class VideoWriter:
+    """
+    with VideoWriter(path, fps) as writer:
+        for frame in frames: writer.write(frame)
+    info = writer.info
+    Lỗi trong khối with thì file dở dang bị xóa.
+    """
+
+    def __init__(self, path: str, fps: float, codec: Optional[str] = None, crf: Optional[int] = None,
+                 preset: Optional[str] = None, pix_fmt: Optional[str] = None, encoder: str = VIDEO_ENCODER,
+                 audio: Optional[List[Dict[str, Any]]] = None):
+        self.path = path
+        self.fps = fps
+        self.codec = codec or VIDEO_CODEC
+        self.crf = VIDEO_CRF if crf is None else crf
+        self.preset = preset or VIDEO_PRESET
+        self.pix_fmt = pix_fmt or VIDEO_PIX_FMT
+        self.encoder = pick_encoder('ffmpeg' if audio else encoder)
+        self.audio = audio or []
+        self.backend = None
+        self.size = None
+        self.frames = 0
+        self.info: Optional[Dict[str, Any]] = None
+
+    def write(self, frame):
+        frame = np.asarray(frame.convert('RGB') if hasattr(frame, 'convert') else frame)
+        if frame.dtype != np.uint8:
+            # Frame float 0..1 (output_type="np" của diffusers)
+            frame = (np.clip(frame, 0, 1) * 255).round().astype(np.uint8)
+        if self.backend is None:
+            h, w = frame.shape[:2]
+            self.size = (w - w % 2, h - h % 2)
+            backend = _FfmpegBackend if self.encoder == 'ffmpeg' else _PyAvBackend
+            self.backend = backend(self.path, self.size[0], self.size[1], self.fps, self.codec, self.crf,
+                                   self.preset, self.pix_fmt, self.audio)
+        w, h = self.size
+        self.backend.write(np.ascontiguousarray(frame[:h, :w, :3]))
+        self.frames += 1
+
+    def close(self) -> Dict[str, Any]:
+        if self.info is not None:
+            return self.info
+        if self.backend is None:
+            raise RuntimeError("Không có frame nào để ghi video")
+        self.backend.close()
+        self.info = {"path": self.path, "size": os.path.getsize(self.path),
+                     "duration": round(self.frames / self.fps, 3), "frames": self.frames, "fps": self.fps,
+                     "codec": self.codec}
+        return self.info
+
+    def abort(self):
+        if self.backend is not None and self.info is None:
+            self.backend.abort()
+        self._remove_output()
+
+    def _remove_output(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+            return False
+        try:
+            self.close()
+        except Exception:
+            self._remove_output()
+            raise
+        return False
+
+
+def write_video(frames: Iterable, path: str, fps: float, **settings) -> Dict[str, Any]:
+    """Encode cả dãy frame ra `path`. Trả về thông tin file (xem VideoWriter.close)"""
+    with VideoWriter(path, fps, **settings) as writer:
+        for frame in frames:
+            writer.write(frame)
+    return writer.info
@@ -0,0 +1,84 @@
+/**
+ * Vision bridge: process Node sống lâu, được text_detector.py (ocr_client.py) mở một lần
+ * và dùng lại cho nhiều trang. Client Vision + kết nối TLS chỉ tạo một lần.
+ *
+ * Giao thức NDJSON qua stdin/stdout (mỗi dòng một JSON):
+ *   -> {"id": 1, "image": "<base64 JPEG>"}
+ *   <- {"id": 1, "success": true, "textBlocks": [...], "hasText": true}
+ * Batch (một lần batchAnnotateImages, tối đa 16 ảnh):
+ *   -> {"id": 2, "images": ["<base64>", ...]}
+ *   <- {"id": 2, "success": true, "responses": [{"success": true, "textBlocks": [...]}, ...]}
+ * Lỗi bị giới hạn quota trả về kèm "code" (8 = RESOURCE_EXHAUSTED) để phía Python retry.
+ * Khi sẵn sàng bridge in ra {"ready": true}.
+ *
+ * Usage: node vision_bridge.js <credentials_path>
+ */
+const readline = require('readline');
+const { ImageAnnotatorClient } = require('@google-cloud/vision');
+const { detectTextInBuffer, detectTextInBuffers } = require('./vision_text_detector');
+
+function writeLine(obj) {
+    process.stdout.write(JSON.stringify(obj) + '\n');
+}
+
+async function handleRequest(client, request) {
+    try {
+        if (Array.isArray(request.images)) {
+            const buffers = request.images.map(image => Buffer.from(image, 'base64'));
+            const responses = await detectTextInBuffers(client, buffers);
+            writeLine({ id: request.id, success: true, responses });
+            return;
+        }
+        const imageBuffer = Buffer.from(request.image, 'base64');
+        const result = await detectTextInBuffer(client, imageBuffer);
+        writeLine({ id: request.id, ...result });
+    } catch (error) {
+        console.error(`[NODE][BRIDGE][ERROR] Request ${request.id}:`, error.message);
+        writeLine({ id: request.id, success: false, error: error.message, code: error.code, textBlocks: [], hasText: false });
+    }
+}
+
+function main() {
+    const args = process.argv.slice(2);
+    if (args.length < 1) {
+        writeLine({ ready: false, error: 'Usage: node vision_bridge.js <credentials_path>' });
+        process.exit(1);
+    }
+
+    const client = new ImageAnnotatorClient({ keyFilename: args[0] });
+    const rl = readline.createInterface({ input: process.stdin, crlfDelay: Infinity });
+    let pending = 0;
+    let closed = false;
+
+    const shutdown = () => {
+        Promise.resolve(client.close()).finally(() => process.exit(0));
+    };
+
+    rl.on('line', (line) => {
+        if (!line.trim()) return;
+        let request;
+        try {
+            request = JSON.parse(line);
+        } catch (e) {
+            writeLine({ id: null, success: false, error: `Bad request: ${e.message}` });
+            return;
+        }
+        // Không await: nhiều request có thể chạy song song trên cùng một client
+        pending += 1;
+        handleRequest(client, request).finally(() => {
+            pending -= 1;
+            if (closed && pending === 0) shutdown();
+        });
+    });
+
+    // Python đóng stdin => thoát sau khi các request đang chạy hoàn tất
+    rl.on('close', () => {
+        closed = true;
+        if (pending === 0) shutdown();
+    });
+
+    console.error('[NODE][BRIDGE] Vision bridge ready');
+    writeLine({ ready: true });
+}
+
+if (require.main === module) { main(); }
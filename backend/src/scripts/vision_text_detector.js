@@ -1,63 +1,97 @@
 const fs = require('fs');
 const { ImageAnnotatorClient } = require('@google-cloud/vision');
 
-async function detectTextInImage(imagePath, credentialsPath) {
-    try {
-        const client = new ImageAnnotatorClient({ keyFilename: credentialsPath });
-        console.error(`[NODE] Reading image from: ${imagePath}`);
-        const imageBuffer = fs.readFileSync(imagePath);
-        
-        const request = {
-            image: { content: imageBuffer },
-            features: [{ type: 'DOCUMENT_TEXT_DETECTION' }], // Không giới hạn kết quả
-        };
+// --- LOGIC GOM CHỮ THÔNG MINH ---
+// Dùng chung cho CLI (một ảnh / một process) và vision_bridge.js (process sống lâu)
+function groupTextBlocks(fullTextAnnotation) {
+    const textBlocks = [];
 
-        console.error(`[NODE] Calling Vision API...`);
-        const [result] = await client.annotateImage(request);
-        const fullTextAnnotation = result.fullTextAnnotation || {};
-        
-        // --- LOGIC GOM CHỮ THÔNG MINH ---
-        const textBlocks = [];
-        
-        if (fullTextAnnotation.pages) {
-            fullTextAnnotation.pages.forEach(page => {
-                page.blocks.forEach(block => {
-                    let blockText = '';
-                    block.paragraphs.forEach(para => {
-                        para.words.forEach(word => {
-                            word.symbols.forEach(symbol => {
-                                blockText += symbol.text;
-                                // Xử lý dấu cách và xuống dòng
-                                if (symbol.property && symbol.property.detectedBreak) {
-                                    const breakType = symbol.property.detectedBreak.type;
-                                    if (['SPACE', 'SURE_SPACE', 'EOL_SURE_SPACE'].includes(breakType)) {
-                                        blockText += ' ';
-                                    } else if (breakType === 'LINE_BREAK') {
-                                        blockText += '\n';
-                                    }
+    if (fullTextAnnotation && fullTextAnnotation.pages) {
+        fullTextAnnotation.pages.forEach(page => {
+            page.blocks.forEach(block => {
+                let blockText = '';
+                block.paragraphs.forEach(para => {
+                    para.words.forEach(word => {
+                        word.symbols.forEach(symbol => {
+                            blockText += symbol.text;
+                            // Xử lý dấu cách và xuống dòng
+                            if (symbol.property && symbol.property.detectedBreak) {
+                                const breakType = symbol.property.detectedBreak.type;
+                                if (['SPACE', 'SURE_SPACE', 'EOL_SURE_SPACE'].includes(breakType)) {
+                                    blockText += ' ';
+                                } else if (breakType === 'LINE_BREAK') {
+                                    blockText += '\n';
                                 }
-                            });
+                            }
                         });
                     });
-                    
-                    if (blockText.trim().length > 0) {
-                        textBlocks.push({
-                            text: blockText.trim(),
-                            vertices: block.boundingBox.vertices // Tọa độ 4 góc của cụm chữ
-                        });
-                    }
                 });
+
+                if (blockText.trim().length > 0) {
+                    textBlocks.push({
+                        text: blockText.trim(),
+                        vertices: block.boundingBox.vertices // Tọa độ 4 góc của cụm chữ
+                    });
+                }
             });
+        });
+    }
+
+    return textBlocks;
+}
+
+/**
+ * Gọi Vision API với ảnh nằm sẵn trong bộ nhớ (Buffer), dùng lại client có sẵn
+ */
+async function detectTextInBuffer(client, imageBuffer) {
+    const request = {
+        image: { content: imageBuffer },
+        features: [{ type: 'DOCUMENT_TEXT_DETECTION' }], // Không giới hạn kết quả
+    };
+
+    const [result] = await client.annotateImage(request);
+    const textBlocks = groupTextBlocks(result.fullTextAnnotation || {});
+
+    return {
+        success: true,
+        textBlocks: textBlocks, // Trả về danh sách cụm chữ đã gom
+        hasText: textBlocks.length > 0
+    };
+}
+
+/**
+ * Gọi batchAnnotateImages cho nhiều ảnh trong MỘT round trip.
+ * Kết quả trả về theo đúng thứ tự ảnh đầu vào; lỗi của từng ảnh nằm trong phần tử tương ứng.
+ */
+async function detectTextInBuffers(client, imageBuffers) {
+    const [batch] = await client.batchAnnotateImages({
+        requests: imageBuffers.map(buffer => ({
+            image: { content: buffer },
+            features: [{ type: 'DOCUMENT_TEXT_DETECTION' }],
+        })),
+    });
+
+    return batch.responses.map(response => {
+        if (response.error && response.error.message) {
+            return { success: false, error: response.error.message, code: response.error.code, textBlocks: [], hasText: false };
         }
+        const textBlocks = groupTextBlocks(response.fullTextAnnotation || {});
+        return { success: true, textBlocks: textBlocks, hasText: textBlocks.length > 0 };
+    });
+}
+
+async function detectTextInImage(imagePath, credentialsPath) {
+    try {
+        const client = new ImageAnnotatorClient({ keyFilename: credentialsPath });
+        console.error(`[NODE] Reading image from: ${imagePath}`);
+        const imageBuffer = fs.readFileSync(imagePath);
+
+        console.error(`[NODE] Calling Vision API...`);
+        const result = await detectTextInBuffer(client, imageBuffer);
+
+        console.error(`[NODE] Gom thành công ${result.textBlocks.length} cụm chữ.`);
+        return result;
 
-        console.error(`[NODE] Gom thành công ${textBlocks.length} cụm chữ.`);
-        
-        return {
-            success: true,
-            textBlocks: textBlocks, // Trả về danh sách cụm chữ đã gom
-            hasText: textBlocks.length > 0
-        };
-        
     } catch (error) {
         console.error(`[NODE][ERROR] Vision API error:`, error);
         return { success: false, error: error.message, textBlocks: [], hasText: false };
@@ -70,7 +104,7 @@ async function main() {
         process.stdout.write(JSON.stringify({ success: false, error: 'Usage: node ...' }));
         process.exit(1);
     }
-    
+
     try {
         const result = await detectTextInImage(args[0], args[1]);
         process.stdout.write(JSON.stringify(result));
@@ -82,4 +116,4 @@ async function main() {
 }
 
 if (require.main === module) { main(); }
-module.exports = { detectTextInImage };
\ No newline at end of file
+module.exports = { detectTextInImage, detectTextInBuffer, detectTextInBuffers, groupTextBlocks };
@@ -1,4 +1,4 @@
-const { exec } = require('child_process');
+const { exec, spawn } = require('child_process');
 const path = require('path');
 const fs = require('fs');
 const { promisify } = require('util');
@@ -17,9 +17,10 @@ class TextDetectionService {
      * HÀM MỚI: Detect text dùng tọa độ panel có sẵn
      * @param {string} imagePath - Đường dẫn đến file ảnh
      * @param {string | null} panelJson - (MỚI) JSON string của tọa độ
+     * @param {Object} options - { engine: 'vision' | 'tesseract', ocrMode: 'full' | 'regions' }
      * @returns {Promise<Object>} Kết quả text detection
      */
-    async detectTextInComicFromData(imagePath, panelJson = null) {
+    async detectTextInComicFromData(imagePath, panelJson = null, options = {}) {
         try {
             const logPrefix = panelJson ? '[TextDetectionService][FromData]' : '[TextDetectionService]';
             console.log(`${logPrefix} Starting text detection for: ${imagePath}`);
@@ -52,6 +53,13 @@ class TextDetectionService {
                 commandItems.push(escapedJson);
             }
 
+            if (options.engine) {
+                commandItems.push('--engine', options.engine);
+            }
+            if (options.ocrMode) {
+                commandItems.push('--ocr-mode', options.ocrMode);
+            }
+
             const command = commandItems.join(' ');
             console.log(`${logPrefix} Executing command: ${command.slice(0, 250)}...`);
 
@@ -249,32 +257,97 @@ if __name__ == '__main__':
 
     /**
      * Batch detect text trong nhiều images
-     * (Hàm này giữ nguyên - phục vụ route /batch-detect)
+     * Gửi tất cả ảnh cho MỘT process Python (chế độ --chapter): OCR được gom theo batch
+     * (batchAnnotateImages) với giới hạn song song, thay vì mỗi ảnh một process.
      * @param {Array<string>} imagePaths - Danh sách đường dẫn ảnh
+     * @param {Object} options - { batchSize, concurrency, granularity: 'page' | 'panel', engine: 'vision' | 'tesseract', ocrMode: 'full' | 'regions' }
      * @returns {Promise<Array<Object>>} Kết quả cho từng ảnh
      */
-    async batchDetectText(imagePaths) {
-        const results = [];
-        
-        for (const imagePath of imagePaths) {
-            try {
-                // Gọi hàm detectTextInComic (hàm cũ) để tự động detect panel
-                const result = await this.detectTextInComic(imagePath);
-                results.push({
-                    imagePath,
-                    ...result
-                });
-            } catch (error) {
-                results.push({
-                    imagePath,
+    async batchDetectText(imagePaths, options = {}) {
+        const failAll = (message) => imagePaths.map(imagePath => ({
+            imagePath,
+            success: false,
+            error: message,
+            data: null
+        }));
+
+        if (!fs.existsSync(this.credentialsPath)) {
+            return failAll(`Credentials file not found: ${this.credentialsPath}`);
+        }
+
+        const request = {
+            pages: imagePaths.map(imagePath => ({ imagePath })),
+            stream: true,
+            batchSize: options.batchSize || 8,
+            concurrency: options.concurrency || 8,
+            granularity: options.granularity || 'page',
+            engine: options.engine,
+            ocrMode: options.ocrMode
+        };
+
+        return new Promise((resolve, reject) => {
+            const pythonCmd = process.env.PYTHON_CMD || 'python';
+            const py = spawn(pythonCmd, [this.scriptPath, '--chapter', this.credentialsPath]);
+            const results = new Array(imagePaths.length).fill(null);
+            let buffer = '';
+            let stderr = '';
+            let fatalError = null;
+
+            // Python trả về NDJSON: mỗi trang một dòng ngay khi xong, dòng cuối là summary
+            const handleLine = (line) => {
+                if (!line.trim()) return;
+                let message;
+                try {
+                    message = JSON.parse(line);
+                } catch (error) {
+                    console.log(`[TextDetectionService][Batch] Bỏ qua dòng không hợp lệ: ${line}`);
+                    return;
+                }
+                if (message.type === 'page') {
+                    const { type, index, ...pageResult } = message;
+                    results[index] = pageResult;
+                    if (options.onPage) options.onPage(index, pageResult);
+                } else if (message.type === 'summary') {
+                    console.log(`[TextDetectionService][Batch] Done ${imagePaths.length} images`, message.ocrStats);
+                } else if (message.error) {
+                    fatalError = message.error;
+                }
+            };
+
+            // Decode UTF-8 theo stream: ký tự nhiều byte bị cắt giữa hai chunk không bị hỏng
+            py.stdout.setEncoding('utf8');
+            py.stderr.setEncoding('utf8');
+            py.stdout.on('data', (data) => {
+                buffer += data;
+                const lines = buffer.split('\n');
+                buffer = lines.pop();
+                lines.forEach(handleLine);
+            });
+            py.stderr.on('data', (data) => stderr += data);
+
+            // Không spawn được Python (sai PYTHON_CMD...)
+            py.on('error', reject);
+            py.stdin.on('error', (error) => console.log(`[TextDetectionService][Batch] Lỗi ghi stdin: ${error.message}`));
+
+            py.on('close', (code) => {
+                handleLine(buffer);
+                if (stderr) {
+                    console.log(`[TextDetectionService][Batch] Python stderr: ${stderr}`);
+                }
+                if (fatalError) {
+                    return resolve(failAll(fatalError));
+                }
+                resolve(results.map((result, index) => result || {
+                    imagePath: imagePaths[index],
                     success: false,
-                    error: error.message,
+                    error: `Không có kết quả từ Python (exit ${code})`,
                     data: null
-                });
-            }
-        }
-        
-        return results;
+                }));
+            });
+
+            py.stdin.write(JSON.stringify(request));
+            py.stdin.end();
+        });
     }
 }
 